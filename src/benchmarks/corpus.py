@@ -0,0 +1,243 @@
+import gzip
+import logging
+import os
+import sys
+from argparse import ArgumentParser, Namespace
+from base64 import encodebytes
+from pathlib import Path
+from random import Random
+from typing import Iterator, Sequence, Union
+from xml.sax.saxutils import escape
+from zipfile import ZIP_DEFLATED, ZipFile
+
+FORMATS = ("fb2", "fb2.gz", "zip")
+ENCODINGS = ("utf-8", "windows-1251", "koi8-r")
+# words of book names and paragraphs, every one can be encoded with ENCODINGS
+WORDS = (
+    "война мир время море ночь город дом дорога зима лето сад река песня звезда "
+    "тень свет сердце память путь огонь ветер остров last night river garden "
+    "silent winter house road star"
+).split()
+FIRST_NAMES = "Лев Анна Иван Мария Фёдор Ольга Пётр Нина John Mary".split()
+LAST_NAMES = "Толстой Ахматова Бунин Цветаева Достоевский Берггольц Smith Doe".split()
+# books of every author, books of the same author are spread over the corpus
+BOOKS_PER_AUTHOR = 10
+BOOK_TEMPLATE = """<?xml version="1.0" encoding="{encoding}"?>
+<FictionBook xmlns="http://www.gribuser.ru/xml/fictionbook/2.0" \
+xmlns:l="http://www.w3.org/1999/xlink">
+<description>
+<title-info>
+<genre>prose</genre>
+<author><first-name>{first_name}</first-name><last-name>{last_name}</last-name></author>
+<book-title>{name}</book-title>
+<lang>ru</lang>{coverpage}
+</title-info>
+<document-info><program-used>benchmarks.corpus</program-used></document-info>{publish_info}
+</description>
+<body>
+{body}
+</body>{binary}
+</FictionBook>
+"""
+
+
+class BookGenerator:
+    """Random but reproducible FB2 books, the same seed gives the same books"""
+
+    def __init__(
+        self,
+        body_size: int = 16 * 1024,
+        cover_size: int = 0,
+        encodings: Sequence[str] = ("utf-8",),
+        seed: int = 0,
+    ):
+        self.body_size = body_size
+        self.cover_size = cover_size
+        self.encodings = encodings
+        self.seed = seed
+
+    def book(self, number: int, books: int) -> dict:
+        """
+        Fields of the book number of books
+
+        :return {'name': str, 'author_first_name': str, 'author_last_name': str, 'year': int}
+        """
+        random = Random(f"{self.seed}:{number}")
+        author_number = number % max(books // BOOKS_PER_AUTHOR, 1)
+        author = Random(f"{self.seed}:author:{author_number}")
+        return {
+            "name": f"{' '.join(random.choices(WORDS, k=3)).capitalize()} {number}",
+            "author_first_name": author.choice(FIRST_NAMES),
+            "author_last_name": f"{author.choice(LAST_NAMES)}-{author_number}",
+            # some books are published without year
+            "year": random.randint(1850, 2021) if random.random() < 0.9 else None,
+        }
+
+    def encoding(self, number: int) -> str:
+        return self.encodings[number % len(self.encodings)]
+
+    def content(self, number: int, books: int) -> bytes:
+        """FB2 document of the book number of books, in its encoding"""
+        book = self.book(number, books)
+        random = Random(f"{self.seed}:body:{number}")
+        encoding = self.encoding(number)
+        year = book["year"]
+        text = BOOK_TEMPLATE.format(
+            encoding=encoding,
+            first_name=escape(book["author_first_name"]),
+            last_name=escape(book["author_last_name"]),
+            name=escape(book["name"]),
+            coverpage=(
+                '\n<coverpage><image l:href="#cover.jpg"/></coverpage>'
+                if self.cover_size
+                else ""
+            ),
+            publish_info=(
+                f"\n<publish-info><year>{year}</year></publish-info>"
+                if year is not None
+                else ""
+            ),
+            body=self.body(random),
+            binary=self.cover(random),
+        )
+        return text.encode(encoding)
+
+    def body(self, random: Random) -> str:
+        """Paragraphs of random words, about body_size characters"""
+        paragraphs, size = [], 0
+        while size < self.body_size:
+            paragraph = f"<p>{' '.join(random.choices(WORDS, k=12))}.</p>"
+            paragraphs.append(paragraph)
+            size += len(paragraph)
+        return "<section>\n" + "\n".join(paragraphs) + "\n</section>"
+
+    def cover(self, random: Random) -> str:
+        """Base64 image of cover_size random bytes, like the cover of a real book"""
+        if not self.cover_size:
+            return ""
+        data = encodebytes(random.randbytes(self.cover_size)).decode()
+        return f'\n<binary id="cover.jpg" content-type="image/jpeg">{data}</binary>'
+
+
+def write_corpus(
+    dir_path: Union[str, Path],
+    books: int,
+    generator: BookGenerator,
+    formats: Sequence[str] = FORMATS,
+    zip_members: int = 100,
+) -> list[dict]:
+    """
+    Write books into the directory: book number i is written in the format
+    formats[i % len(formats)], zip books are grouped zip_members books per archive
+
+    :return fields of all written books, like find_books returns them
+    """
+    dir_path = Path(dir_path)
+    dir_path.mkdir(parents=True, exist_ok=True)
+    numbers = {extension: [] for extension in formats}
+    for number in range(books):
+        numbers[formats[number % len(formats)]].append(number)
+    for extension, chunk in iterate_files(numbers, zip_members):
+        write_file(dir_path, extension, chunk, books, generator)
+    logging.info(f"Written {books} books into {dir_path}")
+    return [generator.book(number, books) for number in range(books)]
+
+
+def iterate_files(
+    numbers: dict[str, list[int]], zip_members: int
+) -> Iterator[tuple[str, list[int]]]:
+    """Group numbers of books into files: one book per file, zip_members per archive"""
+    for extension, chunk in numbers.items():
+        size = zip_members if extension == "zip" else 1
+        for start in range(0, len(chunk), size):
+            yield extension, chunk[start : start + size]
+
+
+def write_file(
+    dir_path: Path,
+    extension: str,
+    numbers: list[int],
+    books: int,
+    generator: BookGenerator,
+) -> None:
+    """Write books of numbers into one file of the extension"""
+    path = dir_path / f"{numbers[0]:08}.{extension}"
+    if extension == "zip":
+        with ZipFile(path, "w", ZIP_DEFLATED) as zip_obj:
+            for number in numbers:
+                zip_obj.writestr(f"{number:08}.fb2", generator.content(number, books))
+    elif extension == "fb2.gz":
+        path.write_bytes(gzip.compress(generator.content(numbers[0], books)))
+    else:
+        path.write_bytes(generator.content(numbers[0], books))
+
+
+def add_corpus_arguments(parser: ArgumentParser) -> None:
+    """Add args (-n, --formats, --body-size, ...) of the generated corpus to the parser"""
+    parser.add_argument(
+        "-n", dest="books", type=int, default=1000, help="number of books"
+    )
+    parser.add_argument(
+        "--formats",
+        nargs="+",
+        choices=FORMATS,
+        default=list(FORMATS),
+        help="formats of books, used one after another",
+    )
+    parser.add_argument(
+        "--zip-members", type=int, default=100, help="books in one zip-archive"
+    )
+    parser.add_argument(
+        "--body-size", type=int, default=16 * 1024, help="characters of book body"
+    )
+    parser.add_argument(
+        "--cover-size", type=int, default=0, help="bytes of cover image, 0 is no cover"
+    )
+    parser.add_argument(
+        "--encodings",
+        nargs="+",
+        default=["utf-8"],
+        help=f"encodings of books, used one after another, e.g. {' '.join(ENCODINGS)}",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="seed of random books")
+
+
+def corpus_from_args(args: Namespace) -> dict:
+    """Parameters of the corpus given by args, as they are stored with results"""
+    return {
+        "books": args.books,
+        "formats": list(args.formats),
+        "zip_members": args.zip_members,
+        "body_size": args.body_size,
+        "cover_size": args.cover_size,
+        "encodings": list(args.encodings),
+        "seed": args.seed,
+    }
+
+
+def write_corpus_from_args(dir_path: Union[str, Path], args: Namespace) -> list[dict]:
+    """Write the corpus given by args into the directory"""
+    generator = BookGenerator(
+        args.body_size, args.cover_size, args.encodings, args.seed
+    )
+    return write_corpus(dir_path, args.books, generator, args.formats, args.zip_members)
+
+
+def parse_args(_args: Sequence[str]) -> ArgumentParser.__class__:
+    """Create parser with args (-o, -n, --formats, ...) and parse args with the created parser"""
+    parser = ArgumentParser(description="Generate synthetic FB2 books for benchmarks")
+    parser.add_argument(
+        "-o", dest="dir_path", required=True, help="folder to write books into"
+    )
+    add_corpus_arguments(parser)
+    return parser.parse_args(_args)
+
+
+def main():
+    logging.debug(f"Called {sys.argv[0]} with {sys.argv[1:]}")
+    args = parse_args(sys.argv[1:])
+    write_corpus_from_args(os.path.abspath(args.dir_path), args)
+
+
+if __name__ == "__main__":
+    main()
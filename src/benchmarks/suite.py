@@ -0,0 +1,383 @@
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+from argparse import ArgumentParser
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import partial
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter, process_time
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional, Sequence
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session, sessionmaker
+
+from benchmarks.corpus import (
+    add_corpus_arguments,
+    corpus_from_args,
+    write_corpus_from_args,
+)
+from db.models import Base, Book
+from db.services import (
+    create_books_and_authors,
+    delete_book_or_all_db,
+    get_books_from_db,
+)
+from services.fb2_backends import BACKENDS
+from services.fb2_parser import FB2Parser
+from services.file_extraction import get_files_from_dir, gzip_extraction, zip_extraction
+from services.parse_book_from_file import get_books_from_directory
+from services.startup import setup_logging
+
+# times every benchmark is repeated, the best time is kept
+REPEAT = 3
+# books looked up and deleted one by one by DB benchmarks
+LOOKUPS = 200
+# slowdown of the best wall time reported as a regression by --compare
+REGRESSION_THRESHOLD = 0.1
+
+
+class Corpus(NamedTuple):
+    dir_path: str
+    books: list[dict]
+    texts: list[bytes]
+
+
+class Timing(NamedTuple):
+    wall: float
+    cpu: float
+
+
+def timed(func: Callable, *args, **kwargs) -> Timing:
+    """Wall and CPU time of the call, CPU time of pool workers is not counted"""
+    wall, cpu = perf_counter(), process_time()
+    func(*args, **kwargs)
+    return Timing(perf_counter() - wall, process_time() - cpu)
+
+
+def metrics(timings: Iterable[Timing], items: int, size: int = 0) -> dict:
+    """
+    Best of repeated timings with throughput of items and of size bytes
+
+    >>> metrics([Timing(2.0, 1.0), Timing(1.0, 0.5)], items=10)
+    {'wall_s': 1.0, 'cpu_s': 0.5, 'items': 10, 'items_per_s': 10.0}
+    """
+    best = min(timings)
+    result = {
+        "wall_s": round(best.wall, 6),
+        "cpu_s": round(best.cpu, 6),
+        "items": items,
+        "items_per_s": round(items / best.wall, 1),
+    }
+    if size:
+        result["mib_per_s"] = round(size / best.wall / 2 ** 20, 2)
+    return result
+
+
+def read_texts(dir_path: str) -> list[bytes]:
+    """Documents of all books of the directory, like digger reads them"""
+    texts = []
+    for file in get_files_from_dir(dir_path):
+        if file.endswith(".gz"):
+            with gzip_extraction(file) as book:
+                texts.append(book.read())
+        elif file.endswith(".zip"):
+            texts.extend(book.read() for book in zip_extraction(file))
+        else:
+            texts.append(Path(file).read_bytes())
+    return texts
+
+
+def bench_fb2_parser(corpus: Corpus, repeat: int) -> dict[str, dict]:
+    """Parse every document in memory by every backend, header only and whole"""
+    size = sum(map(len, corpus.texts))
+    results = {}
+    for backend in BACKENDS:
+        try:
+            cases = {
+                case: [
+                    timed(parse_all, corpus.texts, backend, case == "header")
+                    for _ in range(repeat)
+                ]
+                for case in ("header", "whole")
+            }
+        except ImportError as err:
+            logging.info(f"Skip backend {backend}: {err}")
+            continue
+        for case, timings in cases.items():
+            results[f"{backend}/{case}"] = metrics(timings, len(corpus.texts), size)
+    return results
+
+
+def parse_all(texts: Sequence[bytes], backend: str, header_only: bool) -> None:
+    for text in texts:
+        FB2Parser(text=text, header_only=header_only, backend=backend).as_dict
+
+
+def bench_file_extraction(corpus: Corpus, repeat: int) -> dict[str, dict]:
+    """Read every book of gz-files and zip-archives"""
+    files = list(get_files_from_dir(corpus.dir_path))
+    results = {}
+    for extension, extract in ((".gz", gzip_extraction), (".zip", zip_extraction)):
+        archives = [file for file in files if file.endswith(extension)]
+        if not archives:
+            continue
+        timings = [timed(read_archives, archives, extract) for _ in range(repeat)]
+        books, size = read_archives(archives, extract)
+        results[extension.strip(".")] = metrics(timings, books, size)
+    return results
+
+
+def read_archives(archives: Sequence[str], extract: Callable) -> (int, int):
+    """
+    Read all books of archives
+
+    :return (number of books, size of books)
+    """
+    books, size = 0, 0
+    for archive in archives:
+        members = extract(archive)
+        for book in [members] if hasattr(members, "read") else members:
+            with book:
+                size += len(book.read())
+            books += 1
+    return books, size
+
+
+def bench_get_books_from_directory(corpus: Corpus, repeat: int) -> dict[str, dict]:
+    """Find books of the whole directory, with the pool of parsers"""
+    size = sum(map(len, corpus.texts))
+    timings = [
+        timed(list, get_books_from_directory(corpus.dir_path)) for _ in range(repeat)
+    ]
+    return {"defusedxml": metrics(timings, len(corpus.books), size)}
+
+
+@contextmanager
+def rolled_back(connection: Connection) -> Iterator[Session]:
+    """Session in a transaction with the schema, nothing is kept after it"""
+    transaction = connection.begin()
+    Base.metadata.create_all(connection)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=connection)()
+    try:
+        yield session
+    finally:
+        session.close()
+        transaction.rollback()
+
+
+def bench_create_books_and_authors(
+    corpus: Corpus, repeat: int, connection: Connection
+) -> dict[str, dict]:
+    """Save the corpus into empty tables, then save it again with update"""
+    timings, updates = [], []
+    for _ in range(repeat):
+        with rolled_back(connection) as session:
+            timings.append(
+                timed(create_books_and_authors, session, corpus.books, False)
+            )
+            updates.append(timed(create_books_and_authors, session, corpus.books, True))
+    return {
+        "create": metrics(timings, len(corpus.books)),
+        "update": metrics(updates, len(corpus.books)),
+    }
+
+
+def bench_get_books_from_db(
+    corpus: Corpus, repeat: int, connection: Connection
+) -> dict[str, dict]:
+    """Look up LOOKUPS books one by one, by all fields like seeker does"""
+    sample = corpus.books[:: max(len(corpus.books) // LOOKUPS, 1)][:LOOKUPS]
+    results = {}
+    for case, primary_key in (("books", False), ("ids", True)):
+        timings = []
+        for _ in range(repeat):
+            with rolled_back(connection) as session:
+                create_books_and_authors(session, corpus.books, False)
+                timings.append(timed(find_all, session, sample, primary_key))
+        results[case] = metrics(timings, len(sample))
+    return results
+
+
+def find_all(session: Session, books: Sequence[dict], primary_key: bool) -> None:
+    for book in books:
+        get_books_from_db(
+            session,
+            book["name"],
+            book["author_first_name"],
+            book["author_last_name"],
+            book["year"],
+            primary_key,
+        )
+
+
+def bench_delete_book_or_all_db(
+    corpus: Corpus, repeat: int, connection: Connection
+) -> dict[str, dict]:
+    """Delete LOOKUPS books one by one like wiper -n does, then flush DB like wiper -a"""
+    by_id, flush = [], []
+    for _ in range(repeat):
+        with rolled_back(connection) as session:
+            create_books_and_authors(session, corpus.books, False)
+            ids = [id_ for id_, in session.query(Book.id).limit(LOOKUPS)]
+            by_id.append(timed(delete_all, session, ids))
+            flush.append(timed(delete_book_or_all_db, session, all_flag=True))
+    return {
+        "by_id": metrics(by_id, min(LOOKUPS, len(corpus.books))),
+        "all": metrics(flush, len(corpus.books)),
+    }
+
+
+def delete_all(session: Session, ids: Sequence[int]) -> None:
+    for id_ in ids:
+        delete_book_or_all_db(session, id_)
+
+
+FILE_BENCHMARKS: dict[str, Callable[[Corpus, int], dict]] = {
+    "fb2_parser": bench_fb2_parser,
+    "file_extraction": bench_file_extraction,
+    "get_books_from_directory": bench_get_books_from_directory,
+}
+DB_BENCHMARKS: dict[str, Callable[[Corpus, int, Connection], dict]] = {
+    "create_books_and_authors": bench_create_books_and_authors,
+    "get_books_from_db": bench_get_books_from_db,
+    "delete_book_or_all_db": bench_delete_book_or_all_db,
+}
+
+
+def bind_db_benchmarks(connection: Optional[Connection]) -> dict[str, Callable]:
+    """DB benchmarks which run with the connection, none without connection"""
+    if connection is None:
+        return {}
+    return {
+        name: partial(bench, connection=connection)
+        for name, bench in DB_BENCHMARKS.items()
+    }
+
+
+def run_benchmarks(
+    corpus: Corpus,
+    names: Sequence[str],
+    repeat: int = REPEAT,
+    db_url: Optional[str] = None,
+) -> dict[str, dict]:
+    """
+    Run benchmarks of names over the corpus, DB benchmarks run with db_url only
+
+    :return {'benchmark/case': {'wall_s': float, 'cpu_s': float, ...}, ...}
+    """
+    connection = create_engine(db_url).connect() if db_url else None
+    benchmarks = {**FILE_BENCHMARKS, **bind_db_benchmarks(connection)}
+    results = {}
+    for name in names:
+        if name not in benchmarks:
+            logging.info(f"Skip {name}: no --db-url given")
+            continue
+        logging.info(f"Running {name}")
+        for case, result in benchmarks[name](corpus, repeat).items():
+            results[f"{name}/{case}"] = result
+            logging.info(f"{name}/{case}: {result}")
+    if connection is not None:
+        connection.close()
+    return results
+
+
+def git_commit() -> Optional[str]:
+    """Current commit of the repository, with '-dirty' if there are changes"""
+    try:
+        commit = subprocess.run(  # noqa: S603, S607
+            ["git", "describe", "--always", "--dirty", "--abbrev=40"],
+            capture_output=True,
+            check=True,
+            text=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit.stdout.strip()
+
+
+def compare(previous: dict, current: dict) -> list[str]:
+    """
+    Compare best wall times of the same benchmarks of two runs
+
+    :return names of benchmarks slower by more than REGRESSION_THRESHOLD
+
+    >>> compare({"results": {"a": {"wall_s": 1.0}}}, {"results": {"a": {"wall_s": 1.5}}})
+    ['a']
+    """
+    regressions = []
+    for name, result in current["results"].items():
+        before = previous["results"].get(name)
+        if before is None:
+            continue
+        change = result["wall_s"] / before["wall_s"] - 1
+        logging.info(
+            f"{name}: {before['wall_s']} s -> {result['wall_s']} s, {change:+.1%}"
+        )
+        if change > REGRESSION_THRESHOLD:
+            regressions.append(name)
+    if regressions:
+        logging.warning(f"Regressions: {', '.join(regressions)}")
+    return regressions
+
+
+def parse_args(_args: Sequence[str]) -> ArgumentParser.__class__:
+    """Create parser with args (-o, -b, --db-url, --compare, ...) and parse args with the created parser"""
+    parser = ArgumentParser(description="Benchmark parsing and DB on synthetic books")
+    parser.add_argument(
+        "-o", dest="output", required=True, help="JSON file to write results into"
+    )
+    parser.add_argument(
+        "-b",
+        dest="benchmarks",
+        nargs="+",
+        choices=[*FILE_BENCHMARKS, *DB_BENCHMARKS],
+        default=[*FILE_BENCHMARKS, *DB_BENCHMARKS],
+        help="benchmarks to run, all by default",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=REPEAT, help="runs of every benchmark"
+    )
+    parser.add_argument(
+        "--db-url",
+        help="URL of a scratch DB for DB benchmarks, all changes are rolled back",
+    )
+    parser.add_argument("--corpus-dir", help="keep the generated corpus in this folder")
+    parser.add_argument(
+        "--compare", help="JSON file of a previous run to compare results with"
+    )
+    add_corpus_arguments(parser)
+    return parser.parse_args(_args)
+
+
+def main():
+    setup_logging()
+    logging.debug(f"Called {sys.argv[0]} with {sys.argv[1:]}")
+    args = parse_args(sys.argv[1:])
+    with TemporaryDirectory() as tmp_dir:
+        dir_path = os.path.abspath(args.corpus_dir or tmp_dir)
+        books = write_corpus_from_args(dir_path, args)
+        corpus = Corpus(dir_path, books, read_texts(dir_path))
+        results = run_benchmarks(corpus, args.benchmarks, args.repeat, args.db_url)
+    report = {
+        "commit": git_commit(),
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "corpus": corpus_from_args(args),
+        "results": results,
+    }
+    Path(args.output).write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    logging.info(f"Results are written into {args.output}")
+    if args.compare and compare(json.loads(Path(args.compare).read_text()), report):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import logging
+from io import TextIOBase
+from typing import Iterable, Iterator, Sequence
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from services.normalize import normalize_key, optional_key
+from services.profiling import staged
+
+from .services import bump_generation, count_books
+
+# escaping of the PostgreSQL COPY text format
+COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+COPY_NULL = "\\N"
+
+CREATE_STAGING = """
+DROP TABLE IF EXISTS book_staging, book_resolved;
+CREATE TEMPORARY TABLE book_staging (
+    ordinal bigserial,
+    name text,
+    name_key text,
+    year integer,
+    first_name text,
+    last_name text,
+    first_name_key text,
+    last_name_key text,
+    path text,
+    member text,
+    size bigint,
+    mtime_ns bigint,
+    content_hash text
+) ON COMMIT DROP;
+"""
+COPY_STAGING = """
+COPY book_staging (
+    name, name_key, year, first_name, last_name, first_name_key, last_name_key,
+    path, member, size, mtime_ns, content_hash
+) FROM STDIN
+"""
+# authors with an empty first or last name are unknown, like in create_all_authors,
+# an author is saved with the first spelling of its names
+MERGE_AUTHORS = """
+INSERT INTO author (first_name, last_name, first_name_key, last_name_key)
+SELECT DISTINCT ON (first_name_key, last_name_key)
+       first_name, last_name, first_name_key, last_name_key
+FROM book_staging
+WHERE first_name <> '' AND last_name <> ''
+ORDER BY first_name_key, last_name_key, ordinal
+ON CONFLICT (first_name_key, last_name_key) DO NOTHING
+"""
+SAME_AUTHOR = """
+a.first_name_key = s.first_name_key AND a.last_name_key = s.last_name_key
+AND s.first_name <> '' AND s.last_name <> ''
+"""
+RESOLVE_BOOKS = f"""
+CREATE TEMPORARY TABLE book_resolved ON COMMIT DROP AS
+SELECT (array_agg(s.name ORDER BY s.ordinal))[1] AS name, s.name_key, s.year,
+       a.id AS author_id, count(*) AS copies, min(s.ordinal) AS ordinal
+FROM book_staging s
+LEFT JOIN author a ON {SAME_AUTHOR}
+GROUP BY s.name_key, s.year, a.id;
+ANALYZE book_resolved;
+"""
+# NULL year or author_id never conflicts in the unique constraint of book,
+# so rows are matched with IS NOT DISTINCT FROM, like in create_all_books
+SAME_BOOK = """
+book.name_key = r.name_key
+AND book.year IS NOT DISTINCT FROM r.year
+AND book.author_id IS NOT DISTINCT FROM r.author_id
+"""
+UPDATE_BOOKS = f"""
+UPDATE book SET name = r.name, year = r.year
+FROM book_resolved r
+WHERE {SAME_BOOK}
+"""
+INSERT_BOOKS = f"""
+INSERT INTO book (name, name_key, year, author_id)
+SELECT r.name, r.name_key, r.year, r.author_id FROM book_resolved r
+WHERE NOT EXISTS (SELECT 1 FROM book WHERE {SAME_BOOK})
+ORDER BY r.ordinal
+ON CONFLICT (name_key, year, author_id) DO NOTHING
+"""
+COUNT_REPEATED = "SELECT coalesce(sum(copies - 1), 0) FROM book_resolved"
+SAVE_FILE_MANIFEST = f"""
+INSERT INTO file_manifest (path, member, size, mtime_ns, content_hash, book_id, missing)
+SELECT DISTINCT ON (s.path, s.member)
+       s.path, s.member, s.size, s.mtime_ns, s.content_hash, book.id, false
+FROM book_staging s
+LEFT JOIN author a ON {SAME_AUTHOR}
+JOIN book
+    ON book.name_key = s.name_key
+    AND book.year IS NOT DISTINCT FROM s.year
+    AND book.author_id IS NOT DISTINCT FROM a.id
+WHERE s.path IS NOT NULL
+ON CONFLICT (path, member) DO UPDATE SET
+    size = excluded.size,
+    mtime_ns = excluded.mtime_ns,
+    content_hash = excluded.content_hash,
+    book_id = excluded.book_id,
+    missing = false
+"""
+# keys of the file state copied for every book
+FILE_KEYS = ("path", "member", "size", "mtime_ns", "content_hash")
+
+
+class CopySource(TextIOBase):
+    """Read-only text file of COPY lines, made from rows only when they are read"""
+
+    def __init__(self, rows: Iterable[Sequence]):
+        super().__init__()
+        self.lines: Iterator[str] = map(copy_line, rows)
+        self.rest = ""
+        self.rows = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> str:
+        chunks, length = [self.rest], len(self.rest)
+        for line in self.lines:
+            chunks.append(line)
+            length += len(line)
+            self.rows += 1
+            if 0 <= size <= length:
+                break
+        data = "".join(chunks)
+        size = len(data) if size < 0 else size
+        self.rest = data[size:]
+        return data[:size]
+
+
+def copy_line(values: Sequence) -> str:
+    """Format values as a line of the COPY text format"""
+    return (
+        "\t".join(
+            COPY_NULL if value is None else str(value).translate(COPY_ESCAPES)
+            for value in values
+        )
+        + "\n"
+    )
+
+
+@staged("db")
+def copy_books_and_authors(
+    connection: Connection,
+    data: Iterable[dict],
+    update_flag: bool,
+    with_files: bool = False,
+) -> (int, int):
+    """
+    Stream books into a staging table with COPY FROM STDIN, then merge them
+    into author and book tables with a few set-based statements.
+    If with_files, files of the books are saved into the manifest too
+
+    :return (number of created books, number of updated books)
+    """
+    connection.execute(text(CREATE_STAGING))
+    source = CopySource(
+        (
+            book["name"],
+            normalize_key(book["name"]),
+            book["year"],
+            book["author_first_name"],
+            book["author_last_name"],
+            optional_key(book["author_first_name"]),
+            optional_key(book["author_last_name"]),
+            *(book.get("file", {}).get(key) for key in FILE_KEYS),
+        )
+        for book in data
+    )
+    with connection.connection.cursor() as cursor:
+        cursor.copy_expert(COPY_STAGING, source)
+    logging.debug(f"Copied {source.rows} books into staging table")
+    connection.execute(text("ANALYZE book_staging"))
+
+    connection.execute(text(MERGE_AUTHORS))
+    connection.execute(text(RESOLVE_BOOKS))
+    updated = 0
+    if update_flag:
+        updated += connection.execute(text(UPDATE_BOOKS)).rowcount
+        updated += connection.execute(text(COUNT_REPEATED)).scalar()
+    created = connection.execute(text(INSERT_BOOKS)).rowcount
+    if with_files:
+        connection.execute(text(SAVE_FILE_MANIFEST))
+    if created or updated:
+        bump_generation(connection)
+    count_books(source.rows, created, updated)
+    logging.info(f"Created: {created} books AND Updated: {updated} books")
+    return created, updated
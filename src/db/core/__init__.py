@@ -1 +1,8 @@
-from db.core.connect_to_db import Base, Session, engine, get_url_to_db, session_scope
+from db.core.connect_to_db import (
+    Base,
+    Session,
+    get_database_config,
+    get_engine,
+    get_url_to_db,
+    session_scope,
+)
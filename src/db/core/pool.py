@@ -0,0 +1,181 @@
+import configparser
+import logging
+from threading import Lock
+from time import perf_counter
+from typing import Mapping
+
+from sqlalchemy import exc, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.pool import NullPool, Pool, QueuePool
+
+# defaults of [database] settings, they are the defaults of SQLAlchemy
+POOL_SIZE = 5
+MAX_OVERFLOW = 10
+POOL_TIMEOUT = 30.0
+POOL_RECYCLE = -1
+QUERY_CACHE_SIZE = 500
+# settings of the Postgres session, which are given by [database] section
+SESSION_SETTINGS = ("statement_timeout", "work_mem")
+# SET LOCAL of a setting, with bound parameters of any driver
+SET_LOCAL = text("SELECT set_config(:name, :value, true)")
+
+
+class PoolStats:
+    """Checkouts of connections from the pool and the time they waited for them"""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.peak_checked_out = 0
+        self.wait_s = 0.0
+        self.max_wait_s = 0.0
+
+    def record(self, wait_s: float, checked_out: int) -> None:
+        with self.lock:
+            self.checkouts += 1
+            self.peak_checked_out = max(self.peak_checked_out, checked_out)
+            self.wait_s += wait_s
+            self.max_wait_s = max(self.max_wait_s, wait_s)
+
+    def record_timeout(self) -> None:
+        with self.lock:
+            self.timeouts += 1
+
+    def as_dict(self) -> dict:
+        """
+        Counters and wait times in seconds, rounded to microseconds
+
+        >>> stats = PoolStats()
+        >>> stats.record(0.002, 1)
+        >>> stats.record(0.0, 2)
+        >>> stats.as_dict()
+        {'checkouts': 2, 'timeouts': 0, 'peak_checked_out': 2, 'wait_s': 0.002, 'mean_wait_s': 0.001, 'max_wait_s': 0.002}
+        """
+        with self.lock:
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "peak_checked_out": self.peak_checked_out,
+                "wait_s": round(self.wait_s, 6),
+                "mean_wait_s": round(self.wait_s / self.checkouts, 6)
+                if self.checkouts
+                else 0.0,
+                "max_wait_s": round(self.max_wait_s, 6),
+            }
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool, which counts checkouts and measures how long they wait
+    for a free connection or for a new one to be opened
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def connect(self):
+        started = perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            self.stats.record_timeout()
+            raise
+        finally:
+            # checkouts which timed out are counted too, they waited the longest
+            self.stats.record(perf_counter() - started, self.checkedout())
+
+    def recreate(self):
+        # the pool is recreated by engine.dispose(), its stats are kept
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+def as_bool(value: str) -> bool:
+    """
+    Boolean of config.ini, like ConfigParser.getboolean reads it
+
+    >>> as_bool("yes"), as_bool("False")
+    (True, False)
+    """
+    try:
+        return configparser.ConfigParser.BOOLEAN_STATES[value.lower()]
+    except KeyError as err:
+        raise ValueError(f"`{value}` is not a boolean") from err
+
+
+def engine_options(settings: Mapping[str, str]) -> dict:
+    """Keyword args of create_engine by [database] settings"""
+    options = {
+        "query_cache_size": int(settings.get("query_cache_size", QUERY_CACHE_SIZE)),
+        **pool_options(settings),
+    }
+    session = session_settings(settings)
+    if session and not as_bool(settings.get("pgbouncer", "false")):
+        # PgBouncer rejects options of the connection, they are set by transactions
+        options["connect_args"] = {
+            "options": " ".join(f"-c {name}={value}" for name, value in session.items())
+        }
+    return options
+
+
+def pool_options(
+    settings: Mapping[str, str], poolclass: type[Pool] = TimedQueuePool
+) -> dict:
+    """
+    Keyword args of the pool by [database] settings, POOL_SIZE=0 turns pooling
+    off, so that every session opens its own connection (or takes it from PgBouncer)
+    """
+    pool_size = int(settings.get("pool_size", POOL_SIZE))
+    if pool_size == 0:
+        return {"poolclass": NullPool}
+    return {
+        "poolclass": poolclass,
+        "pool_size": pool_size,
+        "max_overflow": int(settings.get("max_overflow", MAX_OVERFLOW)),
+        "pool_timeout": float(settings.get("pool_timeout", POOL_TIMEOUT)),
+        "pool_recycle": int(settings.get("pool_recycle", POOL_RECYCLE)),
+        "pool_pre_ping": as_bool(settings.get("pool_pre_ping", "false")),
+    }
+
+
+def session_settings(settings: Mapping[str, str]) -> dict[str, str]:
+    """
+    Postgres settings of [database] section, empty ones are the server defaults
+
+    >>> session_settings({"statement_timeout": "30s", "work_mem": "", "pool_size": "5"})
+    {'statement_timeout': '30s'}
+    """
+    return {name: settings[name] for name in SESSION_SETTINGS if settings.get(name, "")}
+
+
+def set_local_settings(settings: Mapping[str, str], connection: Connection) -> None:
+    """
+    Set Postgres settings for the transaction only, the server connection
+    is shared by clients of PgBouncer between transactions
+    """
+    for name, value in settings.items():
+        connection.execute(SET_LOCAL, {"name": name, "value": value})
+
+
+def pool_stats(pool: Pool) -> dict:
+    """Usage of the pool for tuning of POOL_SIZE, MAX_OVERFLOW and POOL_TIMEOUT"""
+    if not isinstance(pool, QueuePool):
+        return {"pool": type(pool).__name__}
+    stats = {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        # overflow counts up from -size, so it is negative until the pool is full
+        "overflow": max(pool.overflow(), 0),
+    }
+    if isinstance(pool, TimedQueuePool):
+        stats.update(pool.stats.as_dict())
+    return stats
+
+
+def log_pool_stats(engine: Engine) -> None:
+    logging.info(f"Pool stats: {pool_stats(engine.pool)}")
@@ -0,0 +1,114 @@
+"""normalized keys
+
+Revision ID: 2f8a4c7e9b31
+Revises: 9b7d3f6a1c25
+Create Date: 2026-10-18 16:48:20.731954
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+from services.normalize import normalize_key
+
+# revision identifiers, used by Alembic.
+revision = "2f8a4c7e9b31"
+down_revision = "9b7d3f6a1c25"
+branch_labels = None
+depends_on = None
+
+# rows whose keys are computed and saved at once
+BACKFILL_SIZE = 10_000
+# rows with the same keys are merged into the oldest one of them
+DUPLICATE_AUTHORS = """
+SELECT id, min(id) OVER (PARTITION BY first_name_key, last_name_key) AS kept
+FROM author
+"""
+DUPLICATE_BOOKS = """
+SELECT id, min(id) OVER (PARTITION BY name_key, year, author_id) AS kept
+FROM book
+"""
+MERGE_DUPLICATES = f"""
+UPDATE book SET author_id = d.kept FROM ({DUPLICATE_AUTHORS}) d
+WHERE book.author_id = d.id AND d.id <> d.kept;
+DELETE FROM author USING ({DUPLICATE_AUTHORS}) d
+WHERE author.id = d.id AND d.id <> d.kept;
+UPDATE file_manifest SET book_id = d.kept FROM ({DUPLICATE_BOOKS}) d
+WHERE file_manifest.book_id = d.id AND d.id <> d.kept;
+DELETE FROM book USING ({DUPLICATE_BOOKS}) d
+WHERE book.id = d.id AND d.id <> d.kept;
+"""
+
+
+def upgrade():
+    op.add_column("author", sa.Column("first_name_key", sa.String(), nullable=True))
+    op.add_column("author", sa.Column("last_name_key", sa.String(), nullable=True))
+    op.add_column("book", sa.Column("name_key", sa.String(), nullable=True))
+    backfill("author", "first_name", "last_name")
+    backfill("book", "name")
+
+    op.drop_index("_author_index", table_name="author")
+    op.drop_constraint("author_first_name_last_name_key", "author", type_="unique")
+    op.drop_index("_book_index", table_name="book")
+    op.drop_constraint("book_name_year_author_id_key", "book", type_="unique")
+    op.execute(MERGE_DUPLICATES)
+
+    op.alter_column("author", "first_name_key", nullable=False)
+    op.alter_column("author", "last_name_key", nullable=False)
+    op.alter_column("book", "name_key", nullable=False)
+    op.create_unique_constraint(
+        "author_first_name_key_last_name_key_key",
+        "author",
+        ["first_name_key", "last_name_key"],
+    )
+    op.create_index(
+        "_author_index", "author", ["first_name_key", "last_name_key"], unique=False
+    )
+    op.create_unique_constraint(
+        "book_name_key_year_author_id_key", "book", ["name_key", "year", "author_id"]
+    )
+    op.create_index(
+        "_book_index", "book", ["name_key", "year", "author_id"], unique=False
+    )
+
+
+def downgrade():
+    op.drop_index("_book_index", table_name="book")
+    op.drop_constraint("book_name_key_year_author_id_key", "book", type_="unique")
+    op.drop_index("_author_index", table_name="author")
+    op.drop_constraint(
+        "author_first_name_key_last_name_key_key", "author", type_="unique"
+    )
+    # rows with the same names have the same keys, so names are still unique
+    op.create_unique_constraint(
+        "book_name_year_author_id_key", "book", ["name", "year", "author_id"]
+    )
+    op.create_index("_book_index", "book", ["name", "year", "author_id"], unique=False)
+    op.create_unique_constraint(
+        "author_first_name_last_name_key", "author", ["first_name", "last_name"]
+    )
+    op.create_index(
+        "_author_index", "author", ["first_name", "last_name"], unique=False
+    )
+    op.drop_column("book", "name_key")
+    op.drop_column("author", "last_name_key")
+    op.drop_column("author", "first_name_key")
+
+
+def backfill(table: str, *columns: str) -> None:
+    """Save keys of names of all rows, computed like they are computed on insert"""
+    connection = op.get_bind()
+    rows = connection.execution_options(stream_results=True).execute(
+        sa.text(f"SELECT id, {', '.join(columns)} FROM {table}")
+    )
+    arrays = ", ".join(f"CAST(:{column} AS text[])" for column in columns)
+    keys = ", ".join(f"{column}_key = v.{column}" for column in columns)
+    statement = sa.text(
+        f"UPDATE {table} SET {keys} "
+        f"FROM unnest(CAST(:id AS integer[]), {arrays}) AS v(id, {', '.join(columns)}) "
+        f"WHERE {table}.id = v.id"
+    )
+    for part in rows.partitions(BACKFILL_SIZE):
+        values = {"id": [row.id for row in part]}
+        for column in columns:
+            values[column] = [normalize_key(getattr(row, column)) for row in part]
+        connection.execute(statement, values)
@@ -0,0 +1,37 @@
+"""trigram search
+
+Revision ID: 9b7d3f6a1c25
+Revises: 5e1b7f0c2d84
+Create Date: 2026-10-18 15:12:44.203517
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "9b7d3f6a1c25"
+down_revision = "5e1b7f0c2d84"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index(
+        "_book_name_trgm",
+        "book",
+        [sa.text("name gin_trgm_ops")],
+        postgresql_using="gin",
+    )
+    op.create_index(
+        "_author_name_trgm",
+        "author",
+        [sa.text("(first_name || ' ' || last_name) gin_trgm_ops")],
+        postgresql_using="gin",
+    )
+
+
+def downgrade():
+    op.drop_index("_author_name_trgm", table_name="author")
+    op.drop_index("_book_name_trgm", table_name="book")
+    # pg_trgm is kept, it may be used by other objects of the database
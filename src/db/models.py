@@ -1,6 +1,20 @@
-from sqlalchemy import Column, ForeignKey, Index, Integer, String, UniqueConstraint
+from sqlalchemy import (
+    DDL,
+    BigInteger,
+    Boolean,
+    Column,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    UniqueConstraint,
+    event,
+    text,
+)
 from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy.orm import backref, configure_mappers, relationship
+from sqlalchemy.orm import relationship, validates
+
+from services.normalize import normalize_key
 
 from .core.connect_to_db import Base
 
@@ -10,20 +24,34 @@ class Author(Base):
     id = Column(Integer, primary_key=True)
     first_name = Column(String(40), nullable=False)
     last_name = Column(String(40), nullable=False)
-    book = relationship("Book", uselist=False, backref=backref("author"))
+    # normalized names, authors are searched and deduplicated by them
+    first_name_key = Column(String, nullable=False)
+    last_name_key = Column(String, nullable=False)
+    book = relationship("Book", uselist=False, back_populates="author")
     # unique constraints across multiple columns and Indexing by name, year, author
     __table_args__ = (
         UniqueConstraint(
-            "first_name",
-            "last_name",
+            "first_name_key",
+            "last_name_key",
+        ),
+        Index("_author_index", "first_name_key", "last_name_key"),
+        # trigram index of the full name for the fuzzy search
+        Index(
+            "_author_name_trgm",
+            text("(first_name || ' ' || last_name) gin_trgm_ops"),
+            postgresql_using="gin",
         ),
-        Index("_author_index", "first_name", "last_name"),
     )
 
     def __init__(self, first_name: str, last_name: str):
         self.first_name = first_name
         self.last_name = last_name
 
+    @validates("first_name", "last_name")
+    def validate_name(self, key: str, name: str) -> str:
+        setattr(self, f"{key}_key", normalize_key(name))
+        return name
+
     @hybrid_property
     def as_dict(self) -> dict:
         return {
@@ -39,6 +67,8 @@ class Book(Base):
     __tablename__ = "book"
     id = Column(Integer, primary_key=True)
     name = Column(String(50), nullable=False, index=True)
+    # normalized name, books are searched and deduplicated by it
+    name_key = Column(String, nullable=False)
     year = Column(Integer, nullable=True, index=True)
     author_id = Column(
         Integer,
@@ -46,17 +76,25 @@ class Book(Base):
         nullable=True,
         default=None,
     )
+    author = relationship("Author", back_populates="book")
 
     # unique constraints across multiple columns and Indexing by name, year, author
     __table_args__ = (
         UniqueConstraint(
-            "name",
+            "name_key",
             "year",
             "author_id",
         ),
-        Index("_book_index", "name", "year", "author_id"),
+        Index("_book_index", "name_key", "year", "author_id"),
+        # trigram index of the name for the fuzzy search
+        Index("_book_name_trgm", text("name gin_trgm_ops"), postgresql_using="gin"),
     )
 
+    @validates("name")
+    def validate_name(self, key: str, name: str) -> str:
+        self.name_key = normalize_key(name)
+        return name
+
     @hybrid_property
     def as_dict(self) -> dict:
         return {
@@ -69,4 +107,50 @@ class Book(Base):
         return str(self.as_dict)
 
 
-configure_mappers()
+class FileManifest(Base):
+    __tablename__ = "file_manifest"
+    id = Column(Integer, primary_key=True)
+    path = Column(String, nullable=False)
+    # name of the book inside of archive, empty for a plain file
+    member = Column(String, nullable=False, default="")
+    size = Column(BigInteger, nullable=False)
+    mtime_ns = Column(BigInteger, nullable=False)
+    content_hash = Column(String(32), nullable=False)
+    book_id = Column(
+        Integer,
+        ForeignKey("book.id", ondelete="SET NULL"),
+        nullable=True,
+        default=None,
+    )
+    # file was not found by the last scan of its directory
+    missing = Column(Boolean, nullable=False, default=False)
+    book = relationship("Book")
+
+    __table_args__ = (UniqueConstraint("path", "member"),)
+
+
+class IngestCheckpoint(Base):
+    __tablename__ = "ingest_checkpoint"
+    id = Column(Integer, primary_key=True)
+    # absolute path of the directory or file given to digger
+    source = Column(String, nullable=False, unique=True)
+    # every file before files_done and parts_done parts of the next one are saved
+    files_done = Column(Integer, nullable=False, default=0)
+    parts_done = Column(Integer, nullable=False, default=0)
+    # absolute path of the file of the last done task, the walk is checked by it on resume
+    file_path = Column(String, nullable=True)
+    batches = Column(Integer, nullable=False, default=0)
+    books = Column(BigInteger, nullable=False, default=0)
+
+
+class CatalogGeneration(Base):
+    __tablename__ = "catalog_generation"
+    id = Column(Integer, primary_key=True)
+    # bumped with every change of books, results cached for older generations are stale
+    generation = Column(BigInteger, nullable=False, default=0)
+
+
+# trigram indexes need pg_trgm, it is created with the tables like by migrations
+event.listen(
+    Base.metadata, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+)
@@ -0,0 +1,175 @@
+import logging
+from contextlib import closing
+from queue import Queue
+from threading import Thread
+from typing import Callable, Iterable, Optional
+
+from services.normalize import normalize_key
+
+from .core import Session
+from .services import (
+    BATCH_SIZE,
+    IngestCache,
+    commit_batch,
+    log_commit_latency,
+    save_batch,
+)
+
+# batches queued for every writer, the producer waits while a queue is full
+QUEUE_BATCHES = 2
+# batches handed over between checkpoints, writers catch up with the producer then
+CHECKPOINT_BATCHES = 20
+
+
+class BatchWriter(Thread):
+    """Save batches from the queue with its own session, until None is received"""
+
+    def __init__(
+        self,
+        number: int,
+        update_flag: bool,
+        cache: IngestCache,
+        with_files: bool,
+        session_factory: Callable[[], Session],
+    ):
+        super().__init__(name=f"batch-writer-{number}", daemon=True)
+        self.queue: Queue = Queue(QUEUE_BATCHES)
+        self.update_flag = update_flag
+        self.cache = cache
+        self.with_files = with_files
+        self.session_factory = session_factory
+        self.created, self.updated = 0, 0
+        self.latencies: list[float] = []
+        self.error: Optional[Exception] = None
+
+    def run(self) -> None:
+        with closing(self.session_factory()) as session:
+            for batch in iter(self.queue.get, None):
+                self.save(session, batch)
+                self.queue.task_done()
+        self.queue.task_done()
+
+    def save(self, session: Session, batch: list[dict]) -> None:
+        """Save and commit the batch, after an error batches are dropped to unblock the producer"""
+        if self.error is not None:
+            return
+        try:
+            created, updated = save_batch(
+                session, batch, self.update_flag, self.cache, self.with_files
+            )
+            self.latencies.append(
+                commit_batch(session, len(self.latencies) + 1, len(batch))
+            )
+        except Exception as err:
+            session.rollback()
+            self.error = err
+            return
+        self.created, self.updated = self.created + created, self.updated + updated
+
+
+class BookPipeline:
+    """
+    Save books by several writer threads, each with its own session and connection,
+    while the producer keeps taking parsed books. A book always goes to the same
+    writer by its name, so concurrent writers never insert the same new book twice.
+    Every writer queues up to QUEUE_BATCHES batches, then the producer waits
+    """
+
+    def __init__(
+        self,
+        update_flag: bool,
+        cache: Optional[IngestCache] = None,
+        with_files: bool = False,
+        batch_size: int = BATCH_SIZE,
+        writers: int = 2,
+        on_commit: Optional[Callable[[Session, int, int], None]] = None,
+        session_factory: Callable[[], Session] = Session,
+    ):
+        """
+        :param on_commit: called with (session, handed over batches, handed over books)
+        every CHECKPOINT_BATCHES batches, when writers have committed all of them
+        """
+        cache = cache if cache is not None else IngestCache()
+        self.writers = [
+            BatchWriter(number, update_flag, cache, with_files, session_factory)
+            for number in range(1, writers + 1)
+        ]
+        self.buffers: list[list[dict]] = [[] for _ in self.writers]
+        self.batch_size = batch_size
+        self.on_commit = on_commit
+        self.session_factory = session_factory
+        self.batches, self.books = 0, 0
+        self.since_checkpoint = 0
+        self.cache = cache
+
+    def run(self, data: Iterable[dict]) -> (int, int):
+        """
+        Save all books of data
+
+        :return (number of created books, number of updated books)
+        """
+        for writer in self.writers:
+            writer.start()
+        try:
+            for book in data:
+                self.put(book)
+            self.flush()
+        finally:
+            self.stop()
+        self.raise_error()
+        created = sum(writer.created for writer in self.writers)
+        updated = sum(writer.updated for writer in self.writers)
+        logging.info(f"Created: {created} books AND Updated: {updated} books")
+        logging.info(f"Ingest cache: {self.cache}")
+        latencies = [latency for writer in self.writers for latency in writer.latencies]
+        log_commit_latency(latencies, self.batch_size)
+        return created, updated
+
+    def put(self, book: dict) -> None:
+        """Add the book to the buffer of its writer, a full buffer is handed over"""
+        # books are deduplicated by the key of the name, spellings of it share a writer
+        index = hash(normalize_key(book["name"])) % len(self.writers)
+        self.buffers[index].append(book)
+        if len(self.buffers[index]) < self.batch_size:
+            return
+        self.hand_over(index)
+        if self.on_commit is not None and self.since_checkpoint >= CHECKPOINT_BATCHES:
+            self.checkpoint()
+
+    def hand_over(self, index: int) -> None:
+        """Queue the buffer to its writer, waits while the queue is full"""
+        self.raise_error()
+        batch, self.buffers[index] = self.buffers[index], []
+        self.writers[index].queue.put(batch)
+        self.batches, self.books = self.batches + 1, self.books + len(batch)
+        self.since_checkpoint += 1
+
+    def flush(self) -> None:
+        """Hand over all buffers, even if they are not full"""
+        for index, buffer in enumerate(self.buffers):
+            if buffer:
+                self.hand_over(index)
+
+    def checkpoint(self) -> None:
+        """Wait until writers commit every handed over book, then call on_commit"""
+        self.flush()
+        for writer in self.writers:
+            writer.queue.join()
+        self.raise_error()
+        self.since_checkpoint = 0
+        with closing(self.session_factory()) as session:
+            self.on_commit(session, self.batches, self.books)
+            session.commit()
+
+    def stop(self) -> None:
+        """Let writers save the queued batches and wait for them"""
+        for writer in self.writers:
+            writer.queue.put(None)
+        for writer in self.writers:
+            writer.join()
+
+    def raise_error(self) -> None:
+        """Raise the error of the first failed writer"""
+        for writer in self.writers:
+            if writer.error is not None:
+                raise writer.error
@@ -1,10 +1,55 @@
+import json
 import logging
-from typing import Iterable, Optional, Sequence
+import sys
+from array import array
+from bisect import bisect_left
+from heapq import merge
+from itertools import islice, repeat
+from threading import Lock
+from time import perf_counter
+from typing import Callable, Hashable, Iterable, Iterator, Optional, Sequence, Union
+
+from sqlalchemy import Column, Integer, and_, cast
+from sqlalchemy import column as sql_column
+from sqlalchemy import delete, exists, func, literal, or_, select, text, update
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.engine import Connection, Row
+from sqlalchemy.sql.elements import ColumnElement
+from sqlalchemy.sql.selectable import Select, TableValuedAlias
+
+from services.metrics import count, observe
+from services.normalize import normalize_key, optional_key
+from services.profiling import staged
+from services.result_cache import ResultCache
+from services.startup import BATCH_SIZE, DELETE_CHUNK_SIZE, FUZZY_LIMIT
 
 from .core import Base, Session
-from .models import Author, Book
+from .models import Author, Book, CatalogGeneration, FileManifest, IngestCheckpoint
 
+# keys kept by each index of IngestCache, keys over the limit are looked up in DB
+CACHE_MAX_KEYS = 50_000_000
+# new keys of HashIndex merged into its sorted arrays at once
+CACHE_COMPACT_SIZE = 1_000_000
+# rows read from DB and sorted at once while IngestCache is loaded
+CACHE_LOAD_SIZE = 100_000
+# keys of the file state saved into FileManifest for every book
+MANIFEST_FILE_KEYS = ("path", "member", "size", "mtime_ns", "content_hash")
+# fields of a query of the batch search, in the order of unnest arrays
+SEARCH_FIELDS = ("name", "author_first_name", "author_last_name", "year")
+# id of the only row of CatalogGeneration
+GENERATION_ID = 1
+# flush of the catalog, files of the manifest refer to books and checkpoints
+# of ingests refer to saved files, so they are flushed too
+TRUNCATE_BOOKS = text(
+    "TRUNCATE book, author, file_manifest, ingest_checkpoint RESTART IDENTITY"
+)
+# lock of TRUNCATE_BOOKS taken before rows are counted, so nothing is saved in between
+LOCK_BOOKS = text(
+    "LOCK TABLE book, author, file_manifest, ingest_checkpoint IN ACCESS EXCLUSIVE MODE"
+)
 
+
+@staged("db")
 def delete_book_or_all_db(
     session: Session,
     primary_key: Optional[int] = None,
@@ -12,28 +57,135 @@ def delete_book_or_all_db(
 ) -> int:
     """Delete a book in a database if not all_flag else Flush whole db"""
 
-    counter = 0
-    if not all_flag:
-        logging.debug("Searching book in db")
-        book = session.query(Book).filter(Book.id == primary_key).first()
+    if all_flag:
+        return truncate_books(session)
+    logging.debug("Searching book in db")
+    book = session.query(Book).filter(Book.id == primary_key).first()
+
+    if book is None:
+        logging.info("Book Not Found")
+        return 0
+
+    logging.debug(f"Deleting book: {book.as_dict}")
+    session.delete(book)
+    bump_generation(session)
+    session.commit()
+    return 1
 
-        if book is None:
-            logging.info("Book Not Found")
-            return counter
 
-        logging.debug(f"Deleting book: {book.as_dict}")
-        session.delete(book)
-        counter += 1
-    else:
-        logging.debug("Deleting all books")
-        counter += session.query(Book).delete()
+def truncate_books(session: Session) -> int:
+    """
+    Flush books, authors, files of the manifest and checkpoints by TRUNCATE, which
+    neither scans nor logs every row, ids start from 1 again. The generation is not
+    flushed but bumped, so results cached before are stale
 
-        logging.debug("Deleting all authors")
-        counter += session.query(Author).delete()
+    :return number of flushed books and authors, counted under the lock of TRUNCATE
+    """
+    session.execute(LOCK_BOOKS)
+    counter = sum(
+        session.execute(select(func.count()).select_from(model)).scalar()
+        for model in (Book, Author)
+    )
+    logging.debug("Truncating books, authors, files and checkpoints")
+    session.execute(TRUNCATE_BOOKS)
+    bump_generation(session)
     session.commit()
+    return counter  # noqa: R504
+
+
+@staged("db")
+def delete_books_db(
+    session: Session,
+    ids: Optional[Sequence[int]] = None,
+    id_range: Optional[Sequence[int]] = None,
+    author: Optional[Sequence[str]] = None,
+    years: Optional[Sequence[int]] = None,
+    chunk_size: int = DELETE_CHUNK_SIZE,
+) -> int:
+    """
+    Delete books by ids, or books of the id range, the author and the years all
+    together (ranges include both ends), by DELETE ... WHERE of chunk_size books.
+    Every chunk is committed, so rows are locked while one chunk is deleted.
+    Authors are kept, like by the delete of one book
+    """
+    if ids is not None:
+        return sum(
+            delete_chunk(session, Book.id.in_(chunk))
+            for chunk in batches(ids, chunk_size)
+        )
+    chunk = (
+        select(Book.id)
+        .where(books_filter(id_range, author, years))
+        .order_by(Book.id)
+        .limit(chunk_size)
+    )
+    counter = deleted = delete_chunk(session, Book.id.in_(chunk))
+    while deleted == chunk_size:
+        deleted = delete_chunk(session, Book.id.in_(chunk))
+        counter += deleted
     return counter
 
 
+def books_filter(
+    id_range: Optional[Sequence[int]] = None,
+    author: Optional[Sequence[str]] = None,
+    years: Optional[Sequence[int]] = None,
+) -> ColumnElement:
+    """Condition of books in all given selections, the author is found by its keys"""
+    conditions = []
+    if id_range is not None:
+        conditions.append(Book.id.between(*id_range))
+    if author is not None:
+        first_name, last_name = author
+        authors = select(Author.id).where(
+            Author.first_name_key == normalize_key(first_name),
+            Author.last_name_key == normalize_key(last_name),
+        )
+        conditions.append(Book.author_id.in_(authors))
+    if years is not None:
+        conditions.append(Book.year.between(*years))
+    if not conditions:
+        raise ValueError("No books are selected for deletion")
+    return and_(*conditions)
+
+
+def delete_chunk(session: Session, condition: ColumnElement) -> int:
+    """Delete books of the condition and commit, the generation is bumped if any"""
+    deleted = session.execute(
+        delete(Book).where(condition).execution_options(synchronize_session=False)
+    ).rowcount
+    if deleted:
+        bump_generation(session)
+    session.commit()
+    logging.debug(f"Deleted chunk of {deleted} books")
+    return deleted
+
+
+def get_generation(session: Session) -> int:
+    """Current generation of the catalog, 0 if books were never changed"""
+    generation = session.execute(
+        select(CatalogGeneration.generation).where(
+            CatalogGeneration.id == GENERATION_ID
+        )
+    ).scalar()
+    return generation or 0
+
+
+def bump_generation(session: Union[Session, Connection]) -> None:
+    """
+    Start a new generation of the catalog with the change, before it is committed.
+    Writers wait for each other on the row of the generation until they commit,
+    so it is bumped last in the transaction, when other rows are already written
+    """
+    statement = insert(CatalogGeneration).values(id=GENERATION_ID, generation=1)
+    session.execute(
+        statement.on_conflict_do_update(
+            index_elements=["id"],
+            set_={"generation": CatalogGeneration.generation + 1},
+        )
+    )
+
+
 def get_or_create(session: Session, model: Base, **kwargs) -> (Base, bool):
     """Find instance with such kwarg in db or Create if not exists"""
     instance = session.query(model).filter_by(**kwargs).first()
@@ -45,28 +197,62 @@ def get_or_create(session: Session, model: Base, **kwargs) -> (Base, bool):
     return instance, False
 
 
-def find_books_and_authors(
-    session: Session,
+def search_filters(
     book_name: str,
     author_first_name: Optional[str],
     author_last_name: Optional[str],
     book_year: Optional[int],
-) -> (Sequence[Book], Optional[Author]):
-    """Find Books and Author of books in DB"""
-    query_param = [
-        Book.name == book_name,
-        (Book.year == book_year) if book_year is not None else None,
-        Book.author.has(
-            Author.first_name == author_first_name
-            and Author.last_name == author_last_name
-        )
-        if author_first_name is not None and author_last_name is not None
+) -> list[ColumnElement]:
+    """
+    Conditions of the search by normalized names, so case and punctuation do not
+    matter, author is searched by both names only
+    """
+    filters = [Book.name_key == normalize_key(book_name)]
+    if book_year is not None:
+        filters.append(Book.year == book_year)
+    if author_first_name is not None and author_last_name is not None:
+        filters += [
+            Author.first_name_key == normalize_key(author_first_name),
+            Author.last_name_key == normalize_key(author_last_name),
+        ]
+    return filters
+
+
+def search_query(
+    book_name: str,
+    author_first_name: Optional[str],
+    author_last_name: Optional[str],
+    book_year: Optional[int],
+    primary_key: bool,
+) -> Select:
+    """One SELECT of ids of found books, or of columns of books with their authors"""
+    columns = (
+        [Book.id]
+        if primary_key
+        else [Book.name, Book.year, Author.first_name, Author.last_name]
+    )
+    return (
+        select(*columns)
+        .outerjoin(Author, Book.author_id == Author.id)
+        .where(
+            *search_filters(book_name, author_first_name, author_last_name, book_year)
+        )
+        .order_by(Book.id)
+    )
+
+
+def found_book_as_dict(row: Row) -> dict:
+    """Found book like Book.as_dict, author is None for a book without author"""
+    return {
+        "name": row.name,
+        "year": row.year,
+        "author": {"first_name": row.first_name, "last_name": row.last_name}
+        if row.first_name is not None
         else None,
-    ]
-    query_param = filter(lambda x: x is not None, query_param)
-    return session.query(Book).filter(*query_param).all()
+    }
 
 
+@staged("db")
 def get_books_from_db(
     session: Session,
     book_name: str,
@@ -75,75 +261,767 @@ def get_books_from_db(
     book_year: Optional[int],
     primary_key: bool,
 ):
-    """Find Books in DB and convert it into dict"""
+    """Find Books in DB with one query, only ids or columns of the output are selected"""
 
     logging.debug("Searching book in db")
-    books = find_books_and_authors(
-        session, book_name, author_first_name, author_last_name, book_year
+    rows = session.execute(
+        search_query(
+            book_name, author_first_name, author_last_name, book_year, primary_key
+        )
     )
     if primary_key:
-        return [book.id for book in books]
-    return [book.as_dict for book in books]
+        return rows.scalars().all()
+    return [found_book_as_dict(row) for row in rows]
 
 
-def create_books_and_authors(session: Session, data: Sequence[dict], update_flag: bool):
-    """Creating Books and Authors if they do not exists in DB"""
+def get_books_cached(
+    session: Session,
+    cache: Optional[ResultCache],
+    book_name: str,
+    author_first_name: Optional[str],
+    author_last_name: Optional[str],
+    book_year: Optional[int],
+    primary_key: bool,
+):
+    """
+    Find Books like get_books_from_db does, results are cached for the current
+    generation of the catalog, so a cached result is never stale
+    """
+    search = (book_name, author_first_name, author_last_name, book_year, primary_key)
+    if cache is None:
+        return get_books_from_db(session, *search)
+    key = search_cache_key(*search)
+    generation = get_generation(session)
+    books = cache.get(key, generation)
+    if books is None:
+        books = get_books_from_db(session, *search)
+        cache.put(key, generation, books)
+    return books
 
-    authors = create_all_authors(session, data)
-    create_all_books(session, data, authors, update_flag)
 
+def search_cache_key(
+    book_name: str,
+    author_first_name: Optional[str],
+    author_last_name: Optional[str],
+    book_year: Optional[int],
+    primary_key: bool,
+) -> str:
+    """
+    Key of the search by normalized names, the same books are found by searches
+    with the same key
 
-def create_all_authors(
-    session: Session, data: Sequence[dict]
-) -> Iterable[Optional[Author]]:
-    """Creating Authors if they do not exists in DB"""
+    >>> search_cache_key("Будем знакомы!", "Ёжик", None, 2021, False)
+    '["будем знакомы", null, null, 2021, false]'
+    """
+    author = [None, None]
+    if author_first_name is not None and author_last_name is not None:
+        author = [normalize_key(author_first_name), normalize_key(author_last_name)]
+    return json.dumps(
+        [normalize_key(book_name), *author, book_year, primary_key], ensure_ascii=False
+    )
 
-    def get_author(book_info):
-        if book_info["author_first_name"] is None:
-            return None
-        kwargs = {
-            "first_name": book_info["author_first_name"],
-            "last_name": book_info["author_last_name"],
-        }
-        return get_or_create(session, Author, **kwargs)[0]
 
-    return map(get_author, data)
+def author_full_name() -> ColumnElement:
+    """Full name of the author, the same expression as the one of its trigram index"""
+    return Author.first_name + " " + Author.last_name
 
 
-def create_all_books(
+def fuzzy_search_query(
+    book_name: str,
+    author_first_name: Optional[str],
+    author_last_name: Optional[str],
+    book_year: Optional[int],
+    primary_key: bool,
+    limit: int,
+) -> Select:
+    """
+    SELECT of books whose names have words similar to book_name, the most similar first.
+    Words are compared by trigrams with the %> operator of pg_trgm, which is backed
+    by GIN indexes of book names and author full names, so typos and parts of
+    names are found without reading the whole table
+    """
+    rank = func.word_similarity(book_name, Book.name)
+    filters = [Book.name.op("%>")(book_name)]
+    if book_year is not None:
+        filters.append(Book.year == book_year)
+    if author_first_name is not None and author_last_name is not None:
+        author = f"{author_first_name} {author_last_name}"
+        filters.append(author_full_name().op("%>")(author))
+        rank = rank + func.word_similarity(author, author_full_name())
+    columns = (
+        [Book.id]
+        if primary_key
+        else [Book.name, Book.year, Author.first_name, Author.last_name]
+    )
+    return (
+        select(*columns)
+        .outerjoin(Author, Book.author_id == Author.id)
+        .where(*filters)
+        .order_by(rank.desc(), Book.id)
+        .limit(limit)
+    )
+
+
+@staged("db")
+def get_books_fuzzy_from_db(
     session: Session,
-    data: Sequence[dict],
-    authors: Iterable[Optional[Author]],
+    book_name: str,
+    author_first_name: Optional[str],
+    author_last_name: Optional[str],
+    book_year: Optional[int],
+    primary_key: bool,
+    limit: int = FUZZY_LIMIT,
+):
+    """Find up to limit Books with names similar to book_name, the most similar first"""
+
+    logging.debug("Searching similar books in db")
+    rows = session.execute(
+        fuzzy_search_query(
+            book_name,
+            author_first_name,
+            author_last_name,
+            book_year,
+            primary_key,
+            limit,
+        )
+    )
+    if primary_key:
+        return rows.scalars().all()
+    return [found_book_as_dict(row) for row in rows]
+
+
+@staged("db")
+def get_books_batch_from_db(
+    session: Session, queries: Sequence[dict], primary_key: bool
+) -> list[list]:
+    """
+    Find books of many queries with one SELECT, the queries are joined as unnest arrays.
+    Every query is searched like get_books_from_db does it
+
+    :return found books or ids of every query, in the order of queries
+    """
+    found = [[] for _ in queries]
+    if not queries:
+        return found
+    rows = unnest(
+        [(ordinal, *search_keys(query)) for ordinal, query in enumerate(queries)],
+        Column("ordinal", Integer),
+        Book.name_key,
+        Author.first_name_key,
+        Author.last_name_key,
+        Book.year,
+    )
+    columns = (
+        [Book.id]
+        if primary_key
+        else [Book.name, Book.year, Author.first_name, Author.last_name]
+    )
+    result = session.execute(
+        select(rows.c.ordinal, *columns)
+        .join(Book, batch_search_matches(rows))
+        .outerjoin(Author, Book.author_id == Author.id)
+        .where(batch_author_matches(rows))
+        .order_by(rows.c.ordinal, Book.id)
+    )
+    for row in result:
+        found[row.ordinal].append(row.id if primary_key else found_book_as_dict(row))
+    return found
+
+
+def search_keys(query: dict) -> tuple:
+    """
+    Normalized names and the year of the query, in the order of SEARCH_FIELDS
+
+    >>> search_keys({"name": "Будем знакомы!", "author_first_name": "Ёжик", "year": 1})
+    ('будем знакомы', 'ежик', None, 1)
+    """
+    *names, year = SEARCH_FIELDS
+    return (*(optional_key(query.get(field)) for field in names), query.get(year))
+
+
+def batch_search_matches(rows: TableValuedAlias) -> ColumnElement:
+    """Condition of the book having the name and the year of the query, if it has year"""
+    return and_(
+        Book.name_key == rows.c.name_key,
+        or_(rows.c.year.is_(None), Book.year == rows.c.year),
+    )
+
+
+def batch_author_matches(rows: TableValuedAlias) -> ColumnElement:
+    """Condition of the author having both names of the query, if it has both of them"""
+    return or_(
+        rows.c.first_name_key.is_(None),
+        rows.c.last_name_key.is_(None),
+        and_(
+            Author.first_name_key == rows.c.first_name_key,
+            Author.last_name_key == rows.c.last_name_key,
+        ),
+    )
+
+
+def create_books_and_authors(
+    session: Session,
+    data: Iterable[dict],
     update_flag: bool,
+    cache: Optional["IngestCache"] = None,
+    with_files: bool = False,
+    batch_size: int = BATCH_SIZE,
+    on_commit: Optional[Callable[[Session, int, int], None]] = None,
 ):
-    """Creating Books if they do not exists in DB else update it, if update_flag is True"""
-    cr, up = 0, 0
-
-    for book_data, author in zip(data, authors):
-        book_kwargs = {
-            "name": book_data["name"],
-            "year": book_data["year"],
-            "author_id": author.id if author is not None else None,
-        }
-        book, not_created = get_or_create(session, Book, **book_kwargs)
-        if not_created:
-            up += update_if_update_flag(session, book, book_data, update_flag)
-        else:
-            cr += 1
-            logging.debug(f"Saving info about book: {book.as_dict}")
+    """
+    Creating Books and Authors if they do not exists in DB, batch_size books at a time.
+    Authors and books found in cache are not looked up in DB again.
+    If with_files, files of the books are saved into the manifest with the same commit.
+    on_commit(session, saved batches, saved books) is called before every commit
+    """
+
+    cache = cache if cache is not None else IngestCache()
+    cr, up, saved = 0, 0, 0
+    latencies = []
+    for number, batch in enumerate(batches(data, batch_size), 1):
+        created, updated = save_batch(session, batch, update_flag, cache, with_files)
+        saved += len(batch)
+        if on_commit is not None:
+            on_commit(session, number, saved)
+        latencies.append(commit_batch(session, number, len(batch)))
+        cr, up = cr + created, up + updated
     logging.info(f"Created: {cr} books AND Updated: {up} books")
+    logging.info(f"Ingest cache: {cache}")
+    log_commit_latency(latencies, batch_size)
+
+
+@staged("db")
+def save_batch(
+    session: Session,
+    batch: Sequence[dict],
+    update_flag: bool,
+    cache: "IngestCache",
+    with_files: bool = False,
+) -> (int, int):
+    """
+    Save authors, books and files of the batch without commit. The generation
+    is bumped in the same transaction, so searches see new books with it
+
+    :return (number of created books, number of updated books)
+    """
+    started = perf_counter()
+    authors = create_all_authors(session, batch, cache)
+    created, updated = create_all_books(session, batch, authors, update_flag, cache)
+    if with_files:
+        save_file_manifest(session, batch, authors)
+    if created or updated:
+        bump_generation(session)
+    observe("db_batch_seconds", perf_counter() - started)
+    count_books(len(batch), created, updated)
+    return created, updated
+
+
+def log_commit_latency(latencies: Sequence[float], batch_size: int) -> None:
+    """Log number of committed batches with average and max commit latency"""
+    if latencies:
+        logging.info(
+            f"Committed {len(latencies)} batches of up to {batch_size} books, "
+            f"commit latency: avg {sum(latencies) / len(latencies) * 1000:.1f} ms, "
+            f"max {max(latencies) * 1000:.1f} ms"
+        )
+
+
+@staged("db")
+def commit_batch(session: Session, number: int, size: int) -> float:
+    """Commit the batch and log how long it takes, returns latency in seconds"""
+    started = perf_counter()
+    session.commit()
+    latency = perf_counter() - started
+    observe("db_commit_seconds", latency)
+    logging.debug(
+        f"Batch {number} of {size} books committed in {latency * 1000:.1f} ms"
+    )
+    return latency
+
+
+def count_books(books: int, created: int, updated: int) -> None:
+    """Count created, updated and skipped books of the batch in ingest metrics"""
+    count("books_created", created)
+    count("books_updated", updated)
+    count("books_skipped", max(books - created - updated, 0))
+
 
+def batches(data: Iterable, size: int) -> Iterator[list]:
+    """Split data into lists of size items, the last one may be shorter"""
+    iterator = iter(data)
+    return iter(lambda: list(islice(iterator, size)), [])
 
-def update_if_update_flag(
-    session: Session, book: Book, book_data: dict, update_flag: bool
-) -> bool:
-    """Update Book if update_flag is True"""
 
-    logging.debug(f"Book already exists: {book.as_dict}")
+def create_all_authors(
+    session: Session, data: Sequence[dict], cache: "IngestCache"
+) -> dict[tuple, int]:
+    """
+    Creating Authors if they do not exists in DB, returns ids by keys of their names.
+    An author is saved with the first spelling of its names
+    """
+
+    names = {}
+    for name in filter(None, map(get_author_name, data)):
+        names.setdefault(author_key(name), name)
+    with cache.lock:
+        cached = {key: cache.authors.get(key) for key in names}
+    ids = verify_ids(
+        session, cached, Author, Author.first_name_key, Author.last_name_key
+    )
+    # concurrent writers insert authors in the same order, so they do not deadlock
+    missing = sorted(key for key in names if key not in ids)
+    if missing:
+        ids.update(insert_authors(session, [(*names[key], *key) for key in missing]))
+        with cache.lock:
+            for key in missing:
+                cache.authors.add(key, ids[key])
+    return ids
+
+
+def insert_authors(session: Session, rows: Sequence[tuple]) -> dict[tuple, int]:
+    """
+    Insert authors which do not exist in DB, returns ids of all given authors
+    by keys of their names
+
+    :param rows: [(first_name, last_name, first_name_key, last_name_key), ...]
+    """
+
+    authors = unnest(
+        rows,
+        Author.first_name,
+        Author.last_name,
+        Author.first_name_key,
+        Author.last_name_key,
+    )
+    session.execute(
+        insert(Author)
+        .from_select(
+            ["first_name", "last_name", "first_name_key", "last_name_key"],
+            select(authors),
+        )
+        .on_conflict_do_nothing(index_elements=["first_name_key", "last_name_key"])
+    )
+    found = session.execute(
+        select(Author.id, Author.first_name_key, Author.last_name_key).join(
+            authors,
+            and_(
+                Author.first_name_key == authors.c.first_name_key,
+                Author.last_name_key == authors.c.last_name_key,
+            ),
+        )
+    )
+    return {(first_key, last_key): id_ for id_, first_key, last_key in found}
+
+
+def create_all_books(
+    session: Session,
+    data: Sequence[dict],
+    authors: dict[tuple, int],
+    update_flag: bool,
+    cache: "IngestCache",
+) -> (int, int):
+    """
+    Creating Books if they do not exists in DB else update it, if update_flag is True.
+    Books are the same if they have the same key of the name, year and author
+
+    :return (number of created books, number of updated books)
+    """
+    names = {}
+    for book in data:
+        key = (
+            normalize_key(book["name"]),
+            book["year"],
+            authors.get(get_author_key(book)),
+        )
+        names.setdefault(key, book["name"])
+    # the same book repeated in data is counted as already existing one
+    already_exist = len(data) - len(names)
+    with cache.lock:
+        cached = {key: cache.books.get(key) for key in names}
+    known = verify_ids(session, cached, Book, Book.name_key, Book.year, Book.author_id)
+    new = [key for key in names if key not in known]
+
     if update_flag:
-        logging.debug(f"Updating info about book: {book.as_dict}")
-        book.name = book_data["name"]
-        book.year = book_data["year"]
-        session.commit()
-        return True
-    return False
+        # a book missing in not completely loaded cache may still be in DB
+        to_update = list(known) if cache.complete else list(names)
+        already_exist += update_books(
+            session, [(names[key], *key) for key in to_update]
+        )
+    created = insert_books(session, [(names[key], *key) for key in new])
+    with cache.lock:
+        for key, id_ in created.items():
+            cache.books.add(key, id_)
+    return len(created), already_exist if update_flag else 0
+
+
+def verify_ids(
+    session: Session,
+    cached: dict[tuple, Optional[int]],
+    model: Base,
+    *key_columns: ColumnElement,
+) -> dict[tuple, int]:
+    """
+    Ids of the cache whose rows in DB still have the same keys. The cache keeps
+    hashes of keys only, so a new key colliding with a known one gets the id
+    of another row, it is dropped here and saved like a key missing in the cache
+    """
+    candidates = {key: id_ for key, id_ in cached.items() if id_ is not None}
+    if not candidates:
+        return {}
+    rows = session.execute(
+        select(model.id, *key_columns).where(model.id.in_(set(candidates.values())))
+    )
+    found = {id_: tuple(key) for id_, *key in rows}
+    return {key: id_ for key, id_ in candidates.items() if found.get(id_) == key}
+
+
+def book_matches(books: TableValuedAlias) -> ColumnElement:
+    """Condition of the book row being the same as the one in books"""
+
+    # NULL year or author_id never conflicts in UniqueConstraint, so rows are matched
+    # with IS NOT DISTINCT FROM, ON CONFLICT only guards against concurrent diggers
+    return and_(
+        Book.name_key == books.c.name_key,
+        Book.year.is_not_distinct_from(books.c.year),
+        Book.author_id.is_not_distinct_from(books.c.author_id),
+    )
+
+
+def update_books(session: Session, rows: Sequence[tuple]) -> int:
+    """
+    Update books which exist in DB, returns number of updated books
+
+    :param rows: [(name, name_key, year, author_id), ...]
+    """
+
+    if not rows:
+        return 0
+
+    books = unnest(rows, Book.name, Book.name_key, Book.year, Book.author_id)
+    updated = session.execute(
+        update(Book)
+        .values(name=books.c.name, year=books.c.year)
+        .where(book_matches(books))
+        .returning(Book.id)
+    )
+    return len(updated.all())
+
+
+def insert_books(session: Session, rows: Sequence[tuple]) -> dict[tuple, int]:
+    """
+    Insert books which do not exist in DB, returns ids of created books by their keys
+
+    :param rows: [(name, name_key, year, author_id), ...]
+    """
+
+    if not rows:
+        return {}
+
+    books = unnest(rows, Book.name, Book.name_key, Book.year, Book.author_id)
+    created = session.execute(
+        insert(Book)
+        .from_select(
+            ["name", "name_key", "year", "author_id"],
+            select(books).where(~exists().where(book_matches(books))),
+        )
+        .on_conflict_do_nothing(index_elements=["name_key", "year", "author_id"])
+        .returning(Book.id, Book.name_key, Book.year, Book.author_id)
+    )
+    return {tuple(key): id_ for id_, *key in created}
+
+
+def load_file_manifest(session: Session, dir_path: str) -> dict[str, tuple]:
+    """
+    Load the manifest of files inside of the directory, one row per file.
+    A file is stale if it is missing or any of its books was deleted from DB
+
+    :return {path: (size, mtime_ns, content_hash, stale)}
+    """
+    rows = session.execute(
+        select(
+            FileManifest.path,
+            FileManifest.size,
+            FileManifest.mtime_ns,
+            FileManifest.content_hash,
+            func.bool_or(FileManifest.missing | FileManifest.book_id.is_(None)),
+        )
+        .where(
+            FileManifest.path.startswith(dir_path.rstrip("/") + "/", autoescape=True)
+        )
+        .group_by(
+            FileManifest.path,
+            FileManifest.size,
+            FileManifest.mtime_ns,
+            FileManifest.content_hash,
+        )
+    )
+    return {path: tuple(state) for path, *state in rows}
+
+
+def save_file_manifest(
+    session: Session, data: Sequence[dict], authors: dict[tuple, int]
+) -> None:
+    """Save files of the books into the manifest with ids of the books"""
+
+    rows = [
+        (
+            *(book["file"][key] for key in MANIFEST_FILE_KEYS),
+            normalize_key(book["name"]),
+            book["year"],
+            authors.get(get_author_key(book)),
+        )
+        for book in data
+    ]
+    files = unnest(
+        rows,
+        *(getattr(FileManifest, key) for key in MANIFEST_FILE_KEYS),
+        Book.name_key,
+        Book.year,
+        Book.author_id,
+    )
+    manifest = (
+        select(*(files.c[key] for key in MANIFEST_FILE_KEYS), Book.id)
+        .join(Book, book_matches(files))
+        .distinct(files.c.path, files.c.member)
+    )
+    statement = insert(FileManifest).from_select(
+        [*MANIFEST_FILE_KEYS, "book_id"], manifest
+    )
+    session.execute(
+        statement.on_conflict_do_update(
+            index_elements=["path", "member"],
+            set_={
+                **{key: statement.excluded[key] for key in MANIFEST_FILE_KEYS[2:]},
+                "book_id": statement.excluded.book_id,
+                "missing": False,
+            },
+        )
+    )
+
+
+def touch_file_manifest(session: Session, files: Sequence[dict]) -> int:
+    """Save new mtime of files with unchanged content, returns number of updated rows"""
+
+    if not files:
+        return 0
+
+    touched = unnest(
+        [(file["path"], file["mtime_ns"]) for file in files],
+        FileManifest.path,
+        FileManifest.mtime_ns,
+    )
+    return session.execute(
+        update(FileManifest)
+        .values(mtime_ns=touched.c.mtime_ns)
+        .where(FileManifest.path == touched.c.path)
+    ).rowcount
+
+
+def mark_missing_files(session: Session, paths: Sequence[str]) -> int:
+    """Flag files which were not found by the scan, returns number of flagged rows"""
+
+    if not paths:
+        return 0
+
+    return session.execute(
+        update(FileManifest)
+        .values(missing=True)
+        .where(FileManifest.path.in_(paths), FileManifest.missing.is_(False))
+    ).rowcount
+
+
+def load_checkpoint(session: Session, source: str) -> Optional[IngestCheckpoint]:
+    """Find checkpoint of the unfinished ingest of the source"""
+    return session.query(IngestCheckpoint).filter_by(source=source).first()
+
+
+def save_checkpoint(
+    session: Session,
+    source: str,
+    watermark: tuple[int, int],
+    batches_done: int,
+    books_done: int,
+    file_path: Optional[str] = None,
+) -> None:
+    """Save checkpoint of the ingest of the source, it is committed with the batch"""
+    files_done, parts_done = watermark
+    checkpoint = {
+        "files_done": files_done,
+        "parts_done": parts_done,
+        "file_path": file_path,
+        "batches": batches_done,
+        "books": books_done,
+    }
+    session.execute(
+        insert(IngestCheckpoint)
+        .values(source=source, **checkpoint)
+        .on_conflict_do_update(index_elements=["source"], set_=checkpoint)
+    )
+
+
+def delete_checkpoint(session: Session, source: str) -> None:
+    """Delete checkpoint of the ingest of the source, once it is finished"""
+    session.query(IngestCheckpoint).filter_by(source=source).delete()
+
+
+def get_author_name(book_data: dict) -> Optional[tuple]:
+    """Get (first_name, last_name) of the book author or None if any of them is unknown"""
+    name = book_data["author_first_name"], book_data["author_last_name"]
+    return name if all(name) else None
+
+
+def get_author_key(book_data: dict) -> Optional[tuple]:
+    """Get keys of names of the book author or None if any of them is unknown"""
+    name = get_author_name(book_data)
+    return author_key(name) if name is not None else None
+
+
+def author_key(name: tuple) -> tuple:
+    """
+    Keys of (first_name, last_name), authors with the same keys are the same
+
+    >>> author_key(("Фёдор", "ДОСТОЕВСКИЙ"))
+    ('федор', 'достоевский')
+    """
+    return tuple(map(normalize_key, name))
+
+
+def unnest(rows: Sequence[tuple], *columns: Column) -> TableValuedAlias:
+    """Pass rows as one typed array per column: unnest(CAST(:values AS TYPE[]), ...)"""
+    # arrays are typed without length: CAST to VARCHAR(n) would silently truncate
+    arrays = (
+        cast(literal(list(values)), ARRAY(type(column.type)()))
+        for column, values in zip(columns, zip(*rows))
+    )
+    return (
+        func.unnest(*arrays)
+        .table_valued(*(sql_column(column.name, column.type) for column in columns))
+        .alias()
+    )
+
+
+class HashIndex:
+    """
+    Compact set of keys, or map of keys to ids, for tens of millions of keys.
+    Only 64-bit hashes of keys are kept: in sorted arrays (8 bytes per key and
+    8 more per id) and in a small dict of just added keys, merged into the arrays
+    every CACHE_COMPACT_SIZE keys. A hash collision makes a new key look known,
+    so an id found by the key is a candidate, which is checked by verify_ids.
+    """
+
+    def __init__(self, with_ids: bool = False, max_keys: int = CACHE_MAX_KEYS):
+        self.hashes = array("q")
+        self.ids = array("q") if with_ids else None
+        self.new: dict[int, int] = {}
+        self.max_keys = max_keys
+
+    def __len__(self) -> int:
+        return len(self.hashes) + len(self.new)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not None
+
+    @property
+    def full(self) -> bool:
+        return len(self) >= self.max_keys
+
+    @property
+    def memory_usage(self) -> int:
+        """Approximate number of bytes taken by the index"""
+        ids = self.ids.itemsize * len(self.ids) if self.ids is not None else 0
+        return self.hashes.itemsize * len(self.hashes) + ids + sys.getsizeof(self.new)
+
+    def get(self, key: Hashable) -> Optional[int]:
+        """Get id of the key, 0 for a known key without id, None for an unknown key"""
+        key_hash = hash(key)
+        if key_hash in self.new:
+            return self.new[key_hash]
+        index = bisect_left(self.hashes, key_hash)
+        if index < len(self.hashes) and self.hashes[index] == key_hash:
+            return self.ids[index] if self.ids is not None else 0
+        return None
+
+    def partition(self, keys: Iterable[Hashable]) -> (list, list):
+        """Split keys into known and unknown ones"""
+        known, unknown = [], []
+        for key in keys:
+            (known if key in self else unknown).append(key)
+        return known, unknown
+
+    def add(self, key: Hashable, id_: int = 0) -> None:
+        """Add key if the index is not full yet"""
+        if self.full:
+            return
+        self.new[hash(key)] = id_
+        if len(self.new) >= CACHE_COMPACT_SIZE:
+            self.merge(sorted(self.new.items()))
+            self.new = {}
+
+    def merge(self, *runs: Iterable[tuple[int, int]]) -> None:
+        """Merge runs of (hash, id) sorted by hash into the sorted arrays"""
+        with_ids = self.ids is not None
+        current = zip(self.hashes, self.ids if with_ids else repeat(0))
+        hashes, ids = array("q"), array("q")
+        for key_hash, id_ in merge(current, *runs):
+            hashes.append(key_hash)
+            if with_ids:
+                ids.append(id_)
+        self.hashes, self.ids = hashes, ids if with_ids else None
+
+
+class IngestCache:
+    """
+    Ids of authors and books known to be in DB by their keys, kept for one ingest.
+    Ids are checked against DB before use, keys are kept as hashes only
+    """
+
+    def __init__(self, max_keys: int = CACHE_MAX_KEYS):
+        self.authors = HashIndex(with_ids=True, max_keys=max_keys)
+        self.books = HashIndex(with_ids=True, max_keys=max_keys)
+        # when all rows of DB are loaded, a book missing in cache is a new one
+        self.complete = False
+        # the cache is shared by writer threads of BookPipeline
+        self.lock = Lock()
+
+    @classmethod
+    def load(cls, session: Session, max_keys: int = CACHE_MAX_KEYS) -> "IngestCache":
+        """Load keys of all authors and books from DB, up to max_keys of each"""
+        cache = cls(max_keys)
+        load_index(
+            session,
+            cache.authors,
+            Author.first_name_key,
+            Author.last_name_key,
+            Author.id,
+        )
+        load_index(
+            session, cache.books, Book.name_key, Book.year, Book.author_id, Book.id
+        )
+        cache.complete = not cache.authors.full and not cache.books.full
+        logging.info(f"Loaded ingest cache: {cache}")
+        return cache
+
+    def __str__(self) -> str:
+        memory = (self.authors.memory_usage + self.books.memory_usage) / 2 ** 20
+        full = ", full" if self.authors.full or self.books.full else ""
+        return f"{len(self.authors)} authors, {len(self.books)} books, {memory:.1f} MiB{full}"
+
+
+def load_index(session: Session, index: HashIndex, *columns: ColumnElement) -> None:
+    """
+    Load rows of (*key columns, id column) into the index. Rows are streamed and
+    sorted CACHE_LOAD_SIZE at a time, then merged, so memory stays close to index size
+    """
+    rows = session.execute(
+        select(*columns).limit(index.max_keys).execution_options(stream_results=True)
+    )
+    runs = [sorted_run(part) for part in rows.partitions(CACHE_LOAD_SIZE)]
+    index.merge(*(zip(hashes, ids) for hashes, ids in runs))
+
+
+def sorted_run(rows: Sequence[tuple]) -> tuple[array, array]:
+    """Hashes of keys and ids of (*key, id) rows sorted by hash"""
+    run = sorted((hash(tuple(key)), id_) for *key, id_ in rows)
+    hashes = array("q", (key_hash for key_hash, _ in run))
+    ids = array("q", (id_ for _, id_ in run))
+    return hashes, ids
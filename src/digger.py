@@ -1,18 +1,61 @@
+from __future__ import annotations
+
+import configparser
 import logging
 import os
 import sys
-from argparse import ArgumentParser, ArgumentTypeError
+from argparse import ArgumentParser, ArgumentTypeError, Namespace
 from pathlib import Path
-from typing import Sequence, Union
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Iterable,
+    Iterator,
+    Mapping,
+    Optional,
+    Sequence,
+    Union,
+)
+
+from services.catalog_client import SERVER_URL, ServerError, call_server
+from services.cli_args import RequestParser, request_argv
+from services.metrics import METRICS_INTERVAL, collecting
+from services.startup import (
+    BACKEND_NAMES,
+    BATCH_SIZE,
+    DEFAULT_BACKEND,
+    FILE_EXTENSIONS,
+    setup_logging,
+)
+
+if TYPE_CHECKING:
+    from db.core import Session
+    from services.manifest import ManifestScan
+    from services.progress import IngestProgress
 
-from db.core import session_scope
-from db.services import create_books_and_authors
-from services.parse_book_from_file import FILE_EXTENSIONS, find_books
+# args of the run of digger itself, they are not sent to the catalog server
+CLIENT_ARGS = ("server", "profile", "metrics_jsonl", "metrics_prom", "metrics_interval")
 
 
-def parse_args(_args: Sequence[str]) -> ArgumentParser.__class__:
-    """Create parser with args (-s, -a, -u) and parse args with the created parser"""
-    parser = ArgumentParser(description="Save books in db")
+def parse_args(
+    _args: Sequence[str], parser_class: type[ArgumentParser] = ArgumentParser
+) -> ArgumentParser.__class__:
+    """Create parser of parser_class and parse args with the created parser"""
+    parser = create_parser(parser_class)
+    args = parser.parse_args(_args)
+    validate_args(parser, args)
+    return args
+
+
+def create_parser(
+    parser_class: type[ArgumentParser] = ArgumentParser,
+) -> ArgumentParser:
+    """
+    Create parser with args (-s, -a, -u, --parser, --copy, --rescan, --mark-missing,
+    --batch-size, --resume, --writers, --server, --profile, --metrics-jsonl,
+    --metrics-prom, --metrics-interval)
+    """
+    parser = parser_class(description="Save books in db")
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument(
         "-s",
@@ -34,7 +77,149 @@ def parse_args(_args: Sequence[str]) -> ArgumentParser.__class__:
         "If the -u flag is given, then we update the information about the book.\n"
         "If the -u flag is absent, then the information is not updated ",
     )
-    return parser.parse_args(_args)
+    parser.add_argument(
+        "--parser",
+        dest="xml_parser",
+        choices=BACKEND_NAMES,
+        help="XML backend used to parse books, "
+        "default is XML_PARSER from [digger] section of config.ini or defusedxml",
+    )
+    parser.add_argument(
+        "--copy",
+        dest="copy",
+        action="store_true",
+        help="Load books with PostgreSQL COPY through a staging table, "
+        "fast for initial loads of a whole library",
+    )
+    parser.add_argument(
+        "--rescan",
+        dest="rescan",
+        action="store_true",
+        help="Parse every file of the folder, even if it is unchanged since the last run",
+    )
+    parser.add_argument(
+        "--mark-missing",
+        dest="mark_missing",
+        action="store_true",
+        help="Flag files of the folder which are saved in the manifest but were not found",
+    )
+    parser.add_argument(
+        "--batch-size",
+        dest="batch_size",
+        type=validate_batch_size,
+        default=get_batch_size_from_config(),
+        help="Books saved in one transaction, "
+        f"default is BATCH_SIZE from [digger] section of config.ini or {BATCH_SIZE}",
+    )
+    parser.add_argument(
+        "--resume",
+        dest="resume",
+        action="store_true",
+        help="Continue the interrupted run from its checkpoint, "
+        "files saved by that run are not parsed again",
+    )
+    parser.add_argument(
+        "--writers",
+        dest="writers",
+        type=validate_writers,
+        default=get_writers_from_config(),
+        help="Threads saving books into DB, each with its own connection, "
+        "default is WRITERS from [digger] section of config.ini or 1",
+    )
+    parser.add_argument(
+        "--server",
+        dest="server",
+        nargs="?",
+        const=SERVER_URL,
+        help=f"Save books by the catalog server at this url, default is {SERVER_URL}",
+    )
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        help="Write cProfile of the run into this file, "
+        "with wall and CPU time of stages into PROFILE.stages.json",
+    )
+    parser.add_argument(
+        "--metrics-jsonl",
+        dest="metrics_jsonl",
+        help="Append ingest metrics to this file as JSON lines, "
+        "while the ingest runs and after it",
+    )
+    parser.add_argument(
+        "--metrics-prom",
+        dest="metrics_prom",
+        help="Write ingest metrics into this file in the Prometheus text format, "
+        "for the textfile collector of node_exporter",
+    )
+    parser.add_argument(
+        "--metrics-interval",
+        dest="metrics_interval",
+        type=validate_interval,
+        default=METRICS_INTERVAL,
+        help=f"Seconds between live metrics, default is {METRICS_INTERVAL}",
+    )
+    return parser
+
+
+def validate_args(parser: ArgumentParser, args: Namespace) -> None:
+    """
+    Take XML backend from config.ini if --parser is not given, argparse does not
+    check defaults against choices, so the name of config.ini is checked here
+    """
+    if args.xml_parser is None:
+        args.xml_parser = get_xml_parser_from_config()
+        if args.xml_parser not in BACKEND_NAMES:
+            parser.error(
+                f"XML_PARSER `{args.xml_parser}` of config.ini is not one of "
+                f"{', '.join(BACKEND_NAMES)}"
+            )
+
+
+def get_digger_config() -> Mapping[str, str]:
+    """Read [digger] section of config.ini"""
+    config = configparser.ConfigParser()
+    config.read("config.ini")
+    return config["digger"] if "digger" in config else {}
+
+
+def get_xml_parser_from_config() -> str:
+    """Read name of XML backend for books from config.ini"""
+    return get_digger_config().get("XML_PARSER", DEFAULT_BACKEND)
+
+
+def get_batch_size_from_config() -> int:
+    """Read number of books saved in one transaction from config.ini"""
+    return int(get_digger_config().get("BATCH_SIZE", BATCH_SIZE))
+
+
+def get_writers_from_config() -> int:
+    """Read number of threads saving books into DB from config.ini"""
+    return int(get_digger_config().get("WRITERS", 1))
+
+
+def validate_batch_size(value: str) -> int:
+    """Validate if batch size is a positive number"""
+    if value.isdigit() and int(value) > 0:
+        return int(value)
+    raise ArgumentTypeError(f"`{value}` is not a valid batch size")
+
+
+def validate_writers(value: str) -> int:
+    """Validate if number of writers is a positive number"""
+    if value.isdigit() and int(value) > 0:
+        return int(value)
+    raise ArgumentTypeError(f"`{value}` is not a valid number of writers")
+
+
+def validate_interval(value: str) -> float:
+    """Validate if interval is a positive number of seconds"""
+    try:
+        interval = float(value)
+    except ValueError:
+        interval = 0
+    if interval > 0:
+        return interval
+    raise ArgumentTypeError(f"`{value}` is not a valid interval")
 
 
 def validate_dir_path(path: Union[str, Path]) -> Path:
@@ -56,16 +241,204 @@ def validate_file_path(path: Union[str, Path]) -> Path:
         raise ArgumentTypeError(f"`{path}` is not a valid path to file")
 
 
+def start_manifest_scan(args) -> Optional[ManifestScan]:
+    """Load the manifest of the folder to parse only new and changed files"""
+    if args.dir_path is None:
+        return None
+    from db.core import session_scope
+    from db.services import load_file_manifest
+    from services.manifest import ManifestScan
+
+    dir_path = os.path.abspath(args.dir_path)
+    with session_scope() as session:
+        known = load_file_manifest(session, dir_path)
+    logging.debug(f"Loaded manifest of {len(known)} files")
+    return ManifestScan(dir_path, known, args.rescan)
+
+
+def finish_manifest_scan(args, scan: Optional[ManifestScan]) -> None:
+    """Save new mtime of touched files and flag missing files in the manifest"""
+    if scan is None:
+        return
+    from db.core import session_scope
+    from db.services import mark_missing_files, touch_file_manifest
+
+    with session_scope() as session:
+        touch_file_manifest(session, scan.touched)
+        if args.mark_missing:
+            flagged = mark_missing_files(session, scan.missing)
+            logging.info(f"Flagged {flagged} missing files")
+
+
+def get_source(args) -> str:
+    """Absolute path of the folder or the book, the checkpoint of its ingest is kept by"""
+    return os.path.abspath(
+        args.dir_path if args.dir_path is not None else args.book_path
+    )
+
+
+def start_progress(args) -> (IngestProgress, int, int):
+    """
+    Load the checkpoint of the interrupted run, if it is resumed
+
+    :return (progress, number of batches saved before, number of books saved before)
+    """
+    from db.core import session_scope
+    from db.services import load_checkpoint
+    from services.progress import IngestProgress, walk_matches
+
+    if not args.resume:
+        return IngestProgress(), 0, 0
+    with session_scope() as session:
+        checkpoint = load_checkpoint(session, get_source(args))
+        if checkpoint is None:
+            logging.info("Checkpoint not Found, starting from the beginning")
+            return IngestProgress(), 0, 0
+        skip = (checkpoint.files_done, checkpoint.parts_done)
+        if not walk_matches(walk_files(args), skip, checkpoint.file_path):
+            logging.warning(
+                f"Files were added or removed before {checkpoint.file_path} "
+                "since the checkpoint, starting from the beginning"
+            )
+            return IngestProgress(), 0, 0
+        logging.info(
+            f"Resuming after {checkpoint.files_done} files "
+            f"and {checkpoint.parts_done} parts, {checkpoint.books} books saved"
+        )
+        return IngestProgress(skip), checkpoint.batches, checkpoint.books
+
+
+def walk_files(args) -> Iterator[str]:
+    """Files of the ingest in the walk order, like find_books numbers them"""
+    from services.file_extraction import get_files_from_dir
+
+    if args.dir_path is not None:
+        return get_files_from_dir(args.dir_path)
+    return iter([str(args.book_path)])
+
+
+def checkpoint_saver(
+    args, progress: IngestProgress, batches_before: int, books_before: int
+) -> Callable[[Session, int, int], None]:
+    """Make on_commit callback, which saves the checkpoint with every batch"""
+    from db.services import save_checkpoint
+
+    source = get_source(args)
+
+    def on_commit(session: Session, batches_done: int, books_done: int) -> None:
+        watermark, file_path = progress.checkpoint
+        save_checkpoint(
+            session,
+            source,
+            watermark,
+            batches_before + batches_done,
+            books_before + books_done,
+            file_path,
+        )
+
+    return on_commit
+
+
+def save_books(
+    args,
+    books: Iterable[dict],
+    with_files: bool,
+    on_commit: Optional[Callable[[Session, int, int], None]] = None,
+) -> None:
+    """Save books as soon as they are parsed"""
+    from db.core import get_engine, session_scope
+    from db.services import IngestCache, create_books_and_authors, delete_checkpoint
+
+    if args.copy:
+        from db.copy_load import copy_books_and_authors
+
+        # one transaction, there is no checkpoint to resume from
+        with get_engine().begin() as connection:
+            copy_books_and_authors(connection, books, args.flag, with_files)
+        return
+    with session_scope() as session:
+        # a whole catalog is mostly known books on reruns, one book is not worth it
+        cache = IngestCache.load(session) if args.dir_path is not None else None
+        if args.writers > 1:
+            from db.pipeline import BookPipeline
+
+            pipeline = BookPipeline(
+                args.flag, cache, with_files, args.batch_size, args.writers, on_commit
+            )
+            pipeline.run(books)
+        else:
+            # the pool keeps parsing while the only writer saves a batch
+            create_books_and_authors(
+                session, books, args.flag, cache, with_files, args.batch_size, on_commit
+            )
+        delete_checkpoint(session, get_source(args))
+
+
 def main():
+    setup_logging()
     logging.debug(f"Called {sys.argv[0]} with {sys.argv[1:]}")
     args = parse_args(sys.argv[1:])
-    books = find_books(args.dir_path, args.book_path)
+    if args.server is not None:
+        ingest_by_server(args)
+        return
+    # cProfile and multiprocessing are imported only by runs which parse books
+    from services.profiling import profiling
+
+    with profiling(args.profile), collecting(
+        args.metrics_jsonl, args.metrics_prom, args.metrics_interval
+    ):
+        ingest(args)
+
+
+def ingest_by_server(args) -> None:
+    """Send the ingest to the catalog server and wait until it is done"""
+    try:
+        result = call_server(args.server, "ingest", ingest_request(args))
+    except ServerError as err:
+        logging.error(err)
+        sys.exit(1)
+    logging.info(f"Saved books of {result['source']} in {result['elapsed_s']} s")
+
+
+def ingest_request(args) -> dict:
+    """Args of the ingest, like the catalog server receives them, paths are absolute"""
+    request = {
+        key: value for key, value in vars(args).items() if key not in CLIENT_ARGS
+    }
+    for key in ("dir_path", "book_path"):
+        if request[key] is not None:
+            request[key] = os.path.abspath(request[key])
+    return request
+
+
+def ingest_args(request: dict) -> Namespace:
+    """
+    Args of the ingest requested from the catalog server, validated by parse_args
+    like args of digger are, args which are not requested are default ones
+    """
+    argv = request_argv(create_parser(), request, exclude=CLIENT_ARGS)
+    return parse_args(argv, RequestParser)
+
+
+def ingest(args, start_method: Optional[str] = None) -> None:
+    """
+    Parse books given by args and save them as soon as they are parsed,
+    by processes of start_method, the default one of the platform if None
+    """
+    from services.parse_book_from_file import find_books
+
+    scan = start_manifest_scan(args)
+    progress, batches_before, books_before = start_progress(args)
+    books = find_books(
+        args.dir_path, args.book_path, args.xml_parser, scan, progress, start_method
+    )
     if books is None:
         logging.info("Book not Found")
         return
-    logging.debug(f"Saving {len(books)} books")
-    with session_scope() as session:
-        create_books_and_authors(session, books, args.flag)
+    logging.debug("Saving books as soon as they are parsed")
+    on_commit = checkpoint_saver(args, progress, batches_before, books_before)
+    save_books(args, books, scan is not None, on_commit)
+    finish_manifest_scan(args, scan)
 
 
 if __name__ == "__main__":
@@ -1,16 +1,37 @@
+from __future__ import annotations
+
+import json
 import logging
 import sys
-from argparse import ArgumentParser
+from argparse import ArgumentParser, ArgumentTypeError, Namespace
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterator, Optional, Sequence, TextIO
+
+from services.batch_queries import QUERY_FORMATS, parse_query, read_queries
+from services.catalog_client import SERVER_URL, ServerError, call_server
+from services.cli_args import open_input, validate_chunk_size
+from services.result_cache import ResultCache, caching
+from services.startup import FUZZY_LIMIT, SEARCH_CHUNK_SIZE, setup_logging
 
-from db.core import session_scope
-from db.services import get_books_from_db
+if TYPE_CHECKING:
+    from db.core import Session
 
 
 def parse_args(_args):
-    """Create parser with args (-a, -n, -y -s) and parse args with the created parser"""
+    """
+    Create parser with args (-a, -n, -y -s, --fuzzy, --limit, --cache, --batch,
+    --format, --chunk-size, --server, --profile) and parse args with the created parser
+    """
     parser = ArgumentParser(description="Find books in db")
-    parser.add_argument(
-        "-n", type=str, dest="book_name", required=True, help="Book name", nargs="+"
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("-n", type=str, dest="book_name", help="Book name", nargs="+")
+    group.add_argument(
+        "--batch",
+        dest="batch",
+        help="Find books of every query of this NDJSON or CSV file, - is stdin. "
+        "Queries have fields name, author_first_name, author_last_name and year, "
+        "results are written to stdout as NDJSON lines in the order of queries",
     )
     parser.add_argument(
         "-a",
@@ -35,32 +56,203 @@ def parse_args(_args):
         "If the -s flag is given, then we return book primary key"
         "If the -s flag is absent, then we return book",
     )
-    return parser.parse_args(_args)
+    parser.add_argument(
+        "--fuzzy",
+        dest="fuzzy",
+        action="store_true",
+        help="Find books whose name and author have words similar to the given ones: "
+        "with typos, without punctuation or by a part of the name. "
+        "Books are returned from the most similar one",
+    )
+    parser.add_argument(
+        "--limit",
+        dest="limit",
+        type=validate_limit,
+        default=FUZZY_LIMIT,
+        help=f"Books found by --fuzzy, default is {FUZZY_LIMIT}",
+    )
+    parser.add_argument(
+        "--cache",
+        dest="cache",
+        help="Keep found books in this file between runs, they are found again "
+        "only after digger or wiper change books. Hits and misses are logged",
+    )
+    parser.add_argument(
+        "--format",
+        dest="query_format",
+        choices=QUERY_FORMATS,
+        help="Format of --batch queries, default is csv for .csv files, else ndjson",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        dest="chunk_size",
+        type=validate_chunk_size,
+        default=SEARCH_CHUNK_SIZE,
+        help=f"Queries of --batch searched by one SELECT, default is {SEARCH_CHUNK_SIZE}",
+    )
+    parser.add_argument(
+        "--server",
+        dest="server",
+        nargs="?",
+        const=SERVER_URL,
+        help=f"Find books by the catalog server at this url, default is {SERVER_URL}",
+    )
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        help="Write cProfile of the run into this file, "
+        "with wall and CPU time of stages into PROFILE.stages.json",
+    )
+    args = parser.parse_args(_args)
+    validate_args(parser, args)
+    return args
+
+
+def validate_args(parser: ArgumentParser, args: Namespace) -> None:
+    """Exit with an error if args can not be used together"""
+    if args.batch is not None:
+        validate_batch_args(parser, args)
+    elif args.cache is not None and (args.fuzzy or args.server is not None):
+        parser.error("--cache can not be used with --fuzzy or --server")
+
+
+def validate_batch_args(parser: ArgumentParser, args: Namespace) -> None:
+    """Exit with an error if args can not be used with --batch"""
+    if args.author is not None or args.year is not None:
+        parser.error("-a and -y are given by fields of --batch queries")
+    if args.fuzzy:
+        parser.error("--fuzzy can not be used with --batch")
+    if args.cache is not None:
+        parser.error("--cache can not be used with --batch")
+
+
+def validate_limit(value: str) -> int:
+    """Validate if limit is a positive number"""
+    if value.isdigit() and int(value) > 0:
+        return int(value)
+    raise ArgumentTypeError(f"`{value}` is not a valid limit")
 
 
 def main():
+    setup_logging()
     logging.debug(f"Called {sys.argv[0]} with {sys.argv[1:]}")
 
     args = parse_args(sys.argv[1:])
+    # cProfile is imported only by runs which search books
+    from services.profiling import profiling
+
+    try:
+        with profiling(args.profile):
+            if args.batch is not None:
+                find_books_batch(args)
+            else:
+                find_books(args)
+    except ServerError as err:
+        logging.error(err)
+        sys.exit(1)
+
+
+def find_books(args) -> None:
+    """Find books by args, in DB or by the catalog server, and log them"""
+    request = search_request(args)
+    if args.server is not None:
+        books = call_server(args.server, "search", request)["books"]
+    else:
+        from db.core import session_scope
+
+        with caching(args.cache) as cache, session_scope() as session:
+            books = search_books(session, cache, request)
+    if not books:
+        logging.info("Book Not Found")
+    for book in books:
+        logging.info(f"Book: {book}")
 
-    book_name = " ".join(args.book_name)
-    author_first_name, author_last_name = None, None
-    if args.author is not None:
-        author_first_name, author_last_name = args.author
+
+def search_request(args) -> dict:
+    """Search of args, like the catalog server receives it"""
+    author_first_name, author_last_name = args.author or (None, None)
+    return {
+        "name": " ".join(args.book_name),
+        "author_first_name": author_first_name,
+        "author_last_name": author_last_name,
+        "year": args.year,
+        "primary_key": args.primary_key_flag,
+        "fuzzy": args.fuzzy,
+        "limit": args.limit,
+    }
+
+
+def search_books(session: Session, cache: Optional[ResultCache], request: dict) -> list:
+    """Find books of the search request, exact searches are found through the cache"""
+    from db.services import SEARCH_FIELDS, get_books_cached, get_books_fuzzy_from_db
+
+    query = parse_query(request)
+    search = (
+        *(query[field] for field in SEARCH_FIELDS),
+        bool(request.get("primary_key")),
+    )
+    if request.get("fuzzy"):
+        limit = request.get("limit") or FUZZY_LIMIT
+        return get_books_fuzzy_from_db(session, *search, limit)
+    return get_books_cached(session, cache, *search)
+
+
+def find_books_batch(args, output: TextIO = sys.stdout) -> None:
+    """
+    Find books of all queries of the batch over one connection, chunk_size queries
+    by one SELECT, and write results as soon as a chunk is found
+    """
+    from db.services import batches
+
+    query_format = args.query_format or get_query_format(args.batch)
+    key = "ids" if args.primary_key_flag else "books"
+    lines = 0
+    with open_input(args.batch) as file, batch_search(args) as search:
+        for chunk in batches(read_queries(file, query_format), args.chunk_size):
+            found = search([item["query"] for item in chunk if "query" in item])
+            for line in batch_results(chunk, found, key):
+                output.write(json.dumps(line, ensure_ascii=False) + "\n")
+            output.flush()
+            lines += len(chunk)
+    logging.info(f"Searched {lines} queries")
+
+
+@contextmanager
+def batch_search(args) -> Iterator[Callable[[list], list]]:
+    """Function finding books of valid queries of a chunk, in DB or by the server"""
+    if args.server is not None:
+        request = {"primary_key": args.primary_key_flag}
+        yield lambda queries: call_server(
+            args.server, "search/batch", {**request, "queries": queries}
+        )["results"]
+        return
+    from db.core import session_scope
+    from db.services import get_books_batch_from_db
 
     with session_scope() as session:
-        books = get_books_from_db(
-            session,
-            book_name,
-            author_first_name,
-            author_last_name,
-            args.year,
-            args.primary_key_flag,
+        yield lambda queries: get_books_batch_from_db(
+            session, queries, args.primary_key_flag
         )
-        if not books:
-            logging.info("Book Not Found")
-        for book in books:
-            logging.info(f"Book: {book}")
+
+
+def batch_results(
+    chunk: Sequence[dict], found: Sequence[list], key: str
+) -> Iterator[dict]:
+    """
+    Result lines of queries of the chunk in their order, found has results of
+    valid queries only
+
+    >>> list(batch_results([{"line": 1, "error": "Bad"}, {"line": 2, "query": {}}], [[1]], "ids"))
+    [{'line': 1, 'error': 'Bad'}, {'line': 2, 'query': {}, 'ids': [1]}]
+    """
+    results = iter(found)
+    for item in chunk:
+        yield item if "error" in item else {**item, key: next(results)}
+
+
+def get_query_format(path: str) -> str:
+    """Format of queries by the file extension"""
+    return "csv" if Path(path).suffix.lower() == ".csv" else "ndjson"
 
 
 if __name__ == "__main__":
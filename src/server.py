@@ -0,0 +1,237 @@
+import json
+import logging
+import sys
+from argparse import ArgumentParser, ArgumentTypeError
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock
+from time import perf_counter
+from typing import Callable
+
+from sqlalchemy.orm import configure_mappers
+
+from db.core import get_engine, session_scope
+from db.core.pool import pool_stats
+from db.services import get_books_batch_from_db
+from digger import get_source, ingest, ingest_args
+from seeker import search_books, validate_limit
+from services.batch_queries import parse_query
+from services.result_cache import CACHE_SIZE, ResultCache
+from services.startup import setup_logging
+from wiper import delete_selected, parse_delete_request
+
+# address the server listens on by default, only local clients can reach it
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8008
+# biggest JSON request accepted, a batch of 1000 queries is far smaller
+MAX_REQUEST_SIZE = 16 * 1024 * 1024
+# processes parsing books of ingests are spawned, a fork of the threaded server
+# could copy locks held by its other threads (logging, pool of the engine)
+INGEST_START_METHOD = "spawn"
+
+
+class RequestError(Exception):
+    """Request can not be done as it is, the client gets 400 Bad Request"""
+
+
+class CatalogServer(ThreadingHTTPServer):
+    """
+    HTTP server of seeker, wiper and digger operations over the same engine.
+    Every request is served by its own thread with its own session from the pool
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], cache_size: int = CACHE_SIZE):
+        super().__init__(address, CatalogHandler)
+        self.cache = ResultCache(cache_size)
+        # ingests of the same books would only wait for each other in DB
+        self.ingest_lock = Lock()
+        self.requests: dict[str, int] = {}
+        self.requests_lock = Lock()
+
+    def count(self, operation: str) -> None:
+        with self.requests_lock:
+            self.requests[operation] = self.requests.get(operation, 0) + 1
+
+    def stats(self) -> dict:
+        """Served requests, hits and misses of the result cache and the pool state"""
+        with self.requests_lock:
+            requests = dict(self.requests)
+        return {
+            "requests": requests,
+            "cache": self.cache.stats(),
+            "pool": pool_stats(get_engine().pool),
+        }
+
+
+class CatalogHandler(BaseHTTPRequestHandler):
+    """JSON request of an operation in POST body, JSON result or error in response"""
+
+    server: CatalogServer
+
+    def do_GET(self) -> None:  # noqa: N802
+        if self.path != "/stats":
+            self.reply(HTTPStatus.NOT_FOUND, {"error": f"No such page {self.path}"})
+            return
+        self.reply(HTTPStatus.OK, self.server.stats())
+
+    def do_POST(self) -> None:  # noqa: N802
+        operation = OPERATIONS.get(self.path)
+        if operation is None:
+            self.reply(
+                HTTPStatus.NOT_FOUND, {"error": f"No such operation {self.path}"}
+            )
+            return
+        self.server.count(self.path)
+        try:
+            result = operation(self.server, self.read_request())
+        except RequestError as err:
+            self.reply(HTTPStatus.BAD_REQUEST, {"error": str(err)})
+        except Exception as err:
+            logging.exception(f"Request {self.path} failed")
+            self.reply(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(err)})
+        else:
+            self.reply(HTTPStatus.OK, result)
+
+    def read_request(self) -> dict:
+        size = int(self.headers.get("Content-Length") or 0)
+        if size > MAX_REQUEST_SIZE:
+            raise RequestError(f"Request is bigger than {MAX_REQUEST_SIZE} bytes")
+        try:
+            request = json.loads(self.rfile.read(size) or b"{}")
+        except ValueError as err:
+            raise RequestError(f"Request is not JSON: {err}") from err
+        if not isinstance(request, dict):
+            raise RequestError("Request is not a JSON object")
+        return request
+
+    def reply(self, status: HTTPStatus, body: dict) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args) -> None:  # noqa: A002
+        logging.debug(f"{self.address_string()} {format % args}")
+
+
+def search(server: CatalogServer, request: dict) -> dict:
+    """Find books like seeker -n does, exact searches are cached by the server"""
+    try:
+        validate_search_limit(request.get("limit"))
+        with session_scope() as session:
+            return {"books": search_books(session, server.cache, request)}
+    except (ArgumentTypeError, ValueError) as err:
+        raise RequestError(str(err)) from err
+
+
+def validate_search_limit(limit) -> None:
+    """Validate limit of the search like seeker --limit, it is a number of JSON"""
+    if limit is None:
+        return
+    if type(limit) is not int:
+        raise ArgumentTypeError(f"`{limit}` is not a valid limit")
+    validate_limit(str(limit))
+
+
+def search_batch(server: CatalogServer, request: dict) -> dict:
+    """Find books of every query like seeker --batch does"""
+    try:
+        queries = [parse_query(query) for query in request.get("queries", [])]
+    except ValueError as err:
+        raise RequestError(str(err)) from err
+    with session_scope() as session:
+        results = get_books_batch_from_db(
+            session, queries, bool(request.get("primary_key"))
+        )
+    return {"results": results}
+
+
+def delete(server: CatalogServer, request: dict) -> dict:
+    """Delete books by id, all, ids or filters (id_range, author, years) like wiper does"""
+    try:
+        request = parse_delete_request(request)
+    except ValueError as err:
+        raise RequestError(f"Request has wrong args: {err}") from err
+    with session_scope() as session:
+        return {"deleted": delete_selected(session, request)}
+
+
+def save(server: CatalogServer, request: dict) -> dict:
+    """Save books of the folder or the file like digger does, one ingest at a time"""
+    try:
+        args = ingest_args(request)
+    except ValueError as err:
+        raise RequestError(f"Request has wrong args: {err}") from err
+    with server.ingest_lock:
+        started = perf_counter()
+        ingest(args, INGEST_START_METHOD)
+    return {"source": get_source(args), "elapsed_s": round(perf_counter() - started, 3)}
+
+
+OPERATIONS: dict[str, Callable[[CatalogServer, dict], dict]] = {
+    "/search": search,
+    "/search/batch": search_batch,
+    "/delete": delete,
+    "/ingest": save,
+}
+
+
+def warm_up() -> None:
+    """
+    Create the engine, configure mappers and open connections of the pool
+    in advance, so first requests do not wait for them
+    """
+    engine = get_engine()
+    configure_mappers()
+    # POOL_SIZE=0 turns pooling off, there is nothing to open in advance
+    size = pool_stats(engine.pool).get("size", 0)
+    connections = [engine.connect() for _ in range(size)]
+    for connection in connections:
+        connection.close()
+    logging.debug(f"Pool is warmed up: {pool_stats(engine.pool)}")
+
+
+def parse_args(_args):
+    """Create parser with args (--host, --port, --cache-size) and parse args with the created parser"""
+    parser = ArgumentParser(
+        description="Serve seeker, wiper and digger operations over HTTP with JSON"
+    )
+    parser.add_argument(
+        "--host", dest="host", default=SERVER_HOST, help=f"default is {SERVER_HOST}"
+    )
+    parser.add_argument(
+        "--port",
+        dest="port",
+        type=int,
+        default=SERVER_PORT,
+        help=f"default is {SERVER_PORT}",
+    )
+    parser.add_argument(
+        "--cache-size",
+        dest="cache_size",
+        type=int,
+        default=CACHE_SIZE,
+        help=f"Search results kept in memory, default is {CACHE_SIZE}",
+    )
+    return parser.parse_args(_args)
+
+
+def main():
+    setup_logging()
+    logging.debug(f"Called {sys.argv[0]} with {sys.argv[1:]}")
+    args = parse_args(sys.argv[1:])
+    warm_up()
+    with CatalogServer((args.host, args.port), args.cache_size) as server:
+        logging.info(f"Serving the catalog on http://{args.host}:{server.server_port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logging.info(f"Stopped, {server.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import csv
+import json
+from typing import Iterable, Iterator, Mapping, Optional, TextIO
+
+QUERY_FORMATS = ("ndjson", "csv")
+
+
+def read_queries(file: TextIO, query_format: str) -> Iterator[dict]:
+    """
+    Read queries of NDJSON lines or CSV rows with a header. Every query is yielded
+    in the input order, a query which can not be read is yielded with its error
+
+    :return iter([{'line': int, 'query': {'name': str, 'author_first_name': str,
+                   'author_last_name': str, 'year': int}} or {'line': int, 'error': str}])
+    """
+    records = read_csv(file) if query_format == "csv" else read_ndjson(file)
+    for line, record in enumerate(records, 1):
+        try:
+            yield {"line": line, "query": parse_query(record)}
+        except ValueError as err:
+            yield {"line": line, "error": str(err)}
+
+
+def read_ndjson(file: TextIO) -> Iterator[Mapping]:
+    """Yields objects of not empty lines, an error instead of a line which is not JSON"""
+    for text in file:
+        if not text.strip():
+            continue
+        try:
+            yield json.loads(text)
+        except json.JSONDecodeError as err:
+            yield ValueError(f"Not a JSON object: {err}")
+
+
+def read_csv(file: TextIO) -> Iterable[Mapping]:
+    return csv.DictReader(file)
+
+
+def parse_query(record) -> dict:
+    """
+    Validate fields of the query, empty fields are not searched by
+
+    >>> parse_query({"name": "Book", "year": "2021", "author_first_name": ""})
+    {'name': 'Book', 'author_first_name': None, 'author_last_name': None, 'year': 2021}
+    """
+    if isinstance(record, ValueError):
+        raise record
+    if not isinstance(record, Mapping):
+        raise ValueError("Query is not an object")
+    name = optional_text(record, "name")
+    if name is None:
+        raise ValueError("Query has no name")
+    return {
+        "name": name,
+        "author_first_name": optional_text(record, "author_first_name"),
+        "author_last_name": optional_text(record, "author_last_name"),
+        "year": optional_year(record),
+    }
+
+
+def optional_text(record: Mapping, field: str) -> Optional[str]:
+    value = record.get(field)
+    if value is None or value == "":
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f"`{value}` is not a valid {field}")
+    return value
+
+
+def optional_year(record: Mapping) -> Optional[int]:
+    value = record.get("year")
+    if value is None or value == "":
+        return None
+    if isinstance(value, int) or (isinstance(value, str) and value.isdigit()):
+        return int(value)
+    raise ValueError(f"`{value}` is not a valid year")
@@ -0,0 +1,47 @@
+import json
+from typing import TYPE_CHECKING
+from urllib.parse import urlsplit
+
+if TYPE_CHECKING:
+    from urllib.error import HTTPError
+
+# address of server.py started with its default host and port
+SERVER_URL = "http://127.0.0.1:8008"
+
+
+class ServerError(Exception):
+    """Request was not done by the catalog server"""
+
+
+def call_server(url: str, operation: str, request: dict) -> dict:
+    """
+    Send the request of the operation (search, search/batch, delete, ingest)
+    to the catalog server as JSON and return its JSON response
+    """
+    # http.client and email are imported only by runs which call the server
+    from urllib.error import HTTPError, URLError
+    from urllib.request import Request, urlopen
+
+    if urlsplit(url).scheme not in ("http", "https"):
+        raise ServerError(f"`{url}` is not an http url of the server")
+    http_request = Request(
+        f"{url.rstrip('/')}/{operation}",
+        data=json.dumps(request).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    try:
+        with urlopen(http_request) as response:  # noqa: S310
+            return json.loads(response.read())
+    except HTTPError as err:
+        raise ServerError(f"{operation} failed: {read_error(err)}") from err
+    except URLError as err:
+        raise ServerError(f"Server {url} is not available: {err.reason}") from err
+
+
+def read_error(err: "HTTPError") -> str:
+    """Error message of the server response, or its status if it has no message"""
+    try:
+        return json.loads(err.read())["error"]
+    except (ValueError, KeyError, TypeError):
+        return f"{err.code} {err.reason}"
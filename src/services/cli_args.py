@@ -0,0 +1,80 @@
+import sys
+from argparse import ArgumentParser, ArgumentTypeError
+from contextlib import nullcontext
+from typing import Collection, TextIO
+
+# helpers of args shared by CLIs, they import neither SQLAlchemy nor other CLIs
+
+
+class RequestParser(ArgumentParser):
+    """Parser of args of a request to the catalog server, errors do not exit the server"""
+
+    def error(self, message: str):
+        raise ValueError(message)
+
+
+def validate_chunk_size(value: str) -> int:
+    """Validate if chunk size is a positive number"""
+    if value.isdigit() and int(value) > 0:
+        return int(value)
+    raise ArgumentTypeError(f"`{value}` is not a valid chunk size")
+
+
+def open_input(path: str) -> TextIO:
+    """Open input file of a CLI, - is stdin"""
+    if path == "-":
+        return nullcontext(sys.stdin)
+    # csv module handles line endings of quoted fields itself
+    return open(path, encoding="utf-8", newline="")
+
+
+def request_argv(
+    parser: ArgumentParser, request: dict, exclude: Collection[str] = ()
+) -> list[str]:
+    """
+    Command line of the JSON request of the catalog server, so that it is validated
+    by the parser like args of the CLI are. Keys are dests of options of the parser,
+    flags are true or false, lists are values of options with nargs, null is no option
+
+    >>> parser = ArgumentParser()
+    >>> _ = parser.add_argument("--years", dest="years", nargs=2, type=int)
+    >>> _ = parser.add_argument("-u", dest="flag", action="store_true")
+    >>> request_argv(parser, {"years": [1850, 1870], "flag": True})
+    ['--years', '1850', '1870', '-u']
+    >>> request_argv(parser, {"help": True})
+    Traceback (most recent call last):
+    ...
+    ValueError: Request has unknown keys: help
+    """
+    options = {
+        action.dest: action
+        for action in parser._actions
+        if action.option_strings
+        and action.dest != "help"
+        and action.dest not in exclude
+    }
+    unknown = [key for key in request if key not in options]
+    if unknown:
+        raise ValueError(f"Request has unknown keys: {', '.join(unknown)}")
+    argv = []
+    for key, value in request.items():
+        argv.extend(option_argv(options[key], key, value))
+    return argv
+
+
+def option_argv(action, key: str, value) -> list[str]:
+    """Command line of one option of the request"""
+    if action.nargs == 0:
+        return flag_argv(action, key, value)
+    if value is None:
+        return []
+    if isinstance(value, (dict, bool)):
+        raise ValueError(f"{key} has wrong value {value}")
+    values = value if isinstance(value, list) else [value]
+    return [action.option_strings[0], *map(str, values)]
+
+
+def flag_argv(action, key: str, value) -> list[str]:
+    if not isinstance(value, bool):
+        raise ValueError(f"{key} is not true or false")
+    return [action.option_strings[0]] if value else []
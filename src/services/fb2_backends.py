@@ -0,0 +1,246 @@
+from functools import lru_cache
+from io import BytesIO, StringIO
+from pathlib import Path
+from typing import IO, Callable, Iterable, Iterator, Optional, Union
+from xml.etree.ElementTree import Element
+from xml.sax import SAXParseException
+from xml.sax.handler import ContentHandler, feature_namespaces
+
+from defusedxml import ElementTree, EntitiesForbidden
+from defusedxml.ElementTree import ParseError
+from defusedxml.sax import make_parser
+
+try:
+    from lxml import etree
+except ImportError:  # lxml is an optional backend
+    etree = None
+
+# paths of the book fields relative to <description>
+FB2_PATHS = {
+    "name": "title-info/book-title",
+    "author_first_name": "title-info/author/first-name",
+    "author_last_name": "title-info/author/last-name",
+    "published_year": "publish-info/year",
+}
+
+Fields = dict[str, Optional[Element]]
+
+
+class StopParsing(Exception):
+    """Raised by the SAX handler to abandon the document after </description>"""
+
+
+Source = Optional[Union[str, Path, IO[bytes]]]
+Text = Optional[Union[str, bytes]]
+
+
+def open_book(filename: Source, text: Text, binary: bool = False) -> IO:
+    """
+    Open book file, take the already opened binary file or wrap text of the book
+    into a file-like object. Bytes are parsed with their XML encoding declaration
+    """
+    if isinstance(text, bytes):
+        return BytesIO(text)
+    if text is not None:
+        return BytesIO(text.encode()) if binary else StringIO(text)
+    if hasattr(filename, "read"):
+        return filename
+    return open(filename, "rb")
+
+
+def defusedxml_backend(
+    filename: Source = None,
+    text: Text = None,
+    header_only: bool = True,
+) -> Fields:
+    """Find fields with defusedxml.ElementTree, the whole book is parsed if not header_only"""
+    if header_only:
+        with open_book(filename, text) as source:
+            root = read_until_description(
+                ElementTree.iterparse(source, ("start", "end"))
+            )
+    elif text is None:
+        root = ElementTree.parse(filename).getroot()
+    else:
+        root = ElementTree.fromstring(text)
+    return find_fields(root)
+
+
+def lxml_backend(
+    filename: Source = None,
+    text: Text = None,
+    header_only: bool = True,
+) -> Fields:
+    """Find fields with lxml, the whole book is parsed if not header_only"""
+    if etree is None:
+        raise ImportError("lxml backend requires lxml: pip install lxml")
+    read = read_until_description if header_only else read_whole
+    # str is encoded into UTF-8, whatever its declaration says
+    encoding = "utf-8" if isinstance(text, str) else None
+    with open_book(filename, text, binary=True) as source:
+        try:
+            root = read(iterparse_hardened(source, encoding))
+        except etree.XMLSyntaxError as err:
+            raise ParseError(err) from err
+    return find_fields(root)
+
+
+def expat_backend(
+    filename: Source = None,
+    text: Text = None,
+    header_only: bool = True,
+) -> Fields:
+    """Find fields with expat SAX parser, the whole book is parsed if not header_only"""
+    handler = DescriptionHandler(stop=header_only)
+    parser = make_parser()
+    parser.setFeature(feature_namespaces, True)
+    parser.setContentHandler(handler)
+    with open_book(filename, text) as source:
+        try:
+            parser.parse(source)
+        except StopParsing:
+            pass
+        except SAXParseException as err:
+            raise ParseError(err) from err
+    return handler.fields
+
+
+BACKENDS: dict[str, Callable[..., Fields]] = {
+    "defusedxml": defusedxml_backend,
+    "lxml": lxml_backend,
+    "expat": expat_backend,
+}
+
+
+def iterparse_hardened(
+    source: IO, encoding: Optional[str] = None
+) -> Iterator[tuple[str, Element]]:
+    """
+    lxml iterparse without DTD loading, entities and network access,
+    encoding overrides the XML declaration of the source
+    """
+    events = etree.iterparse(
+        source,
+        ("start", "end"),
+        encoding=encoding,
+        load_dtd=False,
+        no_network=True,
+        resolve_entities=False,
+        huge_tree=False,
+        # ElementTree skips them, so text around them is joined the same way
+        remove_comments=True,
+        remove_pis=True,
+    )
+    event, root = next(events)
+    dtd = root.getroottree().docinfo.internalDTD
+    for entity in dtd.iterentities() if dtd is not None else ():
+        raise EntitiesForbidden(entity.name, entity.content, None, None, None, None)
+    yield event, root
+    yield from events
+
+
+def read_until_description(events: Iterable[tuple[str, Element]]) -> Element:
+    """Build the tree from parser events up to </description>, then abandon the document"""
+    root = None
+    for event, element in events:
+        if root is None:
+            root = element
+        elif event == "end" and is_description(root, element):
+            # drop what the parser has already read past </description>
+            del root[list(root).index(element) + 1 :]
+            break
+    return root
+
+
+def read_whole(events: Iterable[tuple[str, Element]]) -> Element:
+    """Build the whole tree from parser events, syntax errors past </description> raise too"""
+    root = None
+    for _, element in events:
+        if root is None:
+            root = element
+    return root
+
+
+def is_description(root: Element, element: Element) -> bool:
+    """Check if element is the <description> block of the book"""
+    return element.tag == f"{get_namespace(root)}description" and element in list(root)
+
+
+def find_fields(root: Element) -> Fields:
+    """Find elements of FB2_PATHS fields inside <description>, without touching <body>"""
+    namespace = get_namespace(root)
+    description = root.find(f"{namespace}description")
+    if description is None:
+        return dict.fromkeys(FB2_PATHS)
+    paths = qualified_paths(namespace)
+    return {field: description.find(path) for field, path in paths.items()}
+
+
+def get_namespace(element: Element) -> str:
+    """Extract namespace of the tag: {URL}FictionBook -> {URL}"""
+    return element.tag[: element.tag.find("}") + 1]
+
+
+@lru_cache()
+def qualified_paths(namespace: str) -> dict[str, str]:
+    """Prefix every tag in FB2_PATHS with namespace: title-info -> {URL}title-info"""
+    return {
+        field: "/".join(f"{namespace}{tag}" for tag in path.split("/"))
+        for field, path in FB2_PATHS.items()
+    }
+
+
+class DescriptionHandler(ContentHandler):
+    """
+    Collect FB2_PATHS fields as ElementTree elements, stop at </description>
+    if stop, else read the document to its end
+    """
+
+    def __init__(self, stop: bool = True):
+        super().__init__()
+        self.stop = stop
+        self.fields: Fields = dict.fromkeys(FB2_PATHS)
+        self.targets: dict[tuple[str, ...], str] = {}
+        self.stack: list[str] = []
+        self.current: Optional[Element] = None
+        self.chunks: list[str] = []
+
+    def startElementNS(self, name, qname, attrs):  # noqa: N802
+        tag = "{%s}%s" % name if name[0] else name[1]
+        if not self.stack:
+            self.targets = get_targets(tag[: tag.find("}") + 1])
+        self.stack.append(tag)
+        # like in ElementTree, text of the element ends where its first child starts
+        self.finish_text()
+        field = self.targets.get(tuple(self.stack[1:]))
+        if field in self.fields and self.fields[field] is None:
+            self.current = self.fields[field] = Element(tag)
+
+    def characters(self, content):
+        if self.current is not None:
+            self.chunks.append(content)
+
+    def endElementNS(self, name, qname):  # noqa: N802
+        self.finish_text()
+        path = tuple(self.stack[1:])
+        self.stack.pop()
+        if self.stop and self.targets.get(path) == "description":
+            raise StopParsing
+
+    def finish_text(self) -> None:
+        """Store collected text into the current element"""
+        if self.current is not None:
+            self.current.text = "".join(self.chunks) or None
+            self.current = None
+            self.chunks = []
+
+
+@lru_cache()
+def get_targets(namespace: str) -> dict[tuple[str, ...], str]:
+    """Map qualified path from the root of <description> and every field to its name"""
+    description = f"{namespace}description"
+    targets = {(description,): "description"}
+    for field, path in FB2_PATHS.items():
+        tags = (f"{namespace}{tag}" for tag in path.split("/"))
+        targets[(description, *tags)] = field
+    return targets
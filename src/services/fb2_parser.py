@@ -1,46 +1,52 @@
 import logging
-from pathlib import Path
-from typing import Optional, Union
+from typing import Optional
+from xml.etree.ElementTree import Element
 
-from defusedxml import ElementTree
+from services.fb2_backends import BACKENDS, Source, Text
+from services.startup import DEFAULT_BACKEND
 
 
 class FB2Parser:
-    """Parse book.fb2 and extract book name, author full name and book published year"""
+    """
+    Parse book.fb2 and extract book name, author full name and book published year.
+    Book is a file name, a binary file object, or a text as str or bytes
+    """
 
     def __init__(
-        self, filename: Optional[Union[str, Path]] = None, text: Optional[str] = None
+        self,
+        filename: Source = None,
+        text: Text = None,
+        header_only: bool = False,
+        backend: str = DEFAULT_BACKEND,
     ):
 
         if text is None:
-            logging.debug(f"Parsing file: {filename}")
-            self.root = ElementTree.parse(filename).getroot()
+            logging.debug(f"Parsing file: {filename} with {backend}")
         else:
-            logging.debug("Parsing text")
-            self.root = ElementTree.fromstring(text)
-        self.cleanup()
+            logging.debug(f"Parsing text with {backend}")
+        self.fields = BACKENDS[backend](filename, text, header_only)
 
     @property
     def name(self) -> str:
         """Parse book and extract book name"""
-        return self.root.find("./description/title-info/book-title").text
+        return self.find("name").text
 
     @property
     def author_first_name(self) -> Optional[str]:
         """Parse book and extract author name"""
-        element_name = self.root.find("./description/title-info/author/first-name")
+        element_name = self.find("author_first_name")
         return element_name.text if element_name is not None else None
 
     @property
     def author_last_name(self) -> Optional[str]:
         """Parse book and extract author name"""
-        element_last_name = self.root.find("./description/title-info/author/last-name")
+        element_last_name = self.find("author_last_name")
         return element_last_name.text if element_last_name is not None else None
 
     @property
     def published_year(self) -> Optional[int]:
         """Parse book and extract published year"""
-        element_year = self.root.find("./description/publish-info/year")
+        element_year = self.find("published_year")
         return int(element_year.text) if element_year is not None else None
 
     @property
@@ -52,7 +58,6 @@ class FB2Parser:
             "year": self.published_year,
         }
 
-    def cleanup(self) -> None:
-        """Reformat tag: {URL}description -> description"""
-        for element in self.root.iter():
-            element.tag = element.tag.partition("}")[-1]
+    def find(self, field: str) -> Optional[Element]:
+        """Get element of the field found inside <description> by the backend"""
+        return self.fields[field]
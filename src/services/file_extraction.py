@@ -1,34 +1,74 @@
 import gzip
 import logging
 import os
+from functools import lru_cache
 from pathlib import Path
-from typing import Generator, Union
+from typing import IO, Generator, Optional, Sequence, Union
 from zipfile import ZipFile
 
+from services.profiling import stage, timed_stream
+from services.startup import FILE_EXTENSIONS
 
-def zip_extraction(zip_file: Union[str, Path]) -> Generator[str, None, None]:
-    """Extracts and reads file from zip-archive"""
-    with ZipFile(zip_file, "r") as zip_obj:
-        for file in zip_obj.namelist():
-            logging.debug(f"Unzipping file: {file} from {zip_file}")
-            yield zip_obj.read(file).decode()
+# archives kept open by a worker, which parses parts of them one by one
+ARCHIVES_OPEN = 4
 
 
-def gzip_extraction(gzip_file: Union[str, Path]) -> str:
-    """Extracts and reads file from zip-archive"""
-    with gzip.open(gzip_file, "r") as file:
-        logging.debug(f"Extracts gzip file: {file} from {gzip_file}")
-        return file.read().decode()
+def zip_extraction(
+    zip_file: Union[str, Path], members: Optional[Sequence[str]] = None
+) -> Generator[IO[bytes], None, None]:
+    """
+    Opens files from zip-archive, all of them or only members, as binary streams.
+    Every stream is closed when the next one is opened
+    """
+    if members is not None:
+        with stage("extract"):
+            zip_obj = open_archive(zip_file)
+        yield from read_members(zip_obj, members)
+        return
+    with stage("extract"):
+        zip_obj = ZipFile(zip_file, "r")
+    with zip_obj:
+        yield from read_members(zip_obj, zip_obj.namelist())
 
 
-def get_files_from_dir(dir_path: Union[str, Path]) -> Generator[str, None, None]:
-    """Yields files with correct extension from directory"""
-    from services.parse_book_from_file import FILE_EXTENSIONS
+def read_members(
+    zip_obj: ZipFile, members: Sequence[str]
+) -> Generator[IO[bytes], None, None]:
+    """Opens members of the opened zip-archive one by one"""
+    for file in members:
+        logging.debug(f"Unzipping file: {file} from {zip_obj.filename}")
+        with stage("extract"):
+            member = zip_obj.open(file)
+        with member:
+            yield timed_stream("extract", member)
+
+
+def open_archive(zip_file: Union[str, Path]) -> ZipFile:
+    """Open zip-archive or take the already opened one, if it was not changed since"""
+    stat = os.stat(zip_file)
+    return open_archive_version(str(zip_file), stat.st_size, stat.st_mtime_ns)
+
+
+@lru_cache(ARCHIVES_OPEN)
+def open_archive_version(zip_file: str, size: int, mtime_ns: int) -> ZipFile:
+    """Open zip-archive once, its central directory is read only once too"""
+    return ZipFile(zip_file, "r")
 
+
+def gzip_extraction(gzip_file: Union[str, Path]) -> IO[bytes]:
+    """Opens file from gzip-archive as binary stream, it is decompressed while it is read"""
+    logging.debug(f"Extracts gzip file: {gzip_file}")
+    return timed_stream("extract", gzip.open(gzip_file, "rb"))
+
+
+def get_files_from_dir(dir_path: Union[str, Path]) -> Generator[str, None, None]:
+    """Yields files with correct extension from directory, always in the same order"""
     logging.debug(f"Scanning directory for file: {dir_path}")
-    for root, _, files in os.walk(dir_path):
+    for root, dirs, files in os.walk(dir_path):
         logging.debug(f"Find {len(files)} in dir:{root}")
-        for file in files:
+        # resumed ingest finds its files by their number in the walk
+        dirs.sort()
+        for file in sorted(files):
             file_extension = Path(file).suffix
             if file_extension in FILE_EXTENSIONS:
                 yield os.path.join(root, file)
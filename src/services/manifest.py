@@ -0,0 +1,97 @@
+import logging
+import os
+from hashlib import blake2b
+from pathlib import Path
+from typing import Iterator, Mapping, Union
+
+from services.file_extraction import get_files_from_dir
+
+# bytes of the file hashed at once
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class ManifestScan:
+    """
+    Compare files of the directory with the manifest of the previous ingest.
+    A file is unchanged if its size and mtime are the same, a file with a new
+    mtime only is hashed and unchanged if its content hash is the same.
+    Files from the manifest which were not found are missing after the scan
+    """
+
+    def __init__(
+        self,
+        dir_path: Union[str, Path],
+        known: Mapping[str, tuple],
+        rescan: bool = False,
+    ):
+        """
+        :param known: {path: (size, mtime_ns, content_hash, stale)} of the manifest
+        :param rescan: yield every file, changed or not
+        """
+        self.dir_path = os.path.abspath(dir_path)
+        self.known = dict(known)
+        self.rescan = rescan
+        self.touched: list[dict] = []
+        self.skipped = 0
+
+    def changed_files(self) -> Iterator[str]:
+        """Yields absolute paths of new and changed files"""
+        yield from filter(self.changed, get_files_from_dir(self.dir_path))
+        logging.info(f"Manifest scan: {self}")
+
+    def changed(self, path: str) -> bool:
+        """Check if the file of the directory is new or changed"""
+        state = self.known.pop(path, None)
+        if self.rescan or state is None or not self.unchanged(path, state):
+            return True
+        self.skipped += 1
+        return False
+
+    def forget(self, path: str) -> None:
+        """Mark the file of the directory as found, without comparing it"""
+        self.known.pop(path, None)
+
+    def unchanged(self, path: str, state: tuple) -> bool:
+        """Check if file is the same as the one in manifest"""
+        size, mtime_ns, content_hash, stale = state
+        stat = os.stat(path)
+        if stale or stat.st_size != size:
+            return False
+        if stat.st_mtime_ns == mtime_ns:
+            return True
+        if file_hash(path) != content_hash:
+            return False
+        self.touched.append({"path": path, "size": size, "mtime_ns": stat.st_mtime_ns})
+        return True
+
+    def __str__(self) -> str:
+        return f"{self.skipped} unchanged files, {len(self.missing)} missing files"
+
+    @property
+    def missing(self) -> list[str]:
+        """Paths from the manifest which were not found, complete after the scan only"""
+        return list(self.known)
+
+
+def file_hash(path: Union[str, Path]) -> str:
+    """Hash of the file content, read HASH_CHUNK_SIZE bytes at a time"""
+    content_hash = blake2b(digest_size=16)
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            content_hash.update(chunk)
+    return content_hash.hexdigest()
+
+
+def file_state(path: Union[str, Path]) -> dict:
+    """
+    State of the file saved in the manifest
+
+    :return {'path': str, 'size': int, 'mtime_ns': int, 'content_hash': str}
+    """
+    stat = os.stat(path)
+    return {
+        "path": os.path.abspath(path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "content_hash": file_hash(path),
+    }
@@ -0,0 +1,266 @@
+import json
+import os
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import partial
+from pathlib import Path
+from threading import Event, Lock, Thread
+from time import perf_counter, time
+from typing import Any, Callable, Iterator, Optional, Sequence, Union
+
+# upper bounds of latency histogram buckets in seconds, like in Prometheus clients
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+)
+# seconds between live metrics of a running ingest
+METRICS_INTERVAL = 10.0
+# prefix of metric names in the Prometheus textfile
+METRICS_PREFIX = "digger"
+COUNTERS = {
+    "files_scanned": "Files found in the folder",
+    "files_parsed": "Files and parts of big archives parsed",
+    "files_failed": "Files and parts of big archives which could not be parsed",
+    "bytes_read": "Bytes of parsed files",
+    "books_created": "Books created in DB",
+    "books_updated": "Books updated in DB",
+    "books_skipped": "Books already in DB, which were not updated",
+}
+HISTOGRAMS = {
+    "parse_seconds": "Latency of parsing a file or a part of a big archive",
+    "db_batch_seconds": "Latency of saving a batch of books, without commit",
+    "db_commit_seconds": "Latency of committing a batch of books",
+}
+
+
+class Histogram:
+    """Number of observed values by buckets of their upper bounds"""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def as_dict(self) -> dict:
+        """
+        Cumulative counts of buckets, like Prometheus has them
+
+        >>> histogram = Histogram([0.1, 1])
+        >>> for value in (0.05, 0.1, 0.5, 3):
+        ...     histogram.observe(value)
+        >>> histogram.as_dict()
+        {'buckets': {'0.1': 2, '1': 3, '+Inf': 4}, 'sum': 3.65, 'count': 4}
+        """
+        counts, total = {}, 0
+        for bound, count in zip([*map(str, self.buckets), "+Inf"], self.counts):
+            total += count
+            counts[bound] = total
+        return {"buckets": counts, "sum": round(self.sum, 6), "count": self.count}
+
+
+class IngestMetrics:
+    """Counters and latency histograms of an ingest, updated by all its threads"""
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.histograms = {name: Histogram() for name in HISTOGRAMS}
+        self.lock = Lock()
+
+    def count(self, name: str, value: int = 1) -> None:
+        with self.lock:
+            self.counters[name] += value
+
+    def observe(self, name: str, value: float) -> None:
+        with self.lock:
+            self.histograms[name].observe(value)
+
+    def snapshot(self, final: bool = False) -> dict:
+        """Counters, throughput and histograms of the ingest until now"""
+        elapsed = perf_counter() - self.started
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {
+                name: histogram.as_dict() for name, histogram in self.histograms.items()
+            }
+        return {
+            "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "final": final,
+            "elapsed_s": round(elapsed, 3),
+            **counters,
+            "files_per_s": round(counters["files_parsed"] / elapsed, 2),
+            "bytes_per_s": round(counters["bytes_read"] / elapsed, 2),
+            "books_per_s": round(
+                (counters["books_created"] + counters["books_updated"]) / elapsed, 2
+            ),
+            "histograms": histograms,
+        }
+
+
+def prometheus_text(snapshot: dict) -> str:
+    """Metrics of the snapshot in the Prometheus text format"""
+    lines = []
+    for name, text in COUNTERS.items():
+        lines += metric_lines(f"{name}_total", "counter", text, snapshot[name])
+    for name, text in HISTOGRAMS.items():
+        histogram = snapshot["histograms"][name]
+        lines += metric_lines(name, "histogram", text)
+        metric = f"{METRICS_PREFIX}_{name}"
+        for bound, count in histogram["buckets"].items():
+            lines.append(f'{metric}_bucket{{le="{bound}"}} {count}')
+        lines.append(f"{metric}_sum {histogram['sum']}")
+        lines.append(f"{metric}_count {histogram['count']}")
+    lines += metric_lines(
+        "elapsed_seconds", "gauge", "Duration of the ingest", snapshot["elapsed_s"]
+    )
+    lines += metric_lines(
+        "running", "gauge", "1 while the ingest runs", int(not snapshot["final"])
+    )
+    lines += metric_lines(
+        "last_update_timestamp_seconds",
+        "gauge",
+        "Time of the last update of metrics",
+        round(time(), 3),
+    )
+    return "\n".join(lines) + "\n"
+
+
+def metric_lines(name: str, kind: str, text: str, value: Any = None) -> list[str]:
+    """
+    HELP and TYPE lines of the metric, with its value if given
+
+    >>> metric_lines("files_scanned_total", "counter", "Files found", 3)
+    ['# HELP digger_files_scanned_total Files found', \
+'# TYPE digger_files_scanned_total counter', 'digger_files_scanned_total 3']
+    """
+    metric = f"{METRICS_PREFIX}_{name}"
+    lines = [f"# HELP {metric} {text}", f"# TYPE {metric} {kind}"]
+    if value is not None:
+        lines.append(f"{metric} {value}")
+    return lines
+
+
+class MetricsReporter(Thread):
+    """Write metrics every interval seconds while the ingest runs, and once after it"""
+
+    def __init__(
+        self,
+        metrics: IngestMetrics,
+        jsonl_path: Optional[Union[str, Path]] = None,
+        prom_path: Optional[Union[str, Path]] = None,
+        interval: float = METRICS_INTERVAL,
+    ):
+        super().__init__(name="metrics-reporter", daemon=True)
+        self.metrics = metrics
+        self.jsonl_path = jsonl_path
+        self.prom_path = prom_path
+        self.interval = interval
+        self.stopped = Event()
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.report()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.join()
+        self.report(final=True)
+
+    def report(self, final: bool = False) -> None:
+        """Append a JSON line and replace the Prometheus textfile"""
+        snapshot = self.metrics.snapshot(final)
+        if self.jsonl_path is not None:
+            with open(self.jsonl_path, "a", encoding="utf-8") as file:
+                file.write(json.dumps(snapshot) + "\n")
+        if self.prom_path is not None:
+            # the textfile collector must never read a half written file
+            tmp_path = f"{self.prom_path}.{os.getpid()}.tmp"
+            Path(tmp_path).write_text(prometheus_text(snapshot), encoding="utf-8")
+            os.replace(tmp_path, self.prom_path)
+
+
+# metrics of the running ingest, None if they are not collected
+METRICS: Optional[IngestMetrics] = None
+
+
+@contextmanager
+def collecting(
+    jsonl_path: Optional[Union[str, Path]] = None,
+    prom_path: Optional[Union[str, Path]] = None,
+    interval: float = METRICS_INTERVAL,
+) -> Iterator[Optional[IngestMetrics]]:
+    """
+    Collect metrics of the ingest, if any path is given. Metrics are appended to
+    jsonl_path as JSON lines and written into prom_path in the Prometheus text format,
+    every interval seconds and once more when the ingest is finished
+    """
+    global METRICS
+    if jsonl_path is None and prom_path is None:
+        yield None
+        return
+    METRICS = IngestMetrics()
+    reporter = MetricsReporter(METRICS, jsonl_path, prom_path, interval)
+    reporter.start()
+    try:
+        yield METRICS
+    finally:
+        reporter.stop()
+        METRICS = None
+
+
+def count(name: str, value: int = 1) -> None:
+    """Add value to the counter, if metrics are collected"""
+    if METRICS is not None:
+        METRICS.count(name, value)
+
+
+def observe(name: str, value: float) -> None:
+    """Add value to the histogram, if metrics are collected"""
+    if METRICS is not None:
+        METRICS.observe(name, value)
+
+
+def count_bytes(path: Union[str, Path]) -> None:
+    """Add size of the file to read bytes, if metrics are collected"""
+    if METRICS is not None:
+        METRICS.count("bytes_read", os.path.getsize(path))
+
+
+def measured(func: Callable) -> Callable:
+    """Make func of pool workers return how long it takes, if metrics are collected"""
+    return func if METRICS is None else partial(measure, func)
+
+
+def measure(func: Callable, task: Any) -> tuple[Any, tuple[Any, float]]:
+    """Call func of (key, task) in the worker and add its latency to its result"""
+    started = perf_counter()
+    key, result = func(task)
+    return key, (result, perf_counter() - started)
+
+
+def record_parse(result: Any) -> Any:
+    """Count the parsed or failed file by the result of the measured worker"""
+    if METRICS is None:
+        return result
+    books, latency = result
+    METRICS.observe("parse_seconds", latency)
+    METRICS.count("files_parsed" if books is not None else "files_failed")
+    return books
@@ -0,0 +1,31 @@
+import re
+import unicodedata
+from typing import Optional
+
+# letters which are written interchangeably in russian texts
+SAME_LETTERS = str.maketrans({"ё": "е"})
+# runs of spaces, punctuation and other characters which are not letters or digits
+SEPARATORS = re.compile(r"[\W_]+")
+
+
+def normalize_key(text: str) -> str:
+    """
+    Lookup key of a book name or an author name, names with the same key are the same.
+    The key is NFKC of the casefolded name, ё is е, runs of spaces and punctuation
+    are one space
+
+    >>> normalize_key("  Будем   знакомы! ")
+    'будем знакомы'
+    >>> normalize_key("ЁЖИК В ТУМАНЕ") == normalize_key("Ежик в тумане...")
+    True
+    >>> normalize_key("Ｆｕｌｌ－ｗｉｄｔｈ ﬁ")
+    'full width fi'
+    """
+    text = unicodedata.normalize("NFKC", text)
+    text = unicodedata.normalize("NFKC", text.casefold()).translate(SAME_LETTERS)
+    return SEPARATORS.sub(" ", text).strip()
+
+
+def optional_key(text: Optional[str]) -> Optional[str]:
+    """Lookup key of the name, None if the name is unknown"""
+    return None if text is None else normalize_key(text)
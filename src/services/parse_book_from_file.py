@@ -1,35 +1,79 @@
 import logging
 import os
-from itertools import chain
-from multiprocessing import Pool
+from functools import partial
+from multiprocessing import get_context
 from pathlib import Path
-from typing import Optional, Sequence, Union
+from threading import Semaphore
+from typing import Iterable, Iterator, NamedTuple, Optional, Sequence, Union
+from zipfile import ZipFile
 
 from defusedxml.ElementTree import ParseError
 
 from services.fb2_parser import FB2Parser
 from services.file_extraction import get_files_from_dir, gzip_extraction, zip_extraction
+from services.manifest import ManifestScan, file_state
+from services.metrics import count, count_bytes, measured, record_parse
+from services.profiling import (
+    finish_pool,
+    pool_options,
+    received,
+    shipped,
+    stage,
+    timed_iter,
+)
+from services.progress import IngestProgress, TaskKey
+from services.startup import DEFAULT_BACKEND
 
-FILE_EXTENSIONS = ["", ".fb2", ".gz", ".zip"]
+# files sent to a worker at once
+CHUNK_SIZE = 8
+# files per process which are parsed or wait for the consumer
+FILES_IN_FLIGHT = 8 * CHUNK_SIZE
+# zip-archives of this size in bytes and bigger are parsed by several workers
+ARCHIVE_SPLIT_SIZE = 64 * 1024 * 1024
+# members of a big zip-archive parsed by one worker at once
+ARCHIVE_PART_SIZE = 64
+
+
+class ArchivePart(NamedTuple):
+    """Members of a big zip-archive, parsed as a separate file"""
+
+    path: str
+    members: tuple[str, ...]
+    # state of the whole archive, if books are saved with their files
+    state: Optional[dict] = None
 
 
 def find_books(
     dir_path: Optional[Union[str, Path]] = None,
     book_path: Optional[Union[str, Path]] = None,
-) -> Sequence[dict]:
+    backend: str = DEFAULT_BACKEND,
+    scan: Optional[ManifestScan] = None,
+    progress: Optional[IngestProgress] = None,
+    start_method: Optional[str] = None,
+) -> Optional[Iterable[dict]]:
     """
-    Parse file or directory and returns info about book
+    Parse file or directory and returns info about book.
+    start_method of the pool of processes is the default one of the platform if None
 
     :return [{'name': str, 'author_first_name': str,'author_last_name': str, 'year': int}, ...]
     """
-    return (
-        get_books_from_directory(dir_path)
-        if dir_path is not None
-        else get_books_from_file(book_path)
-    )
+    if dir_path is not None:
+        return get_books_from_directory(dir_path, backend, scan, progress, start_method)
+    if is_big_archive(book_path):
+        progress = progress if progress is not None else IngestProgress()
+        tasks = timed_iter("scan", get_tasks([book_path], progress))
+        return get_books_in_pool(tasks, backend, progress, start_method=start_method)
+    count("files_scanned")
+    count_bytes(book_path)
+    worker = measured(partial(parse_task, backend=backend))
+    with stage("parse"):
+        _, result = worker(((0, 0), book_path))
+    return record_parse(result)
 
 
-def get_books_from_file(file: Optional[Union[str, Path]]) -> Sequence[dict]:
+def get_books_from_file(
+    file: Optional[Union[str, Path]], backend: str = DEFAULT_BACKEND
+) -> Sequence[dict]:
     """
     Find info about book in file
 
@@ -40,23 +84,204 @@ def get_books_from_file(file: Optional[Union[str, Path]]) -> Sequence[dict]:
     extension = Path(file).suffix
     try:
         if extension == ".gz":
-            return [FB2Parser(text=gzip_extraction(file)).as_dict]
+            with gzip_extraction(file) as book:
+                return [
+                    FB2Parser(filename=book, header_only=True, backend=backend).as_dict
+                ]
         elif extension == ".zip":
             return [
-                FB2Parser(text=file_content).as_dict
-                for file_content in zip_extraction(file)
+                FB2Parser(filename=book, header_only=True, backend=backend).as_dict
+                for book in zip_extraction(file)
             ]
-        return [FB2Parser(filename=file).as_dict]
+        return [FB2Parser(filename=file, header_only=True, backend=backend).as_dict]
     except ParseError as err:
         logging.warning(err, exc_info=True)
 
 
-def get_books_from_directory(dir_path: Optional[Union[str, Path]]) -> list[dict]:
+def get_books_from_part(
+    part: ArchivePart, backend: str = DEFAULT_BACKEND
+) -> Optional[Sequence[dict]]:
     """
-    Find info about books in all files in the specified directory
+    Find info about books in members of the archive, like get_books_from_file does
 
     :return [{'name': str, 'author_first_name': str,'author_last_name': str, 'year': int}, ...]
     """
-    with Pool(os.cpu_count()) as pool:
-        books = pool.map(get_books_from_file, get_files_from_dir(dir_path))
-        return list(chain(*books))
+    logging.debug(f"Working with {len(part.members)} members of file: {part.path}")
+    try:
+        books = [
+            FB2Parser(filename=book, header_only=True, backend=backend).as_dict
+            for book in zip_extraction(part.path, part.members)
+        ]
+    except ParseError as err:
+        logging.warning(err, exc_info=True)
+        return None
+    if part.state is None:
+        return books
+    return [
+        {**book, "file": {**part.state, "member": member}}
+        for book, member in zip(books, part.members)
+    ]
+
+
+def get_books_with_file(
+    file: Union[str, Path], backend: str = DEFAULT_BACKEND
+) -> Optional[Sequence[dict]]:
+    """
+    Find info about book in file and add the state of the file to every book
+
+    :return [{'name': str, ..., 'file': {'path': str, 'member': str, 'size': int,
+              'mtime_ns': int, 'content_hash': str}}, ...]
+    """
+    # the state is taken before parsing, so a file changed meanwhile is parsed again
+    state = file_state(file)
+    books = get_books_from_file(file, backend)
+    if books is None:
+        return None
+    if Path(file).suffix == ".zip":
+        with ZipFile(file, "r") as zip_obj:
+            members = zip_obj.namelist()
+    else:
+        members = [""] * len(books)
+    return [
+        {**book, "file": {**state, "member": member}}
+        for book, member in zip(books, members)
+    ]
+
+
+def parse_task(
+    keyed_task: tuple[TaskKey, Union[str, ArchivePart]],
+    backend: str = DEFAULT_BACKEND,
+    with_files: bool = False,
+) -> (TaskKey, Optional[Sequence[dict]]):
+    """Find info about books in the file or in the part of the archive"""
+    key, task = keyed_task
+    if isinstance(task, ArchivePart):
+        return key, get_books_from_part(task, backend)
+    if with_files:
+        return key, get_books_with_file(task, backend)
+    return key, get_books_from_file(task, backend)
+
+
+def get_books_from_directory(
+    dir_path: Optional[Union[str, Path]],
+    backend: str = DEFAULT_BACKEND,
+    scan: Optional[ManifestScan] = None,
+    progress: Optional[IngestProgress] = None,
+    start_method: Optional[str] = None,
+) -> Iterator[dict]:
+    """
+    Find info about books in all files in the specified directory.
+    With scan, only new and changed files are parsed and books carry their file.
+    With progress of a resumed run, files done by that run are not parsed again
+
+    :return iter([{'name': str, 'author_first_name': str,'author_last_name': str, 'year': int}, ...])
+    """
+    progress = progress if progress is not None else IngestProgress()
+    files = get_files_from_dir(scan.dir_path if scan is not None else dir_path)
+    tasks = timed_iter("scan", get_tasks(files, progress, scan))
+    return get_books_in_pool(tasks, backend, progress, scan is not None, start_method)
+
+
+def get_books_in_pool(
+    tasks: Iterable[tuple[TaskKey, Union[str, ArchivePart]]],
+    backend: str = DEFAULT_BACKEND,
+    progress: Optional[IngestProgress] = None,
+    with_files: bool = False,
+    start_method: Optional[str] = None,
+) -> Iterator[dict]:
+    """
+    Parse files and parts of archives by a pool of processes started by start_method.
+    Books are yielded in the order workers finish them, while at most
+    FILES_IN_FLIGHT tasks per process are being parsed or wait to be consumed.
+    A task is finished in progress after all its books are yielded
+    """
+    processes = os.cpu_count()
+    max_in_flight = processes * FILES_IN_FLIGHT
+    in_flight = Semaphore(max_in_flight)
+    tasks = acquire_for_each(tasks, in_flight)
+    worker = partial(parse_task, backend=backend, with_files=with_files)
+    worker = shipped(measured(worker))
+    context = get_context(start_method)
+    with context.Pool(processes, **pool_options()) as pool:
+        try:
+            results = pool.imap_unordered(worker, tasks, CHUNK_SIZE)
+            for key, books in timed_iter("wait", results):
+                in_flight.release()
+                yield from record_parse(received(books)) or ()
+                if progress is not None:
+                    progress.finish(key)
+            finish_pool(pool)
+        finally:
+            # unblock the pool task feeder, otherwise the pool can not be terminated
+            in_flight.release(max_in_flight)
+
+
+def get_tasks(
+    files: Iterable[str],
+    progress: IngestProgress,
+    scan: Optional[ManifestScan] = None,
+) -> Iterator[tuple[TaskKey, Union[str, ArchivePart]]]:
+    """
+    Number files in the walk order and yields tasks of the files to parse,
+    every task is started in progress before it is yielded
+    """
+    for index, file in enumerate(files):
+        tasks = (
+            split_archive(file, scan is not None)
+            if should_parse(index, file, progress, scan)
+            else []
+        )
+        keyed = [
+            ((index, part), task)
+            for part, task in enumerate(tasks)
+            if not progress.is_done((index, part))
+        ]
+        progress.start(index, file, (key for key, _ in keyed))
+        count_file(file, parsed=bool(keyed))
+        yield from keyed
+
+
+def count_file(file: str, parsed: bool) -> None:
+    """Count the scanned file in ingest metrics, with its size if it is parsed"""
+    count("files_scanned")
+    if parsed:
+        count_bytes(file)
+
+
+def should_parse(
+    index: int, file: str, progress: IngestProgress, scan: Optional[ManifestScan]
+) -> bool:
+    """Check if the file was not done by the resumed run and is new or changed"""
+    done = index < progress.skip[0]
+    if scan is None:
+        return not done
+    # the first unfinished file of the resumed run may be in the manifest partly
+    if done or (progress.resumed and index == progress.skip[0]):
+        scan.forget(file)
+        return not done
+    return scan.changed(file)
+
+
+def split_archive(file: str, with_files: bool = False) -> list[Union[str, ArchivePart]]:
+    """Split big zip-archive into parts of ARCHIVE_PART_SIZE members, other files are not split"""
+    if not is_big_archive(file):
+        return [file]
+    with ZipFile(file, "r") as zip_obj:
+        members = zip_obj.namelist()
+    state = file_state(file) if with_files else None
+    return [
+        ArchivePart(str(file), tuple(members[start : start + ARCHIVE_PART_SIZE]), state)
+        for start in range(0, len(members), ARCHIVE_PART_SIZE)
+    ]
+
+
+def is_big_archive(file: Union[str, Path]) -> bool:
+    """Check if file is zip-archive which is worth parsing by several workers"""
+    return Path(file).suffix == ".zip" and os.path.getsize(file) >= ARCHIVE_SPLIT_SIZE
+
+
+def acquire_for_each(items: Iterable, semaphore: Semaphore) -> Iterator:
+    """Acquire semaphore before yielding every item"""
+    for item in items:
+        semaphore.acquire()
+        yield item
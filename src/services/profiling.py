@@ -0,0 +1,277 @@
+import cProfile
+import json
+import logging
+import os
+import pickle
+import pstats
+from contextlib import contextmanager
+from functools import partial, wraps
+from multiprocessing.pool import Pool
+from multiprocessing.util import Finalize
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import Lock, local
+from time import perf_counter, thread_time
+from typing import IO, Any, Callable, Iterable, Iterator, Optional, Union
+
+# stages of an ingest, in the order books go through them
+STAGES = ("scan", "extract", "parse", "transfer", "wait", "db")
+# finalizers of pool workers with higher priority run earlier on exit
+DUMP_PRIORITY = 100
+
+
+class StageTimes:
+    """
+    Wall and CPU time spent in stages by all threads of the process.
+    Time of a stage nested into another one is counted for the nested stage only
+    """
+
+    def __init__(self):
+        self.totals: dict[str, list] = {}
+        self.lock = Lock()
+        self.local = local()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        stack = self.local.__dict__.setdefault("stack", [])
+        nested = [0.0, 0.0]
+        stack.append(nested)
+        wall, cpu = perf_counter(), thread_time()
+        try:
+            yield
+        finally:
+            wall, cpu = perf_counter() - wall, thread_time() - cpu
+            stack.pop()
+            if stack:
+                stack[-1][0] += wall
+                stack[-1][1] += cpu
+            self.add(name, wall - nested[0], cpu - nested[1])
+
+    def add(self, name: str, wall: float, cpu: float, calls: int = 1) -> None:
+        with self.lock:
+            total = self.totals.setdefault(name, [0.0, 0.0, 0])
+            total[0] += wall
+            total[1] += cpu
+            total[2] += calls
+
+    def update(self, other: dict[str, dict]) -> None:
+        """Add times of other process, as returned by as_dict"""
+        for name, times in other.items():
+            self.add(name, times["wall_s"], times["cpu_s"], times["calls"])
+
+    def as_dict(self) -> dict[str, dict]:
+        """
+        Times of stages in the order of STAGES
+
+        >>> times = StageTimes()
+        >>> times.add("db", 2.0, 1.0)
+        >>> times.add("scan", 0.5, 0.5, calls=10)
+        >>> times.as_dict()
+        {'scan': {'wall_s': 0.5, 'cpu_s': 0.5, 'calls': 10}, \
+'db': {'wall_s': 2.0, 'cpu_s': 1.0, 'calls': 1}}
+        """
+        with self.lock:
+            names = sorted(self.totals, key=stage_order)
+            return {
+                name: {
+                    "wall_s": round(self.totals[name][0], 6),
+                    "cpu_s": round(self.totals[name][1], 6),
+                    "calls": self.totals[name][2],
+                }
+                for name in names
+            }
+
+
+class Profiler:
+    """cProfile of the thread which started it, with stage times of the whole process"""
+
+    def __init__(self, workers_dir: str):
+        """:param workers_dir: folder where pool workers dump their profiles"""
+        self.workers_dir = workers_dir
+        self.profile = cProfile.Profile()
+        self.times = StageTimes()
+
+    def start(self) -> None:
+        self.profile.enable()
+
+    def stop(self) -> None:
+        self.profile.disable()
+
+    def dump(self, path: Union[str, Path]) -> None:
+        """Dump the profile into path and stage times next to it"""
+        self.stop()
+        self.profile.dump_stats(path)
+        Path(f"{path}.stages.json").write_text(json.dumps(self.times.as_dict()))
+
+
+# profiler of the process, None if the process is not profiled
+PROFILER: Optional[Profiler] = None
+
+
+def stage_order(name: str) -> int:
+    return STAGES.index(name) if name in STAGES else len(STAGES)
+
+
+class NotProfiled:
+    """Context manager doing nothing, used instead of stages when not profiled"""
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+NOT_PROFILED = NotProfiled()
+# returned by the iterator of timed_iter when it is exhausted
+EXHAUSTED = object()
+
+
+def stage(name: str):
+    """Context manager timing a stage, nothing is timed if the process is not profiled"""
+    if PROFILER is None:
+        return NOT_PROFILED
+    return PROFILER.times.stage(name)
+
+
+def staged(name: str) -> Callable[[Callable], Callable]:
+    """Decorator timing every call of the function as a stage"""
+
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def timed_iter(name: str, iterable: Iterable) -> Iterator:
+    """Yield items of iterable, time of taking every item is counted for the stage"""
+    if PROFILER is None:
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    while True:
+        with stage(name):
+            item = next(iterator, EXHAUSTED)
+        if item is EXHAUSTED:
+            return
+        yield item
+
+
+class TimedStream:
+    """Binary file whose reads are counted for the stage"""
+
+    def __init__(self, name: str, stream: IO[bytes]):
+        self.name_of_stage = name
+        self.stream = stream
+
+    def read(self, size: int = -1) -> bytes:
+        with stage(self.name_of_stage):
+            return self.stream.read(size)
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self.stream, attr)
+
+    def __enter__(self) -> "TimedStream":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stream.close()
+
+
+def timed_stream(name: str, stream: IO[bytes]) -> IO[bytes]:
+    """Count reads of the stream for the stage, the stream itself if not profiled"""
+    return stream if PROFILER is None else TimedStream(name, stream)
+
+
+def pool_options() -> dict:
+    """Options of a pool, which make its workers profile themselves if the process is profiled"""
+    if PROFILER is None:
+        return {}
+    return {"initializer": start_worker, "initargs": (PROFILER.workers_dir,)}
+
+
+def start_worker(workers_dir: str) -> None:
+    """Profile the pool worker until it exits, then dump the profile into workers_dir"""
+    global PROFILER
+    if PROFILER is not None:
+        # the profiler of the parent is copied into the forked worker
+        PROFILER.stop()
+    PROFILER = Profiler(workers_dir)
+    PROFILER.start()
+    path = os.path.join(workers_dir, f"{os.getpid()}.prof")
+    Finalize(None, PROFILER.dump, args=(path,), exitpriority=DUMP_PRIORITY)
+
+
+def shipped(func: Callable) -> Callable:
+    """Make func of pool workers return pickled results, to time pickling as transfer"""
+    return func if PROFILER is None else partial(ship, func)
+
+
+def ship(func: Callable, task: Any) -> tuple[Any, bytes]:
+    """Call func of (key, task) in the worker and pickle its result without the key"""
+    with stage("parse"):
+        key, result = func(task)
+    with stage("transfer"):
+        return key, pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+
+
+def received(result: Any) -> Any:
+    """Unpickle the result shipped by the pool worker"""
+    if PROFILER is None:
+        return result
+    with stage("transfer"):
+        return pickle.loads(result)  # noqa: S301
+
+
+def finish_pool(pool: Pool) -> None:
+    """Let workers of the profiled process exit by themselves, so they dump their profiles"""
+    if PROFILER is not None:
+        pool.close()
+        pool.join()
+
+
+@contextmanager
+def profiling(path: Optional[Union[str, Path]]) -> Iterator[None]:
+    """
+    Profile the process and its pool workers, if path is given.
+    The merged cProfile of all processes is written into path, for pstats, snakeviz
+    and other viewers, wall and CPU times of stages are written into path.stages.json
+    """
+    global PROFILER
+    if path is None:
+        yield
+        return
+    with TemporaryDirectory() as workers_dir:
+        PROFILER = Profiler(workers_dir)
+        PROFILER.start()
+        try:
+            yield
+        finally:
+            profiler, PROFILER = PROFILER, None
+            profiler.stop()
+            save_profile(profiler, path)
+
+
+def save_profile(profiler: Profiler, path: Union[str, Path]) -> None:
+    """Merge profiles and stage times of pool workers into the ones of the process"""
+    stats = pstats.Stats(profiler.profile)
+    workers = sorted(Path(profiler.workers_dir).glob("*.prof"))
+    for worker in workers:
+        stats.add(str(worker))
+        profiler.times.update(json.loads(Path(f"{worker}.stages.json").read_text()))
+    stats.dump_stats(path)
+    times = profiler.times.as_dict()
+    Path(f"{path}.stages.json").write_text(
+        json.dumps({"processes": len(workers) + 1, "stages": times}, indent=2)
+    )
+    for name, stage_times in times.items():
+        logging.info(
+            f"Stage {name}: wall {stage_times['wall_s']:.3f} s, "
+            f"CPU {stage_times['cpu_s']:.3f} s, {stage_times['calls']} calls"
+        )
+    logging.info(f"Profile of {len(workers) + 1} processes is written into {path}")
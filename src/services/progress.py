@@ -0,0 +1,101 @@
+import os
+from itertools import islice
+from threading import Lock
+from typing import Iterable, Optional
+
+# (number of the file in the walk, number of the part of the file)
+TaskKey = tuple[int, int]
+
+
+def anchor(watermark: TaskKey) -> int:
+    """
+    Number of the file of the task just before the watermark: the watermark file
+    if its first parts are done, else the file before it. -1 if nothing is done
+
+    >>> anchor((3, 2)), anchor((3, 0)), anchor((0, 0))
+    (3, 2, -1)
+    """
+    files_done, parts_done = watermark
+    return files_done if parts_done else files_done - 1
+
+
+def walk_matches(files: Iterable[str], watermark: TaskKey, path: Optional[str]) -> bool:
+    """
+    Check if the walk has the anchor file of the watermark at its place, otherwise
+    files were added or removed before it and numbers of the walk are shifted
+
+    >>> walk_matches(["/a.fb2", "/b.fb2"], (2, 0), "/b.fb2")
+    True
+    >>> walk_matches(["/a.fb2", "/new.fb2", "/b.fb2"], (2, 0), "/b.fb2")
+    False
+    """
+    index = anchor(watermark)
+    if index < 0:
+        return True
+    file = next(islice(files, index, None), None)
+    return path is not None and file is not None and os.path.abspath(file) == path
+
+
+class IngestProgress:
+    """
+    Progress of the walk over files and parts of big archives. Every task is keyed by
+    (file number, part number) in the walk order. The watermark is the key of the first
+    task whose books are not all handed over yet, so every task before it is done
+    """
+
+    def __init__(self, skip: TaskKey = (0, 0)):
+        """:param skip: watermark of the resumed run, tasks before it are done"""
+        self.skip = skip
+        self.walked = 0
+        self.pending: set[TaskKey] = set()
+        # paths of files with pending tasks and of the files before them
+        self.paths: dict[int, tuple[Optional[str], str]] = {}
+        self.parts: dict[int, int] = {}
+        self.last_walked: Optional[str] = None
+        # tasks are started by the task feeder thread of the pool
+        self.lock = Lock()
+
+    @property
+    def resumed(self) -> bool:
+        return self.skip != (0, 0)
+
+    @property
+    def watermark(self) -> TaskKey:
+        with self.lock:
+            return min(self.pending, default=(self.walked, 0))
+
+    @property
+    def checkpoint(self) -> tuple[TaskKey, Optional[str]]:
+        """Watermark with the absolute path of its anchor file, None if nothing is done"""
+        with self.lock:
+            watermark = min(self.pending, default=(self.walked, 0))
+            if watermark[0] == self.walked:
+                return watermark, self.last_walked
+            before, file = self.paths[watermark[0]]
+            return watermark, file if watermark[1] else before
+
+    def is_done(self, key: TaskKey) -> bool:
+        """Check if the task was done by the resumed run"""
+        return key < self.skip
+
+    def start(self, index: int, file: str, keys: Iterable[TaskKey]) -> None:
+        """Register tasks of the file, the walk is past the file then"""
+        keys = list(keys)
+        path = os.path.abspath(file)
+        with self.lock:
+            if keys:
+                self.paths[index] = (self.last_walked, path)
+                self.parts[index] = len(keys)
+            self.pending.update(keys)
+            self.walked = index + 1
+            self.last_walked = path
+
+    def finish(self, key: TaskKey) -> None:
+        """Mark the task done, all its books are handed over"""
+        with self.lock:
+            if key not in self.pending:
+                return
+            self.pending.remove(key)
+            self.parts[key[0]] -= 1
+            if not self.parts[key[0]]:
+                del self.parts[key[0]], self.paths[key[0]]
@@ -0,0 +1,141 @@
+import json
+import logging
+import os
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Lock
+from typing import Any, Iterator, Optional, Union
+
+# results kept by the cache, the least recently used ones are dropped first
+CACHE_SIZE = 10_000
+
+
+class ResultCache:
+    """
+    LRU cache of search results of one catalog generation. Every change of books
+    bumps the generation, so results of an older one are all dropped at once
+    """
+
+    def __init__(self, max_size: int = CACHE_SIZE):
+        self.max_size = max_size
+        self.generation: Optional[int] = None
+        self.results: OrderedDict[str, Any] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # the cache of a long-running process is shared by its threads
+        self.lock = Lock()
+
+    def get(self, key: str, generation: int) -> Optional[Any]:
+        """
+        Result of the key cached for the generation, None if it is not cached
+
+        >>> cache = ResultCache()
+        >>> cache.put("key", 1, [1])
+        >>> cache.get("key", 1), cache.get("key", 2)
+        ([1], None)
+        """
+        with self.lock:
+            self.validate(generation)
+            result = self.results.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self.results.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key: str, generation: int, result: Any) -> None:
+        """Cache the result, unless a newer generation was seen since it was found"""
+        with self.lock:
+            if self.generation is None:
+                self.generation = generation
+            if generation != self.generation:
+                return
+            self.results[key] = result
+            self.results.move_to_end(key)
+            while len(self.results) > self.max_size:
+                self.results.popitem(last=False)
+
+    def validate(self, generation: int) -> None:
+        """Drop all results if they were cached for other generation"""
+        if generation != self.generation:
+            self.results.clear()
+            self.generation = generation
+
+    def stats(self) -> dict:
+        """
+        Hits and misses of all lookups with their ratio
+
+        >>> cache = ResultCache()
+        >>> cache.get("key", 1)
+        >>> cache.put("key", 1, [])
+        >>> cache.get("key", 1)
+        []
+        >>> cache.stats()
+        {'hits': 1, 'misses': 1, 'hit_ratio': 0.5, 'results': 1, 'generation': 1}
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "results": len(self.results),
+                "generation": self.generation,
+            }
+
+    def __str__(self) -> str:
+        stats = self.stats()
+        return (
+            f"{stats['hits']} hits, {stats['misses']} misses, "
+            f"hit ratio {stats['hit_ratio']:.2f}, {stats['results']} results"
+        )
+
+
+def load_cache(path: Union[str, Path], max_size: int = CACHE_SIZE) -> ResultCache:
+    """Load the cache saved by save_cache, an empty cache if there is no such file"""
+    cache = ResultCache(max_size)
+    if not os.path.exists(path):
+        return cache
+    try:
+        saved = json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError) as err:
+        logging.warning(f"Result cache {path} is not loaded: {err}")
+        return cache
+    cache.generation = saved["generation"]
+    cache.hits, cache.misses = saved["hits"], saved["misses"]
+    # results are saved from the least recently used one
+    cache.results.update(saved["results"][-max_size:])
+    return cache
+
+
+def save_cache(cache: ResultCache, path: Union[str, Path]) -> None:
+    """Save results and counters of the cache, readers never see a half written file"""
+    with cache.lock:
+        saved = {
+            "generation": cache.generation,
+            "hits": cache.hits,
+            "misses": cache.misses,
+            "results": list(cache.results.items()),
+        }
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    Path(tmp_path).write_text(json.dumps(saved, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def caching(path: Optional[Union[str, Path]]) -> Iterator[Optional[ResultCache]]:
+    """
+    Cache results in the file between runs, if path is given. Hits and misses
+    are counted over all runs and logged when the run is finished
+    """
+    if path is None:
+        yield None
+        return
+    cache = load_cache(path)
+    try:
+        yield cache
+    finally:
+        save_cache(cache, path)
+        logging.info(f"Result cache: {cache}")
@@ -0,0 +1,27 @@
+import logging
+import os
+
+# defaults of CLI args, kept here so parsing args imports neither SQLAlchemy nor parsers
+# books saved in one transaction
+BATCH_SIZE = 1000
+# queries of a batch searched by one SELECT
+SEARCH_CHUNK_SIZE = 1000
+# books deleted by one DELETE of wiper, row locks are held for one chunk at a time
+DELETE_CHUNK_SIZE = 10_000
+# most similar books returned by a fuzzy search
+FUZZY_LIMIT = 10
+# XML backends of fb2_backends.BACKENDS and the one used by default
+BACKEND_NAMES = ("defusedxml", "lxml", "expat")
+DEFAULT_BACKEND = "defusedxml"
+# extensions of books, "" is a book without extension
+FILE_EXTENSIONS = ["", ".fb2", ".gz", ".zip"]
+# logging format of every CLI
+LOGGING_FORMAT = "[%(message)s]"
+
+
+def setup_logging() -> None:
+    """Configure logging with LOGGING_LEVEL from the environment or .env file"""
+    import dotenv
+
+    dotenv.load_dotenv()
+    logging.basicConfig(format=LOGGING_FORMAT, level=os.getenv("LOGGING_LEVEL"))
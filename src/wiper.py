@@ -1,29 +1,218 @@
+from __future__ import annotations
+
 import logging
 import sys
-from argparse import ArgumentParser
+from argparse import ArgumentParser, Namespace
+from typing import TYPE_CHECKING, Optional
+
+from services.catalog_client import SERVER_URL, ServerError, call_server
+from services.cli_args import (
+    RequestParser,
+    open_input,
+    request_argv,
+    validate_chunk_size,
+)
+from services.startup import DELETE_CHUNK_SIZE, setup_logging
+
+if TYPE_CHECKING:
+    from db.core import Session
+
+# args of the run of wiper itself, they are not sent to the catalog server
+CLIENT_ARGS = ("server", "profile")
+# keys of the request of the catalog server by dests of args, which differ from them
+REQUEST_ARGS = {"id": "number"}
 
-from db.core import session_scope
-from db.services import delete_book_or_all_db
 
+def parse_args(_args, parser_class: type[ArgumentParser] = ArgumentParser):
+    """Create parser of parser_class and parse args with the created parser"""
+    parser = create_parser(parser_class)
+    args = parser.parse_args(_args)
+    validate_args(parser, args)
+    return args
 
-def parse_args(_args):
-    """Create parser with args (-n, -a) and parse args with the created parser"""
-    parser = ArgumentParser(description="Delete books in db")
-    group = parser.add_mutually_exclusive_group(required=True)
+
+def create_parser(
+    parser_class: type[ArgumentParser] = ArgumentParser,
+) -> ArgumentParser:
+    """
+    Create parser with args (-n, -a, --ids, --id-range, --author, --years,
+    --chunk-size, --server, --profile)
+    """
+    parser = parser_class(description="Delete books in db")
+    group = parser.add_mutually_exclusive_group()
     group.add_argument(
         "-n", type=int, dest="number", required=False, help="Primary key of book"
     )
-    group.add_argument("-a", dest="all", action="store_true", help="Flush DB")
-    return parser.parse_args(_args)
+    group.add_argument(
+        "-a",
+        dest="all",
+        action="store_true",
+        help="Flush DB by TRUNCATE, ids of new books start from 1 again",
+    )
+    group.add_argument(
+        "--ids",
+        dest="ids",
+        help="Delete books by primary keys of this file, separated by spaces "
+        "or lines, - is stdin",
+    )
+    parser.add_argument(
+        "--id-range",
+        dest="id_range",
+        nargs=2,
+        type=int,
+        metavar=("FIRST", "LAST"),
+        help="Delete books with primary keys from FIRST to LAST",
+    )
+    parser.add_argument(
+        "--author",
+        dest="author",
+        nargs=2,
+        metavar=("FIRST_NAME", "LAST_NAME"),
+        help="Delete books of the author",
+    )
+    parser.add_argument(
+        "--years",
+        dest="years",
+        nargs=2,
+        type=int,
+        metavar=("FIRST", "LAST"),
+        help="Delete books published from FIRST to LAST year, "
+        "--id-range, --author and --years can be given together",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        dest="chunk_size",
+        type=validate_chunk_size,
+        default=DELETE_CHUNK_SIZE,
+        help="Books deleted and committed at once by --ids and filters, "
+        f"default is {DELETE_CHUNK_SIZE}",
+    )
+    parser.add_argument(
+        "--server",
+        dest="server",
+        nargs="?",
+        const=SERVER_URL,
+        help=f"Delete books by the catalog server at this url, default is {SERVER_URL}",
+    )
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        help="Write cProfile of the run into this file, "
+        "with wall and CPU time of stages into PROFILE.stages.json",
+    )
+    return parser
+
+
+def validate_args(parser: ArgumentParser, args: Namespace) -> None:
+    """Exit with an error if args select books in no way or in two ways"""
+    selected = args.number is not None or args.all or args.ids is not None
+    filtered = any(
+        value is not None for value in (args.id_range, args.author, args.years)
+    )
+    if selected == filtered:
+        parser.error(
+            "books are selected by one of -n, -a, --ids "
+            "or by --id-range, --author, --years"
+        )
+    for name, bounds in (("--id-range", args.id_range), ("--years", args.years)):
+        if bounds is not None and bounds[0] > bounds[1]:
+            parser.error(f"{name} starts after its end")
 
 
 def main():
+    setup_logging()
     logging.debug(f"Called {sys.argv[0]} with {sys.argv[1:]}")
 
     args = parse_args(sys.argv[1:])
+    # cProfile is imported only by runs which delete books
+    from services.profiling import profiling
+
+    try:
+        with profiling(args.profile):
+            row_deleted = delete_books(args)
+    except (ServerError, ValueError) as err:
+        logging.error(err)
+        sys.exit(1)
+    logging.info(f"Deleted rows: {row_deleted}")
+
+
+def delete_books(args) -> int:
+    """Delete books selected by args, in DB or by the catalog server"""
+    request = delete_request(args)
+    if args.server is not None:
+        return call_server(args.server, "delete", request)["deleted"]
+    from db.core import session_scope
+
     with session_scope() as session:
-        row_deleted = delete_book_or_all_db(session, args.number, args.all)
-        logging.info(f"Deleted rows: {row_deleted}")
+        return delete_selected(session, request)
+
+
+def delete_request(args, ids: Optional[list[int]] = None) -> dict:
+    """Deletion of args, like the catalog server receives it, ids of --ids file are read"""
+    if ids is None and args.ids is not None:
+        ids = read_ids(args.ids)
+    return {
+        "id": args.number,
+        "all": args.all,
+        "ids": ids,
+        "id_range": args.id_range,
+        "author": args.author,
+        "years": args.years,
+        "chunk_size": args.chunk_size,
+    }
+
+
+def parse_delete_request(request: dict) -> dict:
+    """
+    Deletion requested from the catalog server, validated by parse_args like args
+    of wiper are. Its ids are given by the list instead of --ids file
+    """
+    ids = request.get("ids")
+    if ids is not None and not (
+        isinstance(ids, list) and all(type(id_) is int for id_ in ids)
+    ):
+        raise ValueError("ids is not a list of primary keys")
+    fields = {
+        REQUEST_ARGS.get(key, key): value
+        for key, value in request.items()
+        if key != "ids"
+    }
+    argv = request_argv(create_parser(), fields, exclude=CLIENT_ARGS)
+    if ids is not None:
+        # the list stands for the file, so parse_args sees books selected by --ids
+        argv += ["--ids", "-"]
+    return delete_request(parse_args(argv, RequestParser), ids)
+
+
+def delete_selected(session: Session, request: dict) -> int:
+    """
+    Delete the book by id or all books, else books by ids or by all given filters
+    (id_range, author, years) by chunks of chunk_size books
+    """
+    from db.services import delete_book_or_all_db, delete_books_db
+
+    if request.get("all") or request.get("id") is not None:
+        return delete_book_or_all_db(
+            session, request.get("id"), bool(request.get("all"))
+        )
+    return delete_books_db(
+        session,
+        request.get("ids"),
+        request.get("id_range"),
+        request.get("author"),
+        request.get("years"),
+        request.get("chunk_size") or DELETE_CHUNK_SIZE,
+    )
+
+
+def read_ids(path: str) -> list[int]:
+    """Primary keys of books of the file separated by spaces or lines, - is stdin"""
+    with open_input(path) as file:
+        words = file.read().split()
+    try:
+        return [int(word) for word in words]
+    except ValueError as err:
+        raise ValueError(f"{path} has a wrong primary key: {err}") from err
 
 
 if __name__ == "__main__":
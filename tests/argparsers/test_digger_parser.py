@@ -4,7 +4,13 @@ from unittest.mock import patch
 
 import pytest
 
-from src.digger import parse_args, validate_dir_path, validate_file_path
+from src.digger import (
+    ingest_args,
+    ingest_request,
+    parse_args,
+    validate_dir_path,
+    validate_file_path,
+)
 
 
 def test_dir_path__if_dir_do_not_exists():
@@ -109,3 +115,144 @@ def test_parse_args__a__args(mock_file_path):
     assert args.dir_path is None
     assert args.book_path == "/path/to/file"
     assert not args.flag
+
+
+@patch("src.digger.validate_dir_path", side_effect=lambda x: x)
+def test_parse_args__parser__default_from_config(mock_dir_path):
+    args = parse_args(["-s", "/path/to/dir/"])
+    assert args.xml_parser == "defusedxml"
+
+
+@patch("src.digger.get_digger_config", return_value={"XML_PARSER": "html"})
+@patch("src.digger.validate_dir_path", side_effect=lambda x: x)
+def test_parse_args__parser__unknown_backend_in_config(
+    mock_dir_path, mock_config, capsys
+):
+    with pytest.raises(SystemExit):
+        parse_args(["-s", "/path/to/dir/"])
+    assert "XML_PARSER `html` of config.ini" in capsys.readouterr().err
+    assert parse_args(["-s", "/path/to/dir/", "--parser", "lxml"]).xml_parser == "lxml"
+    with pytest.raises(SystemExit):
+        parse_args(["--help"])
+    assert "--parser" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("xml_parser", ["defusedxml", "lxml", "expat"])
+@patch("src.digger.validate_dir_path", side_effect=lambda x: x)
+def test_parse_args__parser__arg(mock_dir_path, xml_parser):
+    args = parse_args(["-s", "/path/to/dir/", "--parser", xml_parser])
+    assert args.xml_parser == xml_parser
+
+
+@patch("src.digger.validate_dir_path", side_effect=lambda x: x)
+def test_parse_args__parser__unknown_backend(mock_dir_path):
+    with pytest.raises(SystemExit):
+        parse_args(["-s", "/path/to/dir/", "--parser", "html"])
+
+
+@patch("src.digger.validate_dir_path", side_effect=lambda x: x)
+def test_parse_args__manifest_flags__default(mock_dir_path):
+    args = parse_args(["-s", "/path/to/dir/"])
+    assert not args.rescan
+    assert not args.mark_missing
+
+
+@patch("src.digger.validate_dir_path", side_effect=lambda x: x)
+def test_parse_args__manifest_flags(mock_dir_path):
+    args = parse_args(["-s", "/path/to/dir/", "--rescan", "--mark-missing"])
+    assert args.rescan
+    assert args.mark_missing
+
+
+@patch("src.digger.validate_dir_path", side_effect=lambda x: x)
+def test_parse_args__batch_size__default_from_config(mock_dir_path):
+    args = parse_args(["-s", "/path/to/dir/"])
+    assert args.batch_size == 1000
+    assert not args.resume
+
+
+@patch("src.digger.validate_dir_path", side_effect=lambda x: x)
+def test_parse_args__batch_size_and_resume(mock_dir_path):
+    args = parse_args(["-s", "/path/to/dir/", "--batch-size", "50", "--resume"])
+    assert args.batch_size == 50
+    assert args.resume
+
+
+@pytest.mark.parametrize("batch_size", ["0", "-1", "ten"])
+@patch("src.digger.validate_dir_path", side_effect=lambda x: x)
+def test_parse_args__batch_size__not_valid(mock_dir_path, batch_size):
+    with pytest.raises(SystemExit):
+        parse_args(["-s", "/path/to/dir/", "--batch-size", batch_size])
+
+
+@patch("src.digger.validate_dir_path", side_effect=lambda x: x)
+def test_parse_args__writers(mock_dir_path):
+    assert parse_args(["-s", "/path/to/dir/"]).writers == 1
+    assert parse_args(["-s", "/path/to/dir/", "--writers", "4"]).writers == 4
+
+
+@patch("src.digger.validate_dir_path", side_effect=lambda x: x)
+def test_parse_args__writers__not_valid(mock_dir_path):
+    with pytest.raises(SystemExit):
+        parse_args(["-s", "/path/to/dir/", "--writers", "0"])
+
+
+@patch("src.digger.validate_dir_path", side_effect=lambda x: x)
+def test_parse_args__profile(mock_dir_path):
+    assert parse_args(["-s", "/path/to/dir/"]).profile is None
+    args = parse_args(["-s", "/path/to/dir/", "--profile", "digger.prof"])
+    assert args.profile == "digger.prof"
+
+
+@patch("src.digger.validate_dir_path", side_effect=lambda x: x)
+def test_parse_args__metrics(mock_dir_path):
+    args = parse_args(["-s", "/path/to/dir/"])
+    assert args.metrics_jsonl is None
+    assert args.metrics_prom is None
+    assert args.metrics_interval == 10
+    args = parse_args(
+        ["-s", "/path/to/dir/", "--metrics-prom", "digger.prom"]
+        + ["--metrics-jsonl", "digger.jsonl", "--metrics-interval", "0.5"]
+    )
+    assert args.metrics_jsonl == "digger.jsonl"
+    assert args.metrics_prom == "digger.prom"
+    assert args.metrics_interval == 0.5
+
+
+@pytest.mark.parametrize("interval", ["0", "-1", "often"])
+@patch("src.digger.validate_dir_path", side_effect=lambda x: x)
+def test_parse_args__metrics_interval__not_valid(mock_dir_path, interval):
+    with pytest.raises(SystemExit):
+        parse_args(["-s", "/path/to/dir/", "--metrics-interval", interval])
+
+
+@patch("src.digger.validate_dir_path", side_effect=lambda x: x)
+def test_parse_args__server(mock_dir_path):
+    assert parse_args(["-s", "/path/to/dir/"]).server is None
+    args = parse_args(["-s", "/path/to/dir/", "--server"])
+    assert args.server == "http://127.0.0.1:8008"
+
+
+def test_ingest_request_and_ingest_args(tmp_path):
+    args = parse_args(["-s", str(tmp_path), "--writers", "2", "--server"])
+    request = ingest_request(args)
+    assert "server" not in request
+    assert request["dir_path"] == str(tmp_path)
+    ingested = ingest_args(request)
+    assert ingested.dir_path == str(tmp_path)
+    assert ingested.writers == 2
+    assert ingested.server is None
+
+
+def test_ingest_args__path_do_not_exists():
+    with pytest.raises(ValueError, match="not a valid path for directory"):
+        ingest_args({"dir_path": "/not_exists/"})
+
+
+def test_ingest_args__validated_like_args(tmp_path):
+    request = {"dir_path": str(tmp_path), "flag": True, "batch_size": 50}
+    args = ingest_args({**request, "xml_parser": "expat", "resume": False})
+    assert (args.flag, args.batch_size, args.xml_parser) == (True, 50, "expat")
+    assert not args.resume
+    with pytest.raises(ValueError, match="unknown keys: metrics_jsonl, cores"):
+        ingest_args({**request, "metrics_jsonl": "m.jsonl", "cores": 2})
@@ -0,0 +1,52 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+SRC_DIR = Path(__file__).parents[2] / "src"
+# microseconds of all imports of `CLI --help`, it took about 190 ms with SQLAlchemy
+IMPORT_BUDGET_US = 80_000
+# modules, which are imported only by runs which need them
+HEAVY_MODULES = (
+    "sqlalchemy",
+    "psycopg2",
+    "db",
+    "multiprocessing",
+    "cProfile",
+    "defusedxml",
+    "lxml",
+    "urllib.request",
+)
+
+
+def import_times(script: str) -> dict[str, int]:
+    """Self time of every module imported by `python -X importtime script --help`"""
+    result = subprocess.run(  # noqa: S603
+        [sys.executable, "-X", "importtime", script, "--help"],
+        cwd=SRC_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "self [us]" not in line:
+            self_us, _, name = line.removeprefix("import time:").split("|")
+            times[name.strip()] = int(self_us)
+    return times
+
+
+@pytest.mark.parametrize("script", ["digger.py", "seeker.py", "wiper.py"])
+def test_help__imports_no_heavy_modules(script):
+    imported = import_times(script)
+    assert not [
+        name
+        for name in imported
+        if name in HEAVY_MODULES or name.split(".")[0] in HEAVY_MODULES
+    ]
+
+
+@pytest.mark.parametrize("script", ["digger.py", "seeker.py", "wiper.py"])
+def test_help__import_time_budget(script):
+    assert sum(import_times(script).values()) < IMPORT_BUDGET_US
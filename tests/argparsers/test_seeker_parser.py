@@ -53,3 +53,71 @@ def test_parse_args__a__but_with_three_args():
 def test_parse_args__a__but_with_one_args():
     with pytest.raises(SystemExit):
         parse_args(["-n", "book", "-a", "first"])
+
+
+def test_parse_args__profile():
+    assert parse_args(["-n", "Book"]).profile is None
+    assert (
+        parse_args(["-n", "Book", "--profile", "seeker.prof"]).profile == "seeker.prof"
+    )
+
+
+def test_parse_args__fuzzy_and_limit():
+    args = parse_args(["-n", "Book", "--fuzzy"])
+    assert args.fuzzy
+    assert args.limit == 10
+    assert parse_args(["-n", "Book", "--fuzzy", "--limit", "3"]).limit == 3
+    assert not parse_args(["-n", "Book"]).fuzzy
+
+
+def test_parse_args__cache():
+    assert parse_args(["-n", "Book"]).cache is None
+    assert parse_args(["-n", "Book", "--cache", "cache.json"]).cache == "cache.json"
+
+
+def test_parse_args__batch():
+    args = parse_args(["--batch", "queries.csv", "-s"])
+    assert args.batch == "queries.csv"
+    assert args.book_name is None
+    assert args.query_format is None
+    assert args.chunk_size == 1000
+    assert args.primary_key_flag
+
+
+def test_parse_args__batch_format_and_chunk_size():
+    args = parse_args(["--batch", "-", "--format", "csv", "--chunk-size", "10"])
+    assert args.batch == "-"
+    assert args.query_format == "csv"
+    assert args.chunk_size == 10
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ["--batch", "queries.csv", "-n", "Book"],
+        ["--batch", "queries.csv", "-y", "2021"],
+        ["--batch", "queries.csv", "-a", "John", "Doe"],
+        ["--batch", "queries.csv", "--chunk-size", "0"],
+        ["--batch", "queries.csv", "--format", "xml"],
+        ["--batch", "queries.csv", "--fuzzy"],
+        ["--batch", "queries.csv", "--cache", "cache.json"],
+        ["-n", "Book", "--fuzzy", "--cache", "cache.json"],
+        ["-n", "Book", "--fuzzy", "--limit", "0"],
+    ],
+)
+def test_parse_args__batch__not_valid(args):
+    with pytest.raises(SystemExit):
+        parse_args(args)
+
+
+def test_parse_args__server():
+    assert parse_args(["-n", "Book"]).server is None
+    assert parse_args(["-n", "Book", "--server"]).server == "http://127.0.0.1:8008"
+    assert parse_args(["--batch", "-", "--server", "http://host:1"]).server == (
+        "http://host:1"
+    )
+
+
+def test_parse_args__server_with_cache():
+    with pytest.raises(SystemExit):
+        parse_args(["-n", "Book", "--server", "--cache", "cache.json"])
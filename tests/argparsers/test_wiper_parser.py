@@ -1,6 +1,6 @@
 import pytest
 
-from src.wiper import parse_args
+from src.wiper import parse_args, parse_delete_request, read_ids
 
 
 def test_parse_args__without_args():
@@ -23,3 +23,61 @@ def test_parse_args__a__arg():
     args = parse_args(["-a"])
     assert args.number is None
     assert args.all
+
+
+def test_parse_args__profile():
+    assert parse_args(["-a"]).profile is None
+    assert parse_args(["-a", "--profile", "wiper.prof"]).profile == "wiper.prof"
+
+
+def test_parse_args__server():
+    assert parse_args(["-a"]).server is None
+    assert parse_args(["-a", "--server"]).server == "http://127.0.0.1:8008"
+    assert parse_args(["-a", "--server", "http://host:1"]).server == "http://host:1"
+
+
+def test_parse_args__filters_together():
+    args = parse_args(["--author", "Лев", "Толстой", "--years", "1850", "1870"])
+    assert args.author == ["Лев", "Толстой"]
+    assert args.years == [1850, 1870]
+    assert args.id_range is None
+    assert args.chunk_size == 10_000
+
+
+def test_parse_args__ids_and_chunk_size():
+    args = parse_args(["--ids", "ids.txt", "--chunk-size", "500"])
+    assert args.ids == "ids.txt"
+    assert args.chunk_size == 500
+
+
+@pytest.mark.parametrize(
+    "argv",
+    [
+        ["-a", "--years", "1850", "1870"],
+        ["--ids", "ids.txt", "--id-range", "1", "10"],
+        ["--id-range", "10", "1"],
+        ["--years", "1870", "1850"],
+        ["--ids", "ids.txt", "--chunk-size", "0"],
+    ],
+)
+def test_parse_args__wrong_selection(argv):
+    with pytest.raises(SystemExit):
+        parse_args(argv)
+
+
+def test_read_ids__spaces_and_lines(tmp_path):
+    path = tmp_path / "ids.txt"
+    path.write_text("1 2\n3\n\n")
+    assert read_ids(str(path)) == [1, 2, 3]
+    path.write_text("1 two")
+    with pytest.raises(ValueError, match="wrong primary key"):
+        read_ids(str(path))
+
+
+def test_parse_delete_request__validated_like_args():
+    request = parse_delete_request({"ids": [3, 1], "chunk_size": 2})
+    assert (request["ids"], request["chunk_size"], request["id"]) == ([3, 1], 2, None)
+    request = parse_delete_request({"id": 5})
+    assert (request["id"], request["all"]) == (5, False)
+    with pytest.raises(ValueError, match="not allowed with argument"):
+        parse_delete_request({"id": 5, "all": True})
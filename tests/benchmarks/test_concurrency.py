@@ -0,0 +1,42 @@
+import pytest
+
+from benchmarks.concurrency import (
+    LEVELS,
+    TEST_DB_URL,
+    new_books,
+    parse_args,
+    split,
+    writer_books,
+)
+from benchmarks.corpus import BookGenerator
+
+
+def test_parse_args__defaults():
+    args = parse_args(["-o", "out.json"])
+    assert args.db_url == TEST_DB_URL
+    assert args.levels == list(LEVELS)
+
+
+def test_parse_args__levels_below_one():
+    with pytest.raises(SystemExit):
+        parse_args(["-o", "out.json", "--levels", "0", "4"])
+
+
+def test_split__every_item_once():
+    parts = split(list(range(10)), 3)
+    assert [len(part) for part in parts] == [4, 3, 3]
+    assert sorted(sum(parts, [])) == list(range(10))
+
+
+def test_writer_books__authors_of_writers_differ():
+    books = new_books(BookGenerator(), 0, 40)
+    parts = writer_books(books, 4)
+
+    authors = [{book["author_last_name"] for book in part} for part in parts]
+    assert sum(map(len, parts)) == 40
+    assert all(
+        not first & second
+        for first in authors
+        for second in authors
+        if first is not second
+    )
@@ -0,0 +1,91 @@
+import gzip
+from zipfile import ZipFile
+
+import pytest
+
+from benchmarks.corpus import BookGenerator, parse_args, write_corpus
+from services.fb2_backends import BACKENDS
+from services.fb2_parser import FB2Parser
+from services.parse_book_from_file import get_books_from_directory
+
+
+def sort_books(books):
+    return sorted(books, key=lambda book: book["name"])
+
+
+def test_book_generator__same_seed_same_books():
+    first, second = BookGenerator(seed=1), BookGenerator(seed=1)
+    assert first.content(3, 10) == second.content(3, 10)
+    assert first.content(3, 10) != BookGenerator(seed=2).content(3, 10)
+
+
+def test_book_generator__body_size():
+    small = BookGenerator(body_size=1000).content(0, 1)
+    big = BookGenerator(body_size=100_000).content(0, 1)
+    assert len(small) < 3000
+    assert len(big) > 100_000
+
+
+@pytest.mark.parametrize("encoding", ["utf-8", "windows-1251", "koi8-r"])
+@pytest.mark.parametrize("backend", list(BACKENDS))
+def test_book_generator__parsed_as_generated(encoding, backend):
+    if backend == "lxml":
+        pytest.importorskip("lxml")
+    generator = BookGenerator(body_size=2000, cover_size=5000, encodings=[encoding])
+    content = generator.content(5, 100)
+    assert content.startswith(f'<?xml version="1.0" encoding="{encoding}"?>'.encode())
+    assert b'<binary id="cover.jpg"' in content
+    for header_only in (True, False):
+        book = FB2Parser(text=content, header_only=header_only, backend=backend)
+        assert book.as_dict == generator.book(5, 100)
+
+
+def test_book_generator__authors_have_several_books():
+    generator = BookGenerator()
+    authors = {
+        (book["author_first_name"], book["author_last_name"])
+        for book in (generator.book(number, 100) for number in range(100))
+    }
+    assert len(authors) == 10
+
+
+def test_write_corpus__formats(tmp_path):
+    generator = BookGenerator(body_size=500, encodings=["utf-8", "windows-1251"])
+    books = write_corpus(tmp_path, 10, generator, zip_members=2)
+
+    files = sorted(path.name for path in tmp_path.iterdir())
+    assert files == [
+        "00000000.fb2",
+        "00000001.fb2.gz",
+        "00000002.zip",
+        "00000003.fb2",
+        "00000004.fb2.gz",
+        "00000006.fb2",
+        "00000007.fb2.gz",
+        "00000008.zip",
+        "00000009.fb2",
+    ]
+    with ZipFile(tmp_path / "00000002.zip") as zip_obj:
+        assert zip_obj.namelist() == ["00000002.fb2", "00000005.fb2"]
+    gz_book = gzip.decompress((tmp_path / "00000001.fb2.gz").read_bytes())
+    assert gz_book == generator.content(1, 10)
+    assert len(books) == 10
+
+
+def test_write_corpus__found_by_digger(tmp_path):
+    generator = BookGenerator(body_size=500, encodings=["utf-8", "koi8-r"])
+    books = write_corpus(tmp_path, 30, generator, zip_members=4)
+    assert sort_books(get_books_from_directory(tmp_path)) == sort_books(books)
+
+
+def test_corpus_parser__defaults():
+    args = parse_args(["-o", "books"])
+    assert args.books == 1000
+    assert args.formats == ["fb2", "fb2.gz", "zip"]
+    assert args.encodings == ["utf-8"]
+    assert args.cover_size == 0
+
+
+def test_corpus_parser__wrong_format():
+    with pytest.raises(SystemExit):
+        parse_args(["-o", "books", "--formats", "epub"])
@@ -0,0 +1,64 @@
+import json
+import sys
+from unittest.mock import patch
+
+from benchmarks.corpus import BookGenerator, write_corpus
+from benchmarks.suite import (
+    DB_BENCHMARKS,
+    FILE_BENCHMARKS,
+    Corpus,
+    compare,
+    main,
+    read_texts,
+    run_benchmarks,
+)
+
+
+def make_corpus(dir_path, books=12):
+    generator = BookGenerator(body_size=500, cover_size=100)
+    books = write_corpus(dir_path, books, generator, zip_members=3)
+    return Corpus(str(dir_path), books, read_texts(str(dir_path)))
+
+
+def test_read_texts__every_book(tmp_path):
+    corpus = make_corpus(tmp_path)
+    assert len(corpus.texts) == 12
+
+
+def test_run_benchmarks__file_benchmarks(tmp_path):
+    corpus = make_corpus(tmp_path)
+    results = run_benchmarks(corpus, list(FILE_BENCHMARKS), repeat=1)
+
+    assert results["fb2_parser/defusedxml/header"]["items"] == 12
+    assert results["file_extraction/gz"]["items"] == 4
+    assert results["file_extraction/zip"]["items"] == 4
+    assert results["get_books_from_directory/defusedxml"]["items"] == 12
+    assert all(result["wall_s"] > 0 for result in results.values())
+
+
+def test_run_benchmarks__db_benchmarks_skipped_without_url(tmp_path):
+    corpus = make_corpus(tmp_path)
+    assert run_benchmarks(corpus, list(DB_BENCHMARKS), repeat=1) == {}
+
+
+def test_compare__regressions_over_threshold():
+    previous = {"results": {"a": {"wall_s": 1.0}, "b": {"wall_s": 1.0}}}
+    current = {
+        "results": {"a": {"wall_s": 1.05}, "b": {"wall_s": 2.0}, "c": {"wall_s": 9}}
+    }
+    assert compare(previous, current) == ["b"]
+
+
+@patch("benchmarks.suite.git_commit", return_value="abc")
+def test_main__writes_results(mock_git_commit, tmp_path):
+    output = tmp_path / "results.json"
+    argv = ["suite", "-o", str(output), "-n", "6", "--repeat", "1"]
+    argv += ["--body-size", "300", "-b", "file_extraction"]
+    with patch.object(sys, "argv", argv):
+        main()
+
+    report = json.loads(output.read_text())
+    mock_git_commit.assert_called_once()
+    assert report["commit"] == "abc"
+    assert report["corpus"]["books"] == 6
+    assert set(report["results"]) == {"file_extraction/gz", "file_extraction/zip"}
@@ -0,0 +1,61 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
+
+from src.db.async_services import (
+    ASYNC_DRIVER,
+    async_engine_options,
+    create_async_db_engine,
+    get_async_url,
+    search_concurrently,
+)
+
+
+def test_get_async_url__async_driver():
+    url = get_async_url({"db_type": "postgresql", "db_name": "library_db"})
+    assert url.drivername == ASYNC_DRIVER
+    assert url.database == "library_db"
+    assert "prepared_statement_cache_size" not in url.query
+
+
+def test_async_engine_options__pool_and_session_settings():
+    options = async_engine_options({"pool_size": "8", "work_mem": "64MB"})
+    assert options["poolclass"] is AsyncAdaptedQueuePool
+    assert options["pool_size"] == 8
+    assert options["connect_args"] == {"server_settings": {"work_mem": "64MB"}}
+
+
+def test_async_engine_options__pgbouncer():
+    options = async_engine_options(
+        {"pool_size": "0", "pgbouncer": "true", "work_mem": "64MB"}
+    )
+    assert options["poolclass"] is NullPool
+    assert options["connect_args"] == {"statement_cache_size": 0}
+
+
+@patch("src.db.async_services.find_spec", return_value=None)
+def test_create_async_db_engine__without_asyncpg(mock_find_spec):
+    with pytest.raises(ImportError, match="pip install asyncpg"):
+        create_async_db_engine({})
+
+
+@pytest.mark.usefixtures("_setup_database")
+def test_search_concurrently__results_in_order(connection):
+    pytest.importorskip("asyncpg")
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    url = connection.engine.url.set(drivername=ASYNC_DRIVER)
+    searches = [
+        (f"No such book {number}", None, None, None, False) for number in range(20)
+    ]
+
+    async def run():
+        engine = create_async_engine(url, pool_size=4)
+        try:
+            return await search_concurrently(searches, 4, engine)
+        finally:
+            await engine.dispose()
+
+    assert asyncio.run(run()) == [[]] * 20
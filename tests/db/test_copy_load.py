@@ -0,0 +1,134 @@
+import logging
+from time import perf_counter
+
+from src.db.copy_load import CopySource, copy_books_and_authors, copy_line
+from src.db.models import Author, Book
+from src.db.services import create_books_and_authors
+
+
+def synthetic_books(number, authors=100):
+    for i in range(number):
+        yield {
+            "name": f"Book {i}",
+            "year": 1900 + i % 120 if i % 10 else None,
+            "author_first_name": f"First\t{i % authors}" if i % 7 else None,
+            "author_last_name": f"Last\\{i % authors}",
+        }
+
+
+def test_copy_line__escapes_special_characters_and_null():
+    assert copy_line(["a\tb", None, 1, "c\\d\ne\r"]) == "a\\tb\t\\N\t1\tc\\\\d\\ne\\r\n"
+
+
+def test_copy_source__reads_by_size():
+    source = CopySource([("a",), ("bb",), ("ccc",)])
+    assert source.read(3) == "a\nb"
+    assert source.read(100) == "b\nccc\n"
+    assert source.read(100) == ""
+    assert source.rows == 3
+
+
+def test_copy_source__reads_all():
+    source = CopySource([("a", None), ("b", 1)])
+    assert source.read() == "a\t\\N\nb\t1\n"
+
+
+def test_copy_books_and_authors__is_ok(db_session):
+    data = [
+        {
+            "name": "Test",
+            "year": 1,
+            "author_first_name": "John",
+            "author_last_name": "Doe",
+        },
+        {
+            "name": "Test1",
+            "year": None,
+            "author_first_name": None,
+            "author_last_name": "Doe",
+        },
+    ]
+    result = copy_books_and_authors(db_session.connection(), iter(data), False)
+    assert result == (2, 0)
+    books = db_session.query(Book).order_by(Book.id).all()
+    assert [b.as_dict for b in books] == [
+        {
+            "name": "Test",
+            "year": 1,
+            "author": {"first_name": "John", "last_name": "Doe"},
+        },
+        {"name": "Test1", "year": None, "author": None},
+    ]
+
+
+def test_copy_books_and_authors__with_update_flag_but_books_already_exist(
+    db_session,
+):
+    data = [
+        {
+            "name": "Test",
+            "year": None,
+            "author_first_name": "Jaine",
+            "author_last_name": "Doe",
+        },
+    ]
+    copy_books_and_authors(db_session.connection(), data, False)
+    result = copy_books_and_authors(db_session.connection(), data * 2, True)
+    assert result == (0, 2)
+    assert len(db_session.query(Book).all()) == 1
+    assert len(db_session.query(Author).all()) == 1
+
+
+def test_copy_books_and_authors__same_normalized_names_are_deduplicated(
+    db_session,
+):
+    data = [
+        {
+            "name": name,
+            "year": None,
+            "author_first_name": first_name,
+            "author_last_name": "Doe",
+        }
+        for name, first_name in [("Ёлка", "Jaine"), ("елка!", "JAINE")]
+    ]
+    result = copy_books_and_authors(db_session.connection(), data, False)
+    assert result == (1, 0)
+    books = db_session.query(Book).all()
+    assert [b.as_dict for b in books] == [
+        {
+            "name": "Ёлка",
+            "year": None,
+            "author": {"first_name": "Jaine", "last_name": "Doe"},
+        },
+    ]
+
+
+def test_copy_books_and_authors__same_result_as_create_books_and_authors(
+    db_session,
+):
+    copy_books_and_authors(db_session.connection(), synthetic_books(300), False)
+    copied = [b.as_dict for b in db_session.query(Book).order_by(Book.id)]
+    db_session.query(Book).delete()
+    db_session.query(Author).delete()
+    create_books_and_authors(db_session, synthetic_books(300), False)
+    created = [b.as_dict for b in db_session.query(Book).order_by(Book.id)]
+    assert copied == created
+
+
+def test_copy_books_and_authors__benchmark_against_batched_inserts(db_session):
+    number = 20_000
+    started = perf_counter()
+    create_books_and_authors(db_session, synthetic_books(number), False)
+    inserts_time = perf_counter() - started
+    db_session.query(Book).delete()
+    db_session.query(Author).delete()
+
+    started = perf_counter()
+    copy_books_and_authors(db_session.connection(), synthetic_books(number), False)
+    copy_time = perf_counter() - started
+
+    logging.info(
+        f"{number} books: batched inserts {number / inserts_time:.0f} rows/s, "
+        f"COPY {number / copy_time:.0f} rows/s"
+    )
+    assert db_session.query(Book).count() == number
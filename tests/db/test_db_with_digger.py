@@ -1,5 +1,15 @@
-from src.db.models import Book
-from src.db.services import create_books_and_authors
+import logging
+from unittest.mock import Mock, call, patch
+
+from src.db.models import Author, Book
+from src.db.services import (
+    commit_batch,
+    create_books_and_authors,
+    delete_checkpoint,
+    get_generation,
+    load_checkpoint,
+    save_checkpoint,
+)
 
 
 def test_create_books_and_authors__is_ok(db_session):
@@ -33,6 +43,35 @@ def test_create_books_and_authors__is_ok(db_session):
     ]
 
 
+def test_create_books_and_authors__same_normalized_names_are_deduplicated(db_session):
+    data = [
+        {
+            "name": "Будем знакомы!",
+            "year": 2021,
+            "author_first_name": "Фёдор",
+            "author_last_name": "Достоевский",
+        },
+        {
+            "name": "будем  знакомы",
+            "year": 2021,
+            "author_first_name": "федор",
+            "author_last_name": "ДОСТОЕВСКИЙ",
+        },
+    ]
+    create_books_and_authors(db_session, data[:1], False)
+    create_books_and_authors(db_session, data, False)
+    books = db_session.query(Book).all()
+    assert [b.as_dict for b in books] == [
+        {
+            "name": "Будем знакомы!",
+            "year": 2021,
+            "author": {"first_name": "Фёдор", "last_name": "Достоевский"},
+        },
+    ]
+    assert books[0].name_key == "будем знакомы"
+    assert len(db_session.query(Author).all()) == 1
+
+
 def test_create_books_and_authors__but_author_is_none(db_session):
     data = [
         {
@@ -141,3 +180,118 @@ def test_create_books_and_authors__with_update_flag_but_book_already_exists(db_s
             "author": {"first_name": "Jaine", "last_name": "Doe"},
         }
     ]
+
+
+def test_create_books_and_authors__counts_created_and_updated(db_session, caplog):
+    data = [
+        {
+            "name": "Test",
+            "year": None,
+            "author_first_name": None,
+            "author_last_name": None,
+        },
+        {
+            "name": "Test1",
+            "year": 2,
+            "author_first_name": "Jaine",
+            "author_last_name": "Doe",
+        },
+    ]
+    create_books_and_authors(db_session, data, False)
+    with caplog.at_level(logging.INFO):
+        create_books_and_authors(db_session, data + data[:1], True)
+    assert "Created: 0 books AND Updated: 3 books" in caplog.text
+    assert len(db_session.query(Book).all()) == 2
+
+
+def test_create_books_and_authors__without_update_flag_counts_nothing_updated(
+    db_session, caplog
+):
+    data = [
+        {
+            "name": "Test",
+            "year": 1,
+            "author_first_name": "Jaine",
+            "author_last_name": "Doe",
+        },
+    ]
+    create_books_and_authors(db_session, data, False)
+    with caplog.at_level(logging.INFO):
+        create_books_and_authors(db_session, data, False)
+    assert "Created: 0 books AND Updated: 0 books" in caplog.text
+    assert len(db_session.query(Book).all()) == 1
+
+
+def test_create_books_and_authors__in_several_batches(db_session):
+    data = (
+        {
+            "name": f"Test{i}",
+            "year": i,
+            "author_first_name": "Jaine",
+            "author_last_name": "Doe",
+        }
+        for i in range(3)
+    )
+    with patch("src.db.services.commit_batch", wraps=commit_batch) as mock_commit:
+        create_books_and_authors(db_session, data, False, batch_size=1)
+    assert mock_commit.call_count == 3
+    assert get_generation(db_session) == 3
+    assert [b.as_dict for b in db_session.query(Book).order_by(Book.id)] == [
+        {
+            "name": f"Test{i}",
+            "year": i,
+            "author": {"first_name": "Jaine", "last_name": "Doe"},
+        }
+        for i in range(3)
+    ]
+    assert len(db_session.query(Author).all()) == 1
+
+
+def test_create_books_and_authors__calls_on_commit_for_every_batch(db_session, caplog):
+    caplog.set_level(logging.INFO)
+    data = (
+        {
+            "name": f"Test{i}",
+            "year": i,
+            "author_first_name": None,
+            "author_last_name": None,
+        }
+        for i in range(5)
+    )
+    on_commit = Mock()
+    create_books_and_authors(db_session, data, False, batch_size=2, on_commit=on_commit)
+    assert on_commit.call_args_list == [
+        call(db_session, 1, 2),
+        call(db_session, 2, 4),
+        call(db_session, 3, 5),
+    ]
+    assert "Committed 3 batches of up to 2 books" in caplog.text
+
+
+def test_checkpoint__is_saved_loaded_and_deleted(db_session):
+    assert load_checkpoint(db_session, "/lib") is None
+    save_checkpoint(db_session, "/lib", (3, 0), 1, 10)
+    save_checkpoint(db_session, "/lib", (5, 2), 2, 20, "/lib/5.zip")
+    checkpoint = load_checkpoint(db_session, "/lib")
+    assert (checkpoint.files_done, checkpoint.parts_done) == (5, 2)
+    assert checkpoint.file_path == "/lib/5.zip"
+    assert (checkpoint.batches, checkpoint.books) == (2, 20)
+    delete_checkpoint(db_session, "/lib")
+    assert load_checkpoint(db_session, "/lib") is None
+
+
+def test_start_progress__restarts_if_files_are_shifted(db_session, tmp_path, caplog):
+    from src.digger import parse_args, start_progress
+
+    for name in ("a.fb2", "b.fb2", "c.fb2"):
+        (tmp_path / name).write_bytes(b"")
+    args = parse_args(["-s", str(tmp_path), "--resume"])
+    save_checkpoint(db_session, str(tmp_path), (2, 0), 1, 10, str(tmp_path / "b.fb2"))
+    with patch("db.core.session_scope") as mock_scope:
+        mock_scope.return_value.__enter__.return_value = db_session
+        progress, _, books = start_progress(args)
+        assert (progress.skip, books) == ((2, 0), 10)
+        (tmp_path / "0.fb2").write_bytes(b"")
+        progress, _, books = start_progress(args)
+    assert (progress.skip, books) == ((0, 0), 0)
+    assert "starting from the beginning" in caplog.text
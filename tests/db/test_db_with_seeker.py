@@ -1,97 +1,96 @@
+import json
+from argparse import Namespace
+from io import StringIO
+from unittest.mock import MagicMock, patch
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql
+
 from src.db.models import Book
-from src.db.services import find_books_and_authors, get_books_from_db
+from src.db.services import (
+    bump_generation,
+    create_books_and_authors,
+    delete_book_or_all_db,
+    fuzzy_search_query,
+    get_books_batch_from_db,
+    get_books_cached,
+    get_books_from_db,
+    get_books_fuzzy_from_db,
+    get_generation,
+    search_query,
+)
+from src.seeker import find_books_batch
+from src.services.result_cache import ResultCache
 from tests.db.test_db import create_book_with_author
 
 
-def test_find_books_and_authors__search_with_author(db_session):
+@pytest.fixture()
+def statements(db_session):
+    executed = []
+    bind = db_session.get_bind()
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        executed.append(statement)
+
+    event.listen(bind, "before_cursor_execute", before_cursor_execute)
+    yield executed
+    event.remove(bind, "before_cursor_execute", before_cursor_execute)
+
+
+def test_get_books_from_db__search_with_author(db_session):
     book = create_book_with_author(
         db_session, book_name="Book", book_year=1, author_f_n="John", author_l_n="Doe"
     )
 
-    result = find_books_and_authors(
-        db_session,
-        book_name="Book",
-        author_first_name="John",
-        author_last_name="Doe",
-        book_year=1,
-    )
-    assert result == [book]
+    result = get_books_from_db(db_session, "Book", "John", "Doe", 1, True)
+    assert result == [book.id]
 
 
-def test_find_books_and_authors__search_with_author_but_there_not_such_author(
+def test_get_books_from_db__search_with_author_but_there_not_such_author(
     db_session,
 ):
     create_book_with_author(
         db_session, book_name="Book", book_year=1, author_f_n="Jaine", author_l_n="Doe"
     )
-    result = find_books_and_authors(
-        db_session,
-        book_name="Book",
-        author_first_name="John",
-        author_last_name="Doe",
-        book_year=1,
-    )
+    result = get_books_from_db(db_session, "Book", "John", "Doe", 1, True)
     assert result == []
 
 
-def test_find_books_and_authors__search_without_author_but_book_has_author(db_session):
+def test_get_books_from_db__search_without_author_but_book_has_author(db_session):
     book = create_book_with_author(
         db_session, book_name="Book", book_year=1, author_f_n="John", author_l_n="Doe"
     )
-    result = find_books_and_authors(
-        db_session,
-        book_name="Book",
-        author_first_name=None,
-        author_last_name=None,
-        book_year=1,
-    )
-    assert result == [book]
+    result = get_books_from_db(db_session, "Book", None, None, 1, True)
+    assert result == [book.id]
 
 
-def test_find_books_and_authors__search_without_author_and_book_has_no_author(
+def test_get_books_from_db__search_without_author_and_book_has_no_author(
     db_session,
 ):
     book = Book(name="Book", year=1, author_id=None)
     db_session.add(book)
     db_session.commit()
 
-    result = find_books_and_authors(
-        db_session,
-        book_name="Book",
-        author_first_name=None,
-        author_last_name=None,
-        book_year=1,
-    )
-    assert result == [book]
+    result = get_books_from_db(db_session, "Book", None, None, 1, True)
+    assert result == [book.id]
 
 
-def test_find_books_and_authors__search_without_year__book_has_no_author(db_session):
+def test_get_books_from_db__search_without_year__book_has_no_author(db_session):
     book = Book(name="Book", year=1, author_id=None)
     db_session.add(book)
     db_session.commit()
 
-    result = find_books_and_authors(
-        db_session,
-        book_name="Book",
-        author_first_name=None,
-        author_last_name=None,
-        book_year=None,
-    )
-    assert result == [book]
+    result = get_books_from_db(db_session, "Book", None, None, None, True)
+    assert result == [book.id]
 
 
-def test_find_books_and_authors__search_without_year__book_has_author(db_session):
+def test_get_books_from_db__search_without_year__book_has_author(db_session):
     book = create_book_with_author(
         db_session, book_year=1, book_name="Book", author_l_n="Doe", author_f_n="John"
     )
-    result = find_books_and_authors(
-        db_session,
-        book_name="Book",
-        author_first_name=None,
-        author_last_name=None,
-        book_year=None,
-    )
-    assert result == [book]
+    result = get_books_from_db(db_session, "Book", None, None, None, True)
+    assert result == [book.id]
 
 
 def test_get_books_from_db__with_author__without_primary_key(db_session):
@@ -132,3 +131,274 @@ def test_get_books_from_db__without_author__without_primary_key(db_session):
 
     result = get_books_from_db(db_session, "Test", None, None, 1, False)
     assert list(result) == [{"name": "Test", "year": 1, "author": None}]
+
+
+def test_get_books_from_db__search_with_author_with_other_last_name(db_session):
+    create_book_with_author(
+        db_session, book_name="Book", book_year=1, author_f_n="John", author_l_n="Dow"
+    )
+    result = get_books_from_db(db_session, "Book", "John", "Doe", 1, True)
+    assert result == []
+
+
+def test_search_query__author_by_both_names():
+    query = str(
+        search_query("Book", "John", "Doe", 1, False).compile(
+            dialect=postgresql.dialect()
+        )
+    )
+    assert "author.first_name_key = %(first_name_key_1)s" in query
+    assert "author.last_name_key = %(last_name_key_1)s" in query
+    assert query.count("SELECT") == 1
+
+
+def test_search_query__by_normalized_names():
+    query = search_query("Будем  знакомы!", "Ёжик", "ТУМАНОВ", None, False)
+    params = query.compile(dialect=postgresql.dialect()).params
+    assert params["name_key_1"] == "будем знакомы"
+    assert params["first_name_key_1"] == "ежик"
+    assert params["last_name_key_1"] == "туманов"
+
+
+def test_get_books_from_db__case_and_punctuation_insensitive(db_session):
+    create_book_with_author(
+        db_session,
+        book_year=1,
+        book_name="Будем знакомы!",
+        author_f_n="Ёжик",
+        author_l_n="Туманов",
+    )
+
+    result = get_books_from_db(db_session, "будем знакомы", "ежик", "туманов", 1, False)
+    assert result == [
+        {
+            "name": "Будем знакомы!",
+            "year": 1,
+            "author": {"first_name": "Ёжик", "last_name": "Туманов"},
+        }
+    ]
+
+
+def test_search_query__only_ids():
+    query = str(
+        search_query("Book", None, None, None, True).compile(
+            dialect=postgresql.dialect()
+        )
+    )
+    assert query.startswith("SELECT book.id \nFROM book")
+    assert "author.first_name" not in query
+
+
+def test_fuzzy_search_query__ranked_by_name_and_author():
+    query = str(
+        fuzzy_search_query("Book", "John", "Doe", None, True, 5).compile(
+            dialect=postgresql.dialect()
+        )
+    )
+    assert "book.name %%> %(name_1)s" in query
+    assert "author.first_name || %(first_name_1)s || author.last_name %%>" in query
+    assert "ORDER BY word_similarity(" in query
+    assert query.endswith("book.id \n LIMIT %(param_2)s")
+
+
+def test_get_books_fuzzy_from_db__typo_punctuation_and_part_of_name(db_session):
+    create_book_with_author(db_session, book_year=1, book_name="Let's get acquainted!")
+    create_book_with_author(db_session, book_year=2, book_name="War and Peace")
+
+    for text, name in [
+        ("lets get acquainted", "Let's get acquainted!"),
+        ("acquainted", "Let's get acquainted!"),
+        ("War and Peac", "War and Peace"),
+    ]:
+        result = get_books_fuzzy_from_db(db_session, text, None, None, None, False)
+        assert [book["name"] for book in result] == [name]
+    assert get_books_fuzzy_from_db(db_session, "Island", None, None, None, True) == []
+
+
+def test_get_books_fuzzy_from_db__most_similar_first_with_limit(db_session):
+    for name in ["Testing", "Test book", "Test"]:
+        create_book_with_author(db_session, book_year=1, book_name=name)
+
+    result = get_books_fuzzy_from_db(db_session, "Test", None, None, None, False, 2)
+    assert [book["name"] for book in result] == ["Test book", "Test"]
+
+
+def test_get_books_fuzzy_from_db__with_similar_author(db_session):
+    create_book_with_author(
+        db_session, book_year=1, book_name="Test", author_f_n="John"
+    )
+    create_book_with_author(
+        db_session, book_year=2, book_name="Test", author_l_n="Doe", author_f_n="John"
+    )
+
+    result = get_books_fuzzy_from_db(db_session, "Test", "John", "Dow", None, False)
+    assert result == [
+        {
+            "name": "Test",
+            "year": 2,
+            "author": {"first_name": "John", "last_name": "Doe"},
+        }
+    ]
+
+
+@pytest.mark.parametrize("primary_key", [False, True])
+def test_get_books_from_db__one_statement_per_search(
+    db_session, statements, primary_key
+):
+    for year in range(1, 6):
+        create_book_with_author(
+            db_session, book_year=year, book_name="Test", author_l_n=f"Doe{year}"
+        )
+    statements.clear()
+
+    result = get_books_from_db(db_session, "Test", None, None, None, primary_key)
+    assert len(result) == 5
+    assert len(statements) == 1
+
+
+def test_get_books_from_db__one_statement_with_author(db_session, statements):
+    create_book_with_author(
+        db_session, book_year=1, book_name="Test", author_l_n="Doe", author_f_n="John"
+    )
+    create_book_with_author(
+        db_session, book_year=1, book_name="Test", author_l_n="Doe", author_f_n="Jane"
+    )
+    statements.clear()
+
+    result = get_books_from_db(db_session, "Test", "Jane", "Doe", 1, False)
+    assert result == [
+        {
+            "name": "Test",
+            "year": 1,
+            "author": {"first_name": "Jane", "last_name": "Doe"},
+        }
+    ]
+    assert len(statements) == 1
+
+
+def test_get_books_batch_from_db__results_in_order_of_queries(db_session, statements):
+    create_book_with_author(
+        db_session, book_year=1, book_name="Test", author_l_n="Doe", author_f_n="John"
+    )
+    create_book_with_author(
+        db_session, book_year=2, book_name="Test", author_l_n="Doe", author_f_n="Jane"
+    )
+    statements.clear()
+    queries = [
+        {"name": "Missing"},
+        {"name": "Test", "author_first_name": "Jane", "author_last_name": "Doe"},
+        {"name": "Test", "year": 1},
+        {"name": "Test", "author_first_name": "John", "author_last_name": "Dow"},
+        {"name": "Test", "author_first_name": "John"},
+    ]
+
+    result = get_books_batch_from_db(db_session, queries, False)
+    jane = {
+        "name": "Test",
+        "year": 2,
+        "author": {"first_name": "Jane", "last_name": "Doe"},
+    }
+    john = {
+        "name": "Test",
+        "year": 1,
+        "author": {"first_name": "John", "last_name": "Doe"},
+    }
+    assert result == [[], [jane], [john], [], [john, jane]]
+    assert len(statements) == 1
+
+
+def test_get_books_batch_from_db__ids(db_session):
+    book = Book(name="Test", year=None, author_id=None)
+    db_session.add(book)
+    db_session.commit()
+
+    result = get_books_batch_from_db(db_session, [{"name": "Test"}] * 2, True)
+    assert result == [[book.id], [book.id]]
+
+
+def test_get_books_batch_from_db__without_queries(db_session, statements):
+    assert get_books_batch_from_db(db_session, [], False) == []
+    assert statements == []
+
+
+def test_bump_generation__creates_and_increments_generation(db_session):
+    assert get_generation(db_session) == 0
+    bump_generation(db_session)
+    bump_generation(db_session)
+    assert get_generation(db_session) == 2
+
+
+def test_create_books_and_authors__bumps_generation_by_every_batch(db_session):
+    data = [
+        {
+            "name": f"Test{i}",
+            "author_first_name": "Jaine",
+            "author_last_name": "Doe",
+            "year": 1999,
+        }
+        for i in range(5)
+    ]
+    create_books_and_authors(db_session, data, False, batch_size=2)
+    assert get_generation(db_session) == 3
+    # batches without changed books keep cached results
+    create_books_and_authors(db_session, data, False, batch_size=2)
+    assert get_generation(db_session) == 3
+
+
+def test_get_books_cached__until_books_are_changed(db_session, statements):
+    data = {
+        "name": "Test",
+        "year": 1,
+        "author_first_name": "John",
+        "author_last_name": "Doe",
+    }
+    cache = ResultCache()
+    create_books_and_authors(db_session, [data], False)
+    first = get_books_cached(db_session, cache, "Test", "John", "Doe", None, True)
+    statements.clear()
+
+    assert get_books_cached(db_session, cache, "test", "JOHN", "doe", None, True) == (
+        first
+    )
+    assert len(statements) == 1  # only the generation is read
+    create_books_and_authors(db_session, [{**data, "year": 2}], False)
+    second = get_books_cached(db_session, cache, "Test", "John", "Doe", None, True)
+    assert len(second) == 2
+    delete_book_or_all_db(db_session, second[0])
+    assert get_books_cached(db_session, cache, "Test", "John", "Doe", None, True) == (
+        second[1:]
+    )
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 3
+
+
+def test_get_books_cached__without_cache(db_session, statements):
+    get_books_cached(db_session, None, "Test", None, None, None, False)
+    assert len(statements) == 1
+
+
+# seeker imports DB modules only when they are used, so they are patched there
+@patch("db.core.session_scope", return_value=MagicMock())
+@patch(
+    "db.services.get_books_batch_from_db",
+    side_effect=lambda session, queries, pk: [[query["name"]] for query in queries],
+)
+def test_find_books_batch__chunks_in_order(mock_search, mock_scope, tmp_path):
+    queries = tmp_path / "queries.ndjson"
+    queries.write_text('{"name": "A"}\n{"year": 1}\n{"name": "B"}\n{"name": "C"}\n')
+    args = Namespace(
+        batch=str(queries),
+        query_format=None,
+        chunk_size=2,
+        primary_key_flag=True,
+        server=None,
+    )
+    output = StringIO()
+
+    find_books_batch(args, output)
+    lines = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [line["line"] for line in lines] == [1, 2, 3, 4]
+    assert [line.get("ids") for line in lines] == [["A"], None, ["B"], ["C"]]
+    assert lines[1]["error"] == "Query has no name"
+    assert mock_search.call_count == 2
+    mock_scope.assert_called_once()
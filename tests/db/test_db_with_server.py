@@ -0,0 +1,136 @@
+from contextlib import contextmanager
+from threading import Thread
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from src.server import CatalogServer, parse_args
+from src.services.catalog_client import ServerError, call_server
+from tests.db.test_db import create_book_with_author
+
+
+@pytest.fixture()
+def server():
+    server = CatalogServer(("127.0.0.1", 0), cache_size=10)
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f"http://127.0.0.1:{server.server_port}"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture()
+def server_session(db_session):
+    @contextmanager
+    def scope():
+        yield db_session
+
+    with patch("src.server.session_scope", scope):
+        yield db_session
+
+
+def test_parse_args__defaults():
+    args = parse_args([])
+    assert (args.host, args.port, args.cache_size) == ("127.0.0.1", 8008, 10_000)
+    args = parse_args(["--host", "0.0.0.0", "--port", "0", "--cache-size", "1"])
+    assert (args.host, args.port, args.cache_size) == ("0.0.0.0", 0, 1)
+
+
+def test_server__unknown_operation(server):
+    with pytest.raises(ServerError, match="No such operation /drop"):
+        call_server(server.url, "drop", {})
+
+
+@patch("src.server.session_scope", return_value=MagicMock())
+def test_server__bad_search_request(mock_scope, server):
+    with pytest.raises(ServerError, match="Query has no name"):
+        call_server(server.url, "search", {"year": 2021})
+    with pytest.raises(ServerError, match="Query has no name"):
+        call_server(server.url, "search/batch", {"queries": [{"name": ""}]})
+
+
+@pytest.mark.parametrize("limit", [-1, 0, "5", 2.5, True])
+@patch("src.server.session_scope", return_value=MagicMock())
+def test_server__bad_search_limit(mock_scope, server, limit):
+    request = {"name": "Book", "fuzzy": True, "limit": limit}
+    with pytest.raises(ServerError, match="is not a valid limit"):
+        call_server(server.url, "search", request)
+
+
+@pytest.mark.parametrize(
+    ("request_", "error"),
+    [
+        ({"id": "one"}, "invalid int value"),
+        ({}, "books are selected by one of"),
+        ({"all": "yes"}, "all is not true or false"),
+        ({"ids": [1, "2"]}, "ids is not a list of primary keys"),
+        ({"id_range": [1, 10], "chunk_size": "x"}, "not a valid chunk size"),
+        ({"years": [1870, 1850]}, "--years starts after its end"),
+        ({"all": True, "server": "http://host"}, "unknown keys: server"),
+    ],
+)
+def test_server__bad_delete_request(server, request_, error):
+    with pytest.raises(ServerError, match=error):
+        call_server(server.url, "delete", request_)
+
+
+@pytest.mark.parametrize(
+    ("request_", "error"),
+    [
+        ({"dir_path": "/not_exists/"}, "not a valid path for directory"),
+        ({"dir_path": ".", "batch_size": "x"}, "not a valid batch size"),
+        ({"dir_path": ".", "xml_parser": "foo"}, "invalid choice: 'foo'"),
+        ({"dir_path": ".", "writers": 2.5}, "not a valid number of writers"),
+        ({"dir_path": ".", "profile": "x.prof"}, "unknown keys: profile"),
+    ],
+)
+def test_server__bad_ingest_request(server, request_, error):
+    with pytest.raises(ServerError, match=error):
+        call_server(server.url, "ingest", request_)
+
+
+@patch("src.server.session_scope", return_value=MagicMock())
+@patch("src.server.search_books", side_effect=RuntimeError("Connection lost"))
+def test_server__failed_request(mock_search, mock_scope, server):
+    with pytest.raises(ServerError, match="Connection lost"):
+        call_server(server.url, "search", {"name": "Book"})
+    assert server.stats()["requests"] == {"/search": 1}
+
+
+@patch("src.server.ingest")
+def test_server__ingest(mock_ingest, server, tmp_path):
+    result = call_server(server.url, "ingest", {"dir_path": str(tmp_path)})
+    assert result["source"] == str(tmp_path)
+    assert mock_ingest.call_args.args[0].dir_path == str(tmp_path)
+    assert mock_ingest.call_args.args[1] == "spawn"
+
+
+def test_server__search_is_cached(server, server_session):
+    book = create_book_with_author(server_session)
+    request = {"name": book.name, "primary_key": True}
+    assert call_server(server.url, "search", request) == {"books": [book.id]}
+    assert call_server(server.url, "search", request) == {"books": [book.id]}
+    assert server.cache.stats()["hits"] == 1
+
+
+def test_server__search_batch(server, server_session):
+    book = create_book_with_author(server_session)
+    request = {"queries": [{"name": book.name}, {"name": "no such book"}]}
+    result = call_server(server.url, "search/batch", {**request, "primary_key": True})
+    assert result == {"results": [[book.id], []]}
+
+
+def test_server__delete(server, server_session):
+    book = create_book_with_author(server_session)
+    assert call_server(server.url, "delete", {"id": book.id}) == {"deleted": 1}
+    assert not call_server(server.url, "delete", {"id": book.id})["deleted"]
+
+
+def test_server__delete_by_ids_and_filters(server, server_session):
+    first = create_book_with_author(server_session, book_year=1850)
+    second = create_book_with_author(server_session, book_year=1860)
+    request = {"ids": [first.id], "chunk_size": 1}
+    assert call_server(server.url, "delete", request) == {"deleted": 1}
+    request = {"years": [1855, 1865], "id_range": [second.id, second.id]}
+    assert call_server(server.url, "delete", request) == {"deleted": 1}
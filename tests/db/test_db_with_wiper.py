@@ -1,5 +1,13 @@
+import pytest
+
 from src.db.models import Author, Book
-from src.db.services import delete_book_or_all_db
+from src.db.services import (
+    delete_book_or_all_db,
+    delete_books_db,
+    get_generation,
+    load_checkpoint,
+    save_checkpoint,
+)
 from tests.db.test_db import create_book_with_author
 
 
@@ -34,3 +42,54 @@ def test_delete_book_or_all_db__delete_all_db(db_session):
     assert result == 4
     assert not db_session.query(Book).all()
     assert not db_session.query(Author).all()
+
+
+def test_delete_book_or_all_db__truncate_restarts_ids(db_session):
+    create_book_with_author(db_session)
+    generation = get_generation(db_session)
+    delete_book_or_all_db(db_session, all_flag=True)
+    assert get_generation(db_session) == generation + 1
+    assert create_book_with_author(db_session).id == 1
+
+
+def test_delete_book_or_all_db__truncate_flushes_checkpoints(db_session):
+    save_checkpoint(db_session, "/lib", (3, 0), 1, 10, "/lib/2.fb2")
+    delete_book_or_all_db(db_session, all_flag=True)
+    assert load_checkpoint(db_session, "/lib") is None
+
+
+def test_delete_books_db__by_ids_in_chunks(db_session):
+    books = [create_book_with_author(db_session) for _ in range(5)]
+    ids = [book.id for book in books[:3]] + [21345678]
+    assert delete_books_db(db_session, ids=ids, chunk_size=2) == 3
+    assert db_session.query(Book).count() == 2
+    assert db_session.query(Author).count() == 5
+
+
+def test_delete_books_db__by_id_range(db_session):
+    books = [create_book_with_author(db_session) for _ in range(5)]
+    id_range = (books[1].id, books[3].id)
+    assert delete_books_db(db_session, id_range=id_range, chunk_size=2) == 3
+    assert {book.id for book in db_session.query(Book)} == {books[0].id, books[4].id}
+
+
+def test_delete_books_db__by_author_and_years(db_session):
+    author = create_book_with_author(
+        db_session, "Лев", "Толстой", book_year=1850
+    ).author
+    for year in (1860, 1870):
+        db_session.add(Book(name=f"Book {year}", year=year, author_id=author.id))
+    db_session.commit()
+    create_book_with_author(db_session, book_year=1860)
+    result = delete_books_db(
+        db_session, author=("лев", "ТОЛСТОЙ"), years=(1855, 1875), chunk_size=1
+    )
+    assert result == 2
+    assert {book.year for book in db_session.query(Book)} == {1850, 1860}
+
+
+def test_delete_books_db__nothing_selected(db_session):
+    create_book_with_author(db_session)
+    with pytest.raises(ValueError, match="No books are selected"):
+        delete_books_db(db_session)
+    assert db_session.query(Book).count() == 1
@@ -0,0 +1,86 @@
+from src.db.models import Book, FileManifest
+from src.db.services import (
+    create_books_and_authors,
+    load_file_manifest,
+    mark_missing_files,
+    touch_file_manifest,
+)
+
+
+def book_in_file(name, path, member=""):
+    return {
+        "name": name,
+        "year": None,
+        "author_first_name": "Jaine",
+        "author_last_name": "Doe",
+        "file": {
+            "path": path,
+            "member": member,
+            "size": 10,
+            "mtime_ns": 20,
+            "content_hash": "hash",
+        },
+    }
+
+
+def test_create_books_and_authors__saves_file_manifest(db_session):
+    data = [
+        book_in_file("Test", "/lib/book.fb2"),
+        book_in_file("First", "/lib/books.zip", "first.fb2"),
+        book_in_file("Second", "/lib/books.zip", "second.fb2"),
+    ]
+    create_books_and_authors(db_session, data, False, with_files=True)
+    rows = db_session.query(FileManifest).order_by(FileManifest.id).all()
+    assert [(row.path, row.member, row.book.name) for row in rows] == [
+        ("/lib/book.fb2", "", "Test"),
+        ("/lib/books.zip", "first.fb2", "First"),
+        ("/lib/books.zip", "second.fb2", "Second"),
+    ]
+    assert load_file_manifest(db_session, "/lib") == {
+        "/lib/book.fb2": (10, 20, "hash", False),
+        "/lib/books.zip": (10, 20, "hash", False),
+    }
+    assert load_file_manifest(db_session, "/li") == {}
+
+
+def test_create_books_and_authors__updates_file_manifest(db_session):
+    create_books_and_authors(
+        db_session, [book_in_file("Old", "/lib/book.fb2")], False, with_files=True
+    )
+    mark_missing_files(db_session, ["/lib/book.fb2"])
+    book = book_in_file("New", "/lib/book.fb2")
+    book["file"]["size"] = 11
+    create_books_and_authors(db_session, [book], False, with_files=True)
+    row = db_session.query(FileManifest).one()
+    assert (row.size, row.missing, row.book.name) == (11, False, "New")
+
+
+def test_load_file_manifest__deleted_book_is_stale(db_session):
+    create_books_and_authors(
+        db_session, [book_in_file("Test", "/lib/book.fb2")], False, with_files=True
+    )
+    db_session.query(Book).delete()
+    db_session.expire_all()
+    assert load_file_manifest(db_session, "/lib")["/lib/book.fb2"][-1]
+
+
+def test_touch_file_manifest__saves_mtime(db_session):
+    create_books_and_authors(
+        db_session, [book_in_file("Test", "/lib/book.fb2")], False, with_files=True
+    )
+    touched = [{"path": "/lib/book.fb2", "size": 10, "mtime_ns": 30}]
+    assert touch_file_manifest(db_session, touched) == 1
+    assert load_file_manifest(db_session, "/lib")["/lib/book.fb2"] == (
+        10,
+        30,
+        "hash",
+        False,
+    )
+
+
+def test_mark_missing_files__flags_files(db_session):
+    create_books_and_authors(
+        db_session, [book_in_file("Test", "/lib/book.fb2")], False, with_files=True
+    )
+    assert mark_missing_files(db_session, ["/lib/book.fb2", "/lib/other.fb2"]) == 1
+    assert load_file_manifest(db_session, "/lib")["/lib/book.fb2"][-1]
@@ -0,0 +1,124 @@
+from unittest.mock import patch
+
+from src.db.models import Author, Book
+from src.db.services import HashIndex, IngestCache, create_books_and_authors
+from tests.db.test_db import create_book_with_author
+
+
+def test_hash_index__get_and_contains():
+    index = HashIndex(with_ids=True)
+    index.add(("John", "Doe"), 1)
+    assert index.get(("John", "Doe")) == 1
+    assert ("John", "Doe") in index
+    assert index.get(("Jaine", "Doe")) is None
+    assert ("Jaine", "Doe") not in index
+
+
+def test_hash_index__without_ids():
+    index = HashIndex()
+    index.add(("Book", None, 1))
+    assert ("Book", None, 1) in index
+    assert ("Book", 1, None) not in index
+
+
+@patch("src.db.services.CACHE_COMPACT_SIZE", 2)
+def test_hash_index__compacts_new_keys_into_sorted_arrays():
+    index = HashIndex(with_ids=True)
+    for i in range(5):
+        index.add(f"key{i}", i + 1)
+    assert len(index.hashes) == 4
+    assert len(index.new) == 1
+    assert list(index.hashes) == sorted(index.hashes)
+    assert [index.get(f"key{i}") for i in range(5)] == [1, 2, 3, 4, 5]
+
+
+def test_hash_index__does_not_grow_over_max_keys():
+    index = HashIndex(max_keys=2)
+    for i in range(3):
+        index.add(i)
+    assert len(index) == 2
+    assert index.full
+    assert 2 not in index
+
+
+def test_hash_index__partition():
+    index = HashIndex()
+    index.add("known")
+    assert index.partition(["new", "known"]) == (["known"], ["new"])
+
+
+def test_ingest_cache__load(db_session):
+    book = create_book_with_author(
+        db_session, book_name="Book", book_year=1, author_f_n="John", author_l_n="Doe"
+    )
+    cache = IngestCache.load(db_session)
+    assert cache.complete
+    assert cache.authors.get(("john", "doe")) == book.author_id
+    assert cache.books.get(("book", 1, book.author_id)) == book.id
+    assert str(cache).startswith("1 authors, 1 books, ")
+
+
+def test_ingest_cache__load_over_max_keys(db_session):
+    create_book_with_author(db_session)
+    create_book_with_author(db_session)
+    cache = IngestCache.load(db_session, max_keys=1)
+    assert not cache.complete
+    assert len(cache.authors) == 1
+    assert str(cache).endswith(", full")
+
+
+def test_create_books_and_authors__with_cache_skips_known_books(db_session):
+    data = [
+        {
+            "name": "Test",
+            "year": None,
+            "author_first_name": "Jaine",
+            "author_last_name": "Doe",
+        },
+    ]
+    create_books_and_authors(db_session, data, False)
+    cache = IngestCache.load(db_session)
+    with patch("src.db.services.insert_books", return_value={}) as mock_insert_books:
+        create_books_and_authors(db_session, data, False, cache)
+    mock_insert_books.assert_called_once_with(db_session, [])
+    assert len(db_session.query(Book).all()) == 1
+    assert len(db_session.query(Author).all()) == 1
+
+
+def test_create_books_and_authors__with_not_loaded_cache(db_session):
+    data = [
+        {
+            "name": "Test",
+            "year": None,
+            "author_first_name": None,
+            "author_last_name": None,
+        },
+    ]
+    create_books_and_authors(db_session, data, False)
+    create_books_and_authors(db_session, data, True, IngestCache())
+    assert len(db_session.query(Book).all()) == 1
+
+
+def test_create_books_and_authors__cache_collision_is_checked_in_db(db_session):
+    book = create_book_with_author(
+        db_session, book_name="Book", book_year=1, author_f_n="John", author_l_n="Doe"
+    )
+    data = [
+        {
+            "name": "Other",
+            "year": 2,
+            "author_first_name": "Jaine",
+            "author_last_name": "Roe",
+        },
+    ]
+    cache = IngestCache.load(db_session)
+    # keys colliding with known ones get ids of other rows
+    cache.authors.add(("jaine", "roe"), book.author_id)
+    create_books_and_authors(db_session, data, False, cache)
+    other = db_session.query(Book).filter(Book.name == "Other").one()
+    assert other.author_id != book.author_id
+    cache.books.add(("other", 2, other.author_id), book.id)
+    db_session.delete(other)
+    db_session.flush()
+    create_books_and_authors(db_session, data, False, cache)
+    assert db_session.query(Book).filter(Book.name == "Other").count() == 1
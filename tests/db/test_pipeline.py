@@ -0,0 +1,119 @@
+from collections import defaultdict
+from threading import Event, Thread, current_thread
+from time import sleep
+from unittest.mock import Mock, patch
+
+import pytest
+
+from src.db.pipeline import BookPipeline
+
+
+def books(number):
+    return (
+        {
+            "name": f"Test{i % 7}",
+            "year": i,
+            "author_first_name": "Jaine",
+            "author_last_name": "Doe",
+        }
+        for i in range(number)
+    )
+
+
+@pytest.fixture()
+def saved():
+    batches = defaultdict(list)
+
+    def save_batch(session, batch, update_flag, cache, with_files):
+        batches[current_thread().name].append(batch)
+        return len(batch), 0
+
+    with patch("src.db.pipeline.save_batch", side_effect=save_batch), patch(
+        "src.db.pipeline.commit_batch", return_value=0.001
+    ):
+        yield batches
+
+
+def test_book_pipeline__saves_every_book_once(saved):
+    pipeline = BookPipeline(False, batch_size=3, writers=3, session_factory=Mock)
+    assert pipeline.run(books(100)) == (100, 0)
+    saved_books = [book for batches in saved.values() for b in batches for book in b]
+    assert sorted(book["year"] for book in saved_books) == list(range(100))
+    assert all(len(batch) <= 3 for batches in saved.values() for batch in batches)
+
+
+def test_book_pipeline__same_book_goes_to_same_writer(saved):
+    BookPipeline(False, batch_size=2, writers=3, session_factory=Mock).run(books(100))
+    writers = defaultdict(set)
+    for writer, batches in saved.items():
+        for batch in batches:
+            for book in batch:
+                writers[book["name"]].add(writer)
+    assert all(len(names) == 1 for names in writers.values())
+
+
+def test_book_pipeline__spellings_of_name_go_to_same_writer(saved):
+    spellings = ["Будем знакомы!", "будем знакомы", "  БУДЕМ   ЗНАКОМЫ... "]
+    data = [
+        {
+            "name": name,
+            "year": None,
+            "author_first_name": None,
+            "author_last_name": None,
+        }
+        for name in spellings * 10
+    ]
+    BookPipeline(False, batch_size=1, writers=8, session_factory=Mock).run(data)
+    assert len(saved) == 1
+    assert sum(map(len, next(iter(saved.values())))) == 30
+
+
+@patch("src.db.pipeline.CHECKPOINT_BATCHES", 4)
+def test_book_pipeline__checkpoint_after_all_handed_books_are_committed(saved):
+    checkpoints = []
+
+    def on_commit(session, batches, saved_books):
+        committed = sum(len(b) for batches in saved.values() for b in batches)
+        checkpoints.append((saved_books, committed))
+
+    pipeline = BookPipeline(
+        False, batch_size=2, writers=2, on_commit=on_commit, session_factory=Mock
+    )
+    pipeline.run(books(50))
+    assert checkpoints
+    assert all(handed == committed for handed, committed in checkpoints)
+
+
+def test_book_pipeline__raises_error_of_writer():
+    with patch("src.db.pipeline.save_batch", side_effect=ValueError("DB is down")):
+        pipeline = BookPipeline(False, batch_size=1, writers=2, session_factory=Mock)
+        with pytest.raises(ValueError, match="DB is down"):
+            pipeline.run(books(100))
+
+
+@patch("src.db.pipeline.QUEUE_BATCHES", 1)
+def test_book_pipeline__producer_waits_for_slow_writer():
+    release = Event()
+    taken = []
+
+    def data():
+        for book in books(100):
+            taken.append(book)
+            yield book
+
+    def save_batch(*args):
+        release.wait()
+        return 1, 0
+
+    with patch("src.db.pipeline.save_batch", side_effect=save_batch), patch(
+        "src.db.pipeline.commit_batch", return_value=0.001
+    ):
+        pipeline = BookPipeline(False, batch_size=1, writers=1, session_factory=Mock)
+        producer = Thread(target=pipeline.run, args=(data(),))
+        producer.start()
+        sleep(0.2)
+        # one batch is being saved, one is queued and the producer waits with one more
+        assert len(taken) == 3
+        release.set()
+        producer.join()
+    assert len(taken) == 100
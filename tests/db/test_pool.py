@@ -0,0 +1,144 @@
+import logging
+from threading import Thread
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import create_engine, exc
+from sqlalchemy.pool import NullPool
+
+from src.db.core.connect_to_db import create_db_engine, get_database_config
+from src.db.core.pool import (
+    TimedQueuePool,
+    engine_options,
+    log_pool_stats,
+    pool_stats,
+    set_local_settings,
+)
+
+CONFIG = """
+[database]
+DB_NAME=library_db
+POOL_SIZE=3
+WORK_MEM=64MB
+
+[database.digger]
+POOL_SIZE=8
+DB_USER=digger
+"""
+
+
+@pytest.fixture()
+def config_dir(tmp_path, monkeypatch):
+    (tmp_path / "config.ini").write_text(CONFIG)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_get_database_config__role_over_database(config_dir):
+    settings = get_database_config("digger")
+    assert settings["pool_size"] == "8"
+    assert settings["db_user"] == "digger"
+    assert settings["work_mem"] == "64MB"
+    assert get_database_config("seeker")["pool_size"] == "3"
+
+
+def test_get_database_config__role_by_script(config_dir, monkeypatch):
+    monkeypatch.setattr("sys.argv", ["/src/digger.py", "-s", "books"])
+    assert get_database_config()["pool_size"] == "8"
+
+
+def test_engine_options__defaults():
+    options = engine_options({})
+    assert options["poolclass"] is TimedQueuePool
+    assert (options["pool_size"], options["max_overflow"]) == (5, 10)
+    assert not options["pool_pre_ping"]
+    assert "connect_args" not in options
+
+
+def test_engine_options__session_settings():
+    options = engine_options({"statement_timeout": "30s", "work_mem": "64MB"})
+    assert options["connect_args"] == {
+        "options": "-c statement_timeout=30s -c work_mem=64MB"
+    }
+
+
+def test_engine_options__pgbouncer_without_pool():
+    options = engine_options(
+        {"pgbouncer": "yes", "pool_size": "0", "statement_timeout": "30s"}
+    )
+    assert options["poolclass"] is NullPool
+    assert "connect_args" not in options
+
+
+def test_engine_options__not_valid_boolean():
+    with pytest.raises(ValueError, match="is not a boolean"):
+        engine_options({"pool_pre_ping": "maybe"})
+
+
+@patch("src.db.core.connect_to_db.get_url_to_db", return_value="sqlite://")
+def test_create_db_engine__pgbouncer_sets_local_settings(mock_url):
+    engine = create_db_engine({"pgbouncer": "true", "work_mem": "64MB"})
+    statements = []
+    engine.dialect.do_execute = lambda cursor, statement, params, context: (
+        statements.append((statement, params))
+    )
+    with engine.begin() as connection:
+        connection.exec_driver_sql("SELECT 1")
+    assert statements[0] == ("SELECT set_config(?, ?, true)", ("work_mem", "64MB"))
+
+
+def test_set_local_settings__every_setting():
+    executed = []
+
+    class Connection:
+        def execute(self, statement, params):
+            executed.append(params["name"])
+
+    set_local_settings({"statement_timeout": "1s", "work_mem": "4MB"}, Connection())
+    assert executed == ["statement_timeout", "work_mem"]
+
+
+def test_timed_queue_pool__stats():
+    engine = create_engine(
+        "sqlite://", poolclass=TimedQueuePool, pool_size=1, max_overflow=1
+    )
+    first, second = engine.connect(), engine.connect()
+    stats = pool_stats(engine.pool)
+    assert (stats["checked_out"], stats["overflow"]) == (2, 1)
+    assert (stats["checkouts"], stats["peak_checked_out"]) == (2, 2)
+    first.close()
+    second.close()
+    stats = pool_stats(engine.pool)
+    assert (stats["checked_out"], stats["overflow"]) == (0, 0)
+    assert stats["peak_checked_out"] == 2
+
+
+def test_timed_queue_pool__timeout():
+    engine = create_engine(
+        "sqlite://",
+        poolclass=TimedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.01,
+    )
+    connection = engine.connect()
+    waiting = Thread(target=lambda: pytest.raises(exc.TimeoutError, engine.connect))
+    waiting.start()
+    waiting.join()
+    connection.close()
+    stats = pool_stats(engine.pool)
+    assert stats["timeouts"] == 1
+    assert stats["max_wait_s"] >= 0.01
+
+
+def test_timed_queue_pool__stats_are_kept_by_dispose():
+    engine = create_engine("sqlite://", poolclass=TimedQueuePool)
+    engine.connect().close()
+    engine.dispose()
+    assert pool_stats(engine.pool)["checkouts"] == 1
+
+
+def test_log_pool_stats(caplog):
+    caplog.set_level(logging.INFO)
+    log_pool_stats(create_engine("sqlite://", poolclass=NullPool))
+    assert "Pool stats: {'pool': 'NullPool'}" in caplog.text
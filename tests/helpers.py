@@ -0,0 +1,18 @@
+from pathlib import Path
+
+from services.file_extraction import get_files_from_dir, gzip_extraction, zip_extraction
+
+# sample books of the repo, plain, gzipped and zipped
+BOOKS_DIR = Path(__file__).parents[1] / "books" / "dir_with_books"
+
+
+def read_books(dir_path):
+    """Texts of all books of the dir, books of archives are extracted"""
+    for file in sorted(get_files_from_dir(dir_path)):
+        if file.endswith(".gz"):
+            with gzip_extraction(file) as book:
+                yield book.read()
+        elif file.endswith(".zip"):
+            yield from (book.read() for book in zip_extraction(file))
+        else:
+            yield Path(file).read_bytes()
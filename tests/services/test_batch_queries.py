@@ -0,0 +1,79 @@
+from io import StringIO
+
+import pytest
+
+from services.batch_queries import parse_query, read_queries
+
+
+def test_read_queries__ndjson():
+    file = StringIO(
+        '{"name": "Book", "year": 2021}\n'
+        "\n"
+        '{"name": "Other", "author_first_name": "John", "author_last_name": "Doe"}\n'
+    )
+    assert list(read_queries(file, "ndjson")) == [
+        {
+            "line": 1,
+            "query": {
+                "name": "Book",
+                "author_first_name": None,
+                "author_last_name": None,
+                "year": 2021,
+            },
+        },
+        {
+            "line": 2,
+            "query": {
+                "name": "Other",
+                "author_first_name": "John",
+                "author_last_name": "Doe",
+                "year": None,
+            },
+        },
+    ]
+
+
+def test_read_queries__ndjson_errors_keep_order():
+    file = StringIO(
+        '{"name": "Book"}\nnot json\n["Book"]\n{"year": 1}\n{"name": "Last"}'
+    )
+    items = list(read_queries(file, "ndjson"))
+    assert [item["line"] for item in items] == [1, 2, 3, 4, 5]
+    assert items[1]["error"].startswith("Not a JSON object")
+    assert items[2]["error"] == "Query is not an object"
+    assert items[3]["error"] == "Query has no name"
+    assert items[4]["query"]["name"] == "Last"
+
+
+def test_read_queries__csv():
+    file = StringIO(
+        "name,author_first_name,author_last_name,year\n"
+        'Book,John,Doe,2021\n"Book, with comma",,,\n'
+    )
+    assert [item["query"] for item in read_queries(file, "csv")] == [
+        {
+            "name": "Book",
+            "author_first_name": "John",
+            "author_last_name": "Doe",
+            "year": 2021,
+        },
+        {
+            "name": "Book, with comma",
+            "author_first_name": None,
+            "author_last_name": None,
+            "year": None,
+        },
+    ]
+
+
+@pytest.mark.parametrize(
+    ("record", "error"),
+    [
+        ({"name": "Book", "year": "twenty"}, "`twenty` is not a valid year"),
+        ({"name": 1}, "`1` is not a valid name"),
+        ({"name": ""}, "Query has no name"),
+    ],
+)
+def test_parse_query__not_valid(record, error):
+    with pytest.raises(ValueError, match=error):
+        parse_query(record)
@@ -0,0 +1,53 @@
+import json
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from threading import Thread
+
+import pytest
+
+from src.services.catalog_client import ServerError, call_server
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    def do_POST(self):  # noqa: N802
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.path == "/fail":
+            self.send_response(400)
+            body = {"error": "Request has no name"}
+        else:
+            self.send_response(200)
+            body = {"path": self.path, "request": request}
+        self.end_headers()
+        self.wfile.write(json.dumps(body).encode("utf-8"))
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture()
+def server_url():
+    server = HTTPServer(("127.0.0.1", 0), EchoHandler)
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_call_server__returns_response(server_url):
+    response = call_server(server_url + "/", "search/batch", {"queries": []})
+    assert response == {"path": "/search/batch", "request": {"queries": []}}
+
+
+def test_call_server__error_of_server(server_url):
+    with pytest.raises(ServerError, match="fail failed: Request has no name"):
+        call_server(server_url, "fail", {})
+
+
+def test_call_server__server_is_not_available():
+    with pytest.raises(ServerError, match="is not available"):
+        call_server("http://127.0.0.1:1", "search", {})
+
+
+def test_call_server__not_http_url():
+    with pytest.raises(ServerError, match="is not an http url"):
+        call_server("file:///etc/passwd", "search", {})
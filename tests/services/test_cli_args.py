@@ -0,0 +1,23 @@
+from argparse import ArgumentTypeError
+from io import StringIO
+
+import pytest
+
+from src.services.cli_args import open_input, validate_chunk_size
+
+
+def test_validate_chunk_size__positive_number():
+    assert validate_chunk_size("500") == 500
+    for value in ("0", "-1", "x"):
+        with pytest.raises(ArgumentTypeError):
+            validate_chunk_size(value)
+
+
+def test_open_input__file_or_stdin(tmp_path, monkeypatch):
+    path = tmp_path / "ids.txt"
+    path.write_text("1 2")
+    with open_input(str(path)) as file:
+        assert file.read() == "1 2"
+    monkeypatch.setattr("sys.stdin", StringIO("1 2"))
+    with open_input("-") as file:
+        assert file.read() == "1 2"
@@ -0,0 +1,116 @@
+import pytest
+from defusedxml import EntitiesForbidden
+from defusedxml.ElementTree import ParseError
+
+from services.fb2_backends import BACKENDS
+from services.fb2_parser import FB2Parser
+from services.startup import BACKEND_NAMES, DEFAULT_BACKEND
+from tests.helpers import BOOKS_DIR, read_books
+
+
+@pytest.fixture(params=list(BACKENDS))
+def backend(request):
+    if request.param == "lxml":
+        pytest.importorskip("lxml")
+    return request.param
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        """<FictionBook xmlns="URL"><description><title-info>
+        <author><first-name>John</first-name><last-name>Doe</last-name></author>
+        <book-title>Test <emphasis>Book</emphasis> tail</book-title>
+        </title-info><publish-info><year>2021</year></publish-info></description>
+        <body><p>Text</p></body></FictionBook>""",
+        """<FictionBook><description><title-info>
+        <author><last-name>Doe</last-name></author>
+        <author><first-name/><last-name>Smith</last-name></author>
+        <book-title> Test Book </book-title>
+        </title-info></description></FictionBook>""",
+        """<fb:FictionBook xmlns:fb="URL"><fb:description><fb:title-info>
+        <fb:book-title>Test<!-- comment --> Book</fb:book-title>
+        <author><first-name>Not in namespace</first-name></author>
+        </fb:title-info></fb:description></fb:FictionBook>""",
+        """<FictionBook xmlns="URL"><body><description><title-info>
+        <book-title>Nested description</book-title>
+        </title-info></description></body></FictionBook>""",
+    ],
+)
+def test_fb2_backends__same_fields_as_full_parse(backend, text):
+    expected = FB2Parser(text=text)
+    book = FB2Parser(text=text, header_only=True, backend=backend)
+    for field in ("author_first_name", "author_last_name", "published_year"):
+        assert getattr(book, field) == getattr(expected, field)
+    assert (book.find("name") is None) == (expected.find("name") is None)
+    if expected.find("name") is not None:
+        assert book.name == expected.name
+
+
+def test_fb2_backends__same_as_dict_on_sample_books(backend):
+    for text in read_books(BOOKS_DIR):
+        book = FB2Parser(text=text, header_only=True, backend=backend)
+        assert book.as_dict == FB2Parser(text=text).as_dict
+
+
+def test_fb2_backends__works_with_file(backend):
+    file = next(BOOKS_DIR.glob("*.fb2"))
+    book = FB2Parser(filename=file, header_only=True, backend=backend)
+    assert book.as_dict == FB2Parser(filename=file).as_dict
+
+
+def test_fb2_backends__raises_parse_error(backend):
+    text = """<FictionBook><description><title-info></description>"""
+    with pytest.raises(ParseError):
+        FB2Parser(text=text, header_only=True, backend=backend)
+
+
+def test_fb2_backends__full_parse_reads_past_description(backend):
+    text = """<FictionBook><description><title-info>
+    <book-title>Test Book</book-title>
+</title-info></description><body><p>not closed</body></FictionBook>"""
+    assert FB2Parser(text=text, header_only=True, backend=backend).name == "Test Book"
+    with pytest.raises(ParseError):
+        FB2Parser(text=text, header_only=False, backend=backend)
+
+
+def test_fb2_backends__forbids_entities(backend):
+    text = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE FictionBook [<!ENTITY title "Test Book">]>
+<FictionBook><description>
+    <title-info><book-title>&title;</book-title></title-info>
+</description></FictionBook>"""
+    with pytest.raises(EntitiesForbidden):
+        FB2Parser(text=text, header_only=True, backend=backend)
+
+
+@pytest.mark.parametrize("encoding", ["utf-8", "windows-1251", "koi8-r", "utf-16"])
+def test_fb2_backends__honour_encoding_declaration(backend, encoding):
+    text = f"""<?xml version="1.0" encoding="{encoding}"?>
+<FictionBook><description><title-info>
+    <author><first-name>Лев</first-name><last-name>Толстой</last-name></author>
+    <book-title>Война и мир</book-title>
+</title-info></description></FictionBook>"""
+    book = FB2Parser(text=text.encode(encoding), header_only=True, backend=backend)
+    assert book.as_dict == {
+        "name": "Война и мир",
+        "author_first_name": "Лев",
+        "author_last_name": "Толстой",
+        "year": None,
+    }
+
+
+@pytest.mark.parametrize("encoding", ["windows-1251", "koi8-r"])
+def test_fb2_backends__str_ignores_encoding_declaration(backend, encoding):
+    text = f"""<?xml version="1.0" encoding="{encoding}"?>
+<FictionBook><description><title-info>
+    <book-title>Война и мир</book-title>
+</title-info></description></FictionBook>"""
+    for header_only in (True, False):
+        book = FB2Parser(text=text, header_only=header_only, backend=backend)
+        assert book.name == "Война и мир"
+
+
+def test_backend_names__are_names_of_backends():
+    assert BACKEND_NAMES == tuple(BACKENDS)
+    assert DEFAULT_BACKEND in BACKENDS
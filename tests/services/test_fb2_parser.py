@@ -1,7 +1,10 @@
+from io import StringIO
 from tempfile import NamedTemporaryFile
 
 import pytest
+from defusedxml import ElementTree, EntitiesForbidden
 
+from services.fb2_backends import read_until_description
 from services.fb2_parser import FB2Parser
 
 
@@ -115,3 +118,64 @@ def test_fb2_parser__works_with_text(get_file_path):
         "author_last_name": "Doe",
         "year": 2021,
     }
+
+
+def test_fb2_parser__header_only__works_with_file(get_file_path):
+    text = """<?xml version="1.0" encoding="UTF-8"?>
+<FictionBook xmlns="URL">
+    <description>
+        <title-info>
+            <author><first-name>John</first-name><last-name>Doe</last-name></author>
+            <book-title>Test Book</book-title>
+        </title-info>
+        <publish-info>
+            <publisher>SelfPub</publisher>
+            <year>2021</year>
+        </publish-info>
+    </description>
+    <body><p>Text</p></body>
+</FictionBook>"""
+    file = get_file_path(text)
+    book = FB2Parser(filename=file, header_only=True)
+    assert book.as_dict == {
+        "name": "Test Book",
+        "author_first_name": "John",
+        "author_last_name": "Doe",
+        "year": 2021,
+    }
+
+
+def test_fb2_parser__header_only__stops_after_description():
+    text = """<?xml version="1.0" encoding="UTF-8"?>
+<FictionBook xmlns="URL">
+    <description>
+        <title-info>
+            <book-title>Test Book</book-title>
+        </title-info>
+    </description>
+    <body><p>Text</p></body>
+    <binary id="cover.jpg">not closed
+"""
+    root = read_until_description(
+        ElementTree.iterparse(StringIO(text), ("start", "end"))
+    )
+    assert list(root) == [root.find("{URL}description")]
+    book = FB2Parser(text=text, header_only=True)
+    assert book.as_dict == {
+        "name": "Test Book",
+        "author_first_name": None,
+        "author_last_name": None,
+        "year": None,
+    }
+
+
+def test_fb2_parser__header_only__forbids_entities():
+    text = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE FictionBook [<!ENTITY title "Test Book">]>
+<FictionBook xmlns="URL">
+    <description>
+        <title-info><book-title>&title;</book-title></title-info>
+    </description>
+</FictionBook>"""
+    with pytest.raises(EntitiesForbidden):
+        FB2Parser(text=text, header_only=True)
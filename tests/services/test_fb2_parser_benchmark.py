@@ -0,0 +1,80 @@
+import logging
+from io import BytesIO
+from time import perf_counter
+
+import pytest
+from defusedxml import ElementTree
+
+from services.fb2_backends import BACKENDS, read_until_description
+from services.fb2_parser import FB2Parser
+from tests.helpers import BOOKS_DIR, read_books
+
+
+def parse_with_cleanup(text):
+    """FB2Parser before namespace-aware lookups: full tree, every tag rewritten"""
+    root = ElementTree.fromstring(text)
+    for element in root.iter():
+        element.tag = element.tag.partition("}")[-1]
+    year = root.find("./description/publish-info/year")
+    first_name = root.find("./description/title-info/author/first-name")
+    last_name = root.find("./description/title-info/author/last-name")
+    return {
+        "name": root.find("./description/title-info/book-title").text,
+        "author_first_name": first_name.text if first_name is not None else None,
+        "author_last_name": last_name.text if last_name is not None else None,
+        "year": int(year.text) if year is not None else None,
+    }
+
+
+def count_elements(root):
+    return sum(1 for _ in root.iter())
+
+
+def time_per_book(parse, texts):
+    started = perf_counter()
+    result = [parse(text) for text in texts]
+    return result, (perf_counter() - started) / len(texts)
+
+
+@pytest.fixture(scope="module")
+def books_texts():
+    return list(read_books(BOOKS_DIR))
+
+
+def test_fb2_parser_benchmark__per_book_parse_time(books_texts):
+    before, before_time = time_per_book(parse_with_cleanup, books_texts)
+    full, full_time = time_per_book(lambda t: FB2Parser(text=t).as_dict, books_texts)
+    header, header_time = time_per_book(
+        lambda t: FB2Parser(text=t, header_only=True).as_dict, books_texts
+    )
+    logging.info(
+        f"Parse time per book on {len(books_texts)} books: "
+        f"cleanup {before_time * 1000:.2f}ms, "
+        f"namespaced {full_time * 1000:.2f}ms, "
+        f"namespaced header only {header_time * 1000:.2f}ms"
+    )
+    assert before == full == header
+    # timings only are logged, header only parse is checked by elements it builds
+    for text in books_texts:
+        header_root = read_until_description(
+            ElementTree.iterparse(BytesIO(text), ("start", "end"))
+        )
+        full_root = ElementTree.fromstring(text)
+        assert count_elements(header_root) < count_elements(full_root)
+
+
+@pytest.mark.parametrize("backend", list(BACKENDS))
+def test_fb2_parser_benchmark__throughput_per_backend(books_texts, backend):
+    if backend == "lxml":
+        pytest.importorskip("lxml")
+    expected = [FB2Parser(text=text).as_dict for text in books_texts]
+    result, book_time = time_per_book(
+        lambda t: FB2Parser(text=t, header_only=True, backend=backend).as_dict,
+        books_texts,
+    )
+    size = sum(map(len, books_texts)) / len(books_texts)
+    logging.info(
+        f"Backend {backend}: {1 / book_time:.0f} books/s, "
+        f"{size / book_time / 2 ** 20:.1f} MiB/s"
+    )
+    assert result == expected
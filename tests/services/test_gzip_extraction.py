@@ -29,4 +29,5 @@ def test_gzip_extraction__but_file_path_not_exists():
 def test_gzip_extraction__works(create_gzip_file):
     data = "text"
     zip_file = create_gzip_file(data)
-    assert gzip_extraction(zip_file) == "text"
+    with gzip_extraction(zip_file) as file:
+        assert file.read() == b"text"
@@ -0,0 +1,102 @@
+import os
+
+import pytest
+
+from services.manifest import ManifestScan, file_hash, file_state
+from services.parse_book_from_file import get_books_from_file, get_books_with_file
+from tests.helpers import BOOKS_DIR
+
+
+@pytest.fixture()
+def dir_with_books(tmp_path):
+    for name in ("first.fb2", "second.fb2"):
+        (tmp_path / name).write_bytes(b"<FictionBook/>")
+    return tmp_path
+
+
+def manifest_of(dir_path, stale=False):
+    return {
+        state["path"]: (state["size"], state["mtime_ns"], state["content_hash"], stale)
+        for state in map(file_state, map(str, dir_path.iterdir()))
+    }
+
+
+def test_manifest_scan__yields_new_files(dir_with_books):
+    scan = ManifestScan(dir_with_books, {})
+    assert sorted(scan.changed_files()) == sorted(
+        str(path) for path in dir_with_books.iterdir()
+    )
+    assert scan.skipped == 0
+
+
+def test_manifest_scan__skips_unchanged_files(dir_with_books):
+    scan = ManifestScan(dir_with_books, manifest_of(dir_with_books))
+    assert list(scan.changed_files()) == []
+    assert scan.skipped == 2
+    assert scan.touched == []
+
+
+def test_manifest_scan__skips_touched_file_with_same_content(dir_with_books):
+    known = manifest_of(dir_with_books)
+    path = dir_with_books / "first.fb2"
+    os.utime(path, ns=(0, 1_000_000_000))
+    scan = ManifestScan(dir_with_books, known)
+    assert list(scan.changed_files()) == []
+    assert scan.touched == [{"path": str(path), "size": 14, "mtime_ns": 1_000_000_000}]
+
+
+def test_manifest_scan__yields_changed_files(dir_with_books):
+    known = manifest_of(dir_with_books)
+    (dir_with_books / "first.fb2").write_bytes(b"<FictionBook></FictionBook>")
+    second = dir_with_books / "second.fb2"
+    stat = second.stat()
+    second.write_bytes(b"<FictionBook >")
+    os.utime(second, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    scan = ManifestScan(dir_with_books, known)
+    assert sorted(scan.changed_files()) == sorted(map(str, dir_with_books.iterdir()))
+    assert scan.touched == []
+
+
+def test_manifest_scan__yields_stale_files(dir_with_books):
+    scan = ManifestScan(dir_with_books, manifest_of(dir_with_books, stale=True))
+    assert len(list(scan.changed_files())) == 2
+
+
+def test_manifest_scan__yields_all_files_if_rescan(dir_with_books):
+    scan = ManifestScan(dir_with_books, manifest_of(dir_with_books), rescan=True)
+    assert len(list(scan.changed_files())) == 2
+
+
+def test_manifest_scan__finds_missing_files(dir_with_books):
+    known = manifest_of(dir_with_books)
+    os.remove(dir_with_books / "first.fb2")
+    scan = ManifestScan(dir_with_books, known)
+    assert list(scan.changed_files()) == []
+    assert scan.missing == [str(dir_with_books / "first.fb2")]
+
+
+def test_file_hash__depends_on_content_only(tmp_path):
+    (tmp_path / "first").write_bytes(b"content")
+    (tmp_path / "second").write_bytes(b"content")
+    (tmp_path / "third").write_bytes(b"other content")
+    assert file_hash(tmp_path / "first") == file_hash(tmp_path / "second")
+    assert file_hash(tmp_path / "first") != file_hash(tmp_path / "third")
+    assert len(file_hash(tmp_path / "first")) == 32
+
+
+@pytest.mark.parametrize("name", ["86061366.fb2", "85832321.fb2.gz", "86372272.zip"])
+def test_get_books_with_file__adds_file_state(name):
+    file = str(BOOKS_DIR.parent / name)
+    books = get_books_with_file(file)
+    assert [{**book, "file": None} for book in books] == [
+        {**book, "file": None} for book in get_books_from_file(file)
+    ]
+    for book in books:
+        assert book["file"] == {**file_state(file), "member": book["file"]["member"]}
+    members = [book["file"]["member"] for book in books]
+    assert all(members) if name.endswith(".zip") else members == [""]
+
+
+def test_get_books_with_file__but_file_is_broken(tmp_path):
+    (tmp_path / "broken.fb2").write_bytes(b"<FictionBook>")
+    assert get_books_with_file(tmp_path / "broken.fb2") is None
@@ -0,0 +1,90 @@
+import json
+from time import sleep
+from unittest.mock import Mock, patch
+
+from db.services import save_batch
+from services import metrics
+from services.metrics import IngestMetrics, collecting, prometheus_text
+from services.parse_book_from_file import find_books, get_books_from_directory
+from tests.helpers import BOOKS_DIR, read_books
+
+
+def read_lines(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_collecting__without_paths(tmp_path):
+    with collecting() as collected:
+        assert collected is None
+        assert metrics.METRICS is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_collecting__directory(tmp_path):
+    (tmp_path / "broken.fb2").write_text("<FictionBook>")
+    jsonl, prom = tmp_path / "ingest.jsonl", tmp_path / "ingest.prom"
+    with collecting(jsonl, prom, interval=60):
+        books = list(get_books_from_directory(BOOKS_DIR))
+        assert list(get_books_from_directory(tmp_path)) == []
+    assert metrics.METRICS is None
+
+    [line] = read_lines(jsonl)
+    assert line["final"]
+    assert line["files_scanned"] == len(list(BOOKS_DIR.iterdir())) + 1
+    assert line["files_failed"] == 1
+    assert line["files_parsed"] == line["files_scanned"] - 1
+    assert line["bytes_read"] > sum(map(len, read_books(BOOKS_DIR))) / 100
+    assert line["histograms"]["parse_seconds"]["count"] == line["files_scanned"]
+    assert len(books) == len(list(read_books(BOOKS_DIR)))
+
+    text = prom.read_text()
+    assert f"digger_files_parsed_total {line['files_parsed']}\n" in text
+    assert 'digger_parse_seconds_bucket{le="+Inf"} ' in text
+    assert "digger_running 0\n" in text
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_collecting__one_book(tmp_path):
+    jsonl = tmp_path / "ingest.jsonl"
+    book = next(BOOKS_DIR.glob("*.fb2"))
+    with collecting(jsonl_path=jsonl):
+        assert len(find_books(book_path=book)) == 1
+
+    [line] = read_lines(jsonl)
+    assert line["files_scanned"] == line["files_parsed"] == 1
+    assert line["bytes_read"] == book.stat().st_size
+
+
+def test_collecting__live_metrics(tmp_path):
+    jsonl = tmp_path / "ingest.jsonl"
+    with collecting(jsonl_path=jsonl, interval=0.05):
+        sleep(0.3)
+    lines = read_lines(jsonl)
+    assert len(lines) > 2
+    assert not lines[0]["final"]
+    assert lines[-1]["final"]
+
+
+@patch("db.services.create_all_books", return_value=(2, 1))
+@patch("db.services.create_all_authors", return_value={})
+def test_save_batch__counts_books(mock_authors, mock_books):
+    with collecting(jsonl_path="/dev/null") as collected:
+        save_batch(Mock(), [{}] * 5, True, Mock())
+        snapshot = collected.snapshot()
+    assert snapshot["books_created"] == 2
+    assert snapshot["books_updated"] == 1
+    assert snapshot["books_skipped"] == 2
+    assert snapshot["histograms"]["db_batch_seconds"]["count"] == 1
+
+
+def test_prometheus_text__counters_and_histograms():
+    ingest = IngestMetrics()
+    ingest.count("files_scanned", 3)
+    ingest.observe("db_commit_seconds", 0.02)
+    text = prometheus_text(ingest.snapshot())
+    assert "# TYPE digger_files_scanned_total counter\n" in text
+    assert "digger_files_scanned_total 3\n" in text
+    assert 'digger_db_commit_seconds_bucket{le="0.01"} 0\n' in text
+    assert 'digger_db_commit_seconds_bucket{le="0.025"} 1\n' in text
+    assert "digger_db_commit_seconds_count 1\n" in text
+    assert "digger_running 1\n" in text
@@ -1,10 +1,23 @@
-from unittest.mock import call, patch
+import gzip
+from itertools import chain
+from unittest.mock import Mock, call, patch
+from zipfile import ZipFile
 
+import pytest
+
+from src.services.file_extraction import get_files_from_dir
 from src.services.parse_book_from_file import (
+    ArchivePart,
     find_books,
     get_books_from_directory,
     get_books_from_file,
+    get_books_from_part,
+    get_tasks,
+    should_parse,
+    split_archive,
 )
+from src.services.progress import IngestProgress, walk_matches
+from tests.helpers import BOOKS_DIR, read_books
 
 
 @patch(
@@ -14,7 +27,7 @@ from src.services.parse_book_from_file import (
 def test_find_books__dir_path(mock):
     dir_path = "/path/to/dir/"
     result = find_books(dir_path=dir_path)
-    mock.assert_called_once_with(dir_path)
+    mock.assert_called_once_with(dir_path, "defusedxml", None, None, None)
     assert result == [{"name": "Book1"}]
 
 
@@ -25,7 +38,7 @@ def test_find_books__dir_path(mock):
 def test_find_books__by_book_path(mock):
     book_path = "/path/to/file"
     result = find_books(book_path=book_path)
-    mock.assert_called_once_with(book_path)
+    mock.assert_called_once_with(book_path, "defusedxml")
     assert result == [{"name": "Book1"}]
 
 
@@ -34,17 +47,24 @@ def test_get_books_from_file__without_extension(mock_parser):
     mock_parser.return_value.as_dict = {"name": "Book1"}
     book_path = "/path/to/file"
     result = get_books_from_file(book_path)
-    mock_parser.assert_called_once_with(filename=book_path)
+    mock_parser.assert_called_once_with(
+        filename=book_path, header_only=True, backend="defusedxml"
+    )
     assert result == [{"name": "Book1"}]
 
 
 @patch("src.services.parse_book_from_file.FB2Parser")
-@patch("src.services.parse_book_from_file.gzip_extraction", return_value="file_content")
+@patch("src.services.parse_book_from_file.gzip_extraction")
 def test_get_books_from_file__with_extension_gz(mock_gzip, mock_parser):
     mock_parser.return_value.as_dict = {"name": "Book1"}
+    book = mock_gzip.return_value.__enter__.return_value
     book_path = "/path/to/file.gz"
     result = get_books_from_file(book_path)
-    mock_parser.assert_called_once_with(text="file_content")
+    mock_gzip.assert_called_once_with(book_path)
+    mock_parser.assert_called_once_with(
+        filename=book, header_only=True, backend="defusedxml"
+    )
+    mock_gzip.return_value.__exit__.assert_called_once()
     assert result == [{"name": "Book1"}]
 
 
@@ -56,7 +76,9 @@ def test_get_books_from_file__with_extension_zip(mock_zip, mock_parser):
     mock_parser.return_value.as_dict = {"name": "Book1"}
     book_path = "/path/to/file.zip"
     result = get_books_from_file(book_path)
-    mock_parser.assert_called_once_with(text="file_content")
+    mock_parser.assert_called_once_with(
+        filename="file_content", header_only=True, backend="defusedxml"
+    )
     assert result == [{"name": "Book1"}]
 
 
@@ -72,32 +94,225 @@ def test_get_books_from_file__with_extension_zip__returns_2_file_in_zip(
     book_path = "/path/to/file.zip"
     result = get_books_from_file(book_path)
     calls = mock_parser.call_args_list
-    assert calls == [call(text="file_content1"), call(text="file_content2")]
+    assert calls == [
+        call(filename="file_content1", header_only=True, backend="defusedxml"),
+        call(filename="file_content2", header_only=True, backend="defusedxml"),
+    ]
     assert result == [{"name": "Book1"}, {"name": "Book1"}]
 
 
-@patch("multiprocessing.pool.Pool.map", return_value=[[{"name": "Book1"}]])
+@patch(
+    "multiprocessing.pool.Pool.imap_unordered",
+    return_value=[((0, 0), [{"name": "Book1"}])],
+)
 def test_get_books_from_directory__works(mock):
     dir_path = "/path/to/dir/"
     result = get_books_from_directory(dir_path)
-    assert result == [{"name": "Book1"}]
+    assert list(result) == [{"name": "Book1"}]
 
 
 @patch(
-    "multiprocessing.pool.Pool.map",
-    return_value=[[{"name": "Book1"}], [{"name": "Book1"}]],
+    "multiprocessing.pool.Pool.imap_unordered",
+    return_value=[((0, 0), [{"name": "Book1"}]), ((1, 0), [{"name": "Book1"}])],
 )
 def test_get_books_from_directory__works_with_2_file(mock):
     dir_path = "/path/to/dir/"
     result = get_books_from_directory(dir_path)
-    assert result == [{"name": "Book1"}, {"name": "Book1"}]
+    assert list(result) == [{"name": "Book1"}, {"name": "Book1"}]
 
 
 @patch(
-    "multiprocessing.pool.Pool.map",
-    return_value=[[{"name": "Book1"}], [{"name": "Book1"}]],
+    "multiprocessing.pool.Pool.imap_unordered",
+    return_value=[((0, 0), [{"name": "Book1"}, {"name": "Book2"}])],
 )
 def test_get_books_from_directory__works_if_get_books_from_file_return_2_books(mock):
     dir_path = "/path/to/dir/"
     result = get_books_from_directory(dir_path)
-    assert result == [{"name": "Book1"}, {"name": "Book1"}]
+    assert list(result) == [{"name": "Book1"}, {"name": "Book2"}]
+
+
+@patch(
+    "multiprocessing.pool.Pool.imap_unordered",
+    return_value=[((0, 0), None), ((1, 0), [{"name": "Book1"}])],
+)
+def test_get_books_from_directory__skips_file_with_parse_error(mock):
+    dir_path = "/path/to/dir/"
+    result = get_books_from_directory(dir_path)
+    assert list(result) == [{"name": "Book1"}]
+
+
+def test_get_books_from_directory__yields_all_books_from_dir():
+    books = list(get_books_from_directory(BOOKS_DIR))
+    expected = chain(*map(get_books_from_file, sorted(get_files_from_dir(BOOKS_DIR))))
+    assert sorted(books, key=str) == sorted(expected, key=str)
+
+
+@patch("os.cpu_count", return_value=2)
+def test_get_books_from_directory__by_spawned_processes(mock_cpu_count):
+    books = list(get_books_from_directory(BOOKS_DIR, start_method="spawn"))
+    assert sorted(books, key=str) == sorted(
+        get_books_from_directory(BOOKS_DIR), key=str
+    )
+
+
+@patch("os.cpu_count", return_value=1)
+@patch("src.services.parse_book_from_file.FILES_IN_FLIGHT", 1)
+@patch("src.services.parse_book_from_file.CHUNK_SIZE", 1)
+def test_get_books_from_directory__stops_if_consumer_stops(mock_cpu_count):
+    books = get_books_from_directory(BOOKS_DIR)
+    assert next(books)
+    books.close()
+
+
+@pytest.fixture()
+def big_archive(tmp_path):
+    archive = tmp_path / "books.zip"
+    with ZipFile(archive, "w") as zip_obj:
+        for number, text in enumerate(read_books(BOOKS_DIR)):
+            zip_obj.writestr(f"{number}.fb2", text)
+    return str(archive)
+
+
+@patch("src.services.parse_book_from_file.ARCHIVE_PART_SIZE", 4)
+@patch("src.services.parse_book_from_file.ARCHIVE_SPLIT_SIZE", 0)
+def test_split_archive__splits_big_archive_into_parts(big_archive):
+    with ZipFile(big_archive) as zip_obj:
+        members = zip_obj.namelist()
+    parts = split_archive(big_archive)
+    assert all(isinstance(part, ArchivePart) for part in parts)
+    assert all(len(part.members) <= 4 for part in parts)
+    assert list(chain(*(part.members for part in parts))) == members
+    assert {part.path for part in parts} == {big_archive}
+
+
+@pytest.mark.parametrize("file", ["BIG_ARCHIVE", "/path/to/file.fb2"])
+def test_split_archive__keeps_small_files(big_archive, file):
+    file = big_archive if file == "BIG_ARCHIVE" else file
+    assert split_archive(file) == [file]
+
+
+def test_get_books_from_part__adds_state_of_archive(big_archive):
+    part = ArchivePart(big_archive, ("1.fb2", "0.fb2"), {"path": big_archive})
+    books = get_books_from_part(part)
+    assert [book.pop("file") for book in books] == [
+        {"path": big_archive, "member": "1.fb2"},
+        {"path": big_archive, "member": "0.fb2"},
+    ]
+    assert books == get_books_from_file(big_archive)[1::-1]
+
+
+@patch("src.services.parse_book_from_file.ARCHIVE_PART_SIZE", 4)
+@patch("src.services.parse_book_from_file.ARCHIVE_SPLIT_SIZE", 0)
+def test_find_books__splits_big_archive(big_archive):
+    with patch("src.services.parse_book_from_file.ARCHIVE_SPLIT_SIZE", 2 ** 40):
+        expected = find_books(book_path=big_archive)
+    books = find_books(book_path=big_archive)
+    assert sorted(books, key=str) == sorted(expected, key=str)
+
+
+@patch("src.services.parse_book_from_file.ARCHIVE_PART_SIZE", 4)
+@patch("src.services.parse_book_from_file.ARCHIVE_SPLIT_SIZE", 0)
+def test_get_books_from_directory__splits_big_archives(big_archive):
+    books = list(get_books_from_directory(BOOKS_DIR))
+    expected = chain(*map(get_books_from_file, sorted(get_files_from_dir(BOOKS_DIR))))
+    assert sorted(books, key=str) == sorted(expected, key=str)
+
+
+@pytest.mark.parametrize("name", ["book.fb2", "book.fb2.gz", "book.zip"])
+def test_get_books_from_file__legacy_encoding(tmp_path, name):
+    text = """<?xml version="1.0" encoding="windows-1251"?>
+<FictionBook><description><title-info><book-title>Книга</book-title>
+</title-info></description><body><p>Текст</p></body></FictionBook>"""
+    data = text.encode("windows-1251")
+    book_path = tmp_path / name
+    if name.endswith(".gz"):
+        book_path.write_bytes(gzip.compress(data))
+    elif name.endswith(".zip"):
+        with ZipFile(book_path, "w") as zip_obj:
+            zip_obj.writestr("book.fb2", data)
+    else:
+        book_path.write_bytes(data)
+    assert [book["name"] for book in get_books_from_file(book_path)] == ["Книга"]
+
+
+@patch("src.services.parse_book_from_file.ARCHIVE_PART_SIZE", 4)
+@patch("src.services.parse_book_from_file.ARCHIVE_SPLIT_SIZE", 0)
+def test_get_tasks__keys_files_and_parts_in_walk_order(big_archive):
+    progress = IngestProgress()
+    tasks = get_tasks(["/path/to/file.fb2", big_archive], progress)
+    assert next(tasks) == ((0, 0), "/path/to/file.fb2")
+    assert progress.watermark == (0, 0)
+    progress.finish((0, 0))
+    assert progress.watermark == (1, 0)
+    keys = [key for key, _ in tasks]
+    assert keys == [(1, part) for part in range(len(keys))]
+    progress.finish((1, 1))
+    assert progress.watermark == (1, 0)
+    for key in keys:
+        progress.finish(key)
+    assert progress.watermark == (2, 0)
+
+
+@patch("src.services.parse_book_from_file.ARCHIVE_PART_SIZE", 4)
+@patch("src.services.parse_book_from_file.ARCHIVE_SPLIT_SIZE", 0)
+def test_get_tasks__skips_tasks_done_by_resumed_run(big_archive):
+    files = ["/path/to/file.fb2", big_archive, "/path/to/next.fb2"]
+    progress = IngestProgress((1, 2))
+    keys = [key for key, _ in get_tasks(files, progress)]
+    assert keys[0] == (1, 2)
+    assert keys[-1] == (2, 0)
+    assert (0, 0) not in keys
+    assert (1, 1) not in keys
+
+
+@patch("src.services.parse_book_from_file.ARCHIVE_PART_SIZE", 4)
+@patch("src.services.parse_book_from_file.ARCHIVE_SPLIT_SIZE", 0)
+def test_ingest_progress__checkpoint_path_of_last_done_task(big_archive):
+    files = ["/path/to/file.fb2", big_archive, "/path/to/next.fb2"]
+    progress = IngestProgress()
+    tasks = get_tasks(files, progress)
+    assert progress.checkpoint == ((0, 0), None)
+    keys = [key for key, _ in tasks]
+    progress.finish((0, 0))
+    assert progress.checkpoint == ((1, 0), "/path/to/file.fb2")
+    progress.finish((1, 0))
+    assert progress.checkpoint == ((1, 1), str(big_archive))
+    for key in keys:
+        progress.finish(key)
+    assert progress.checkpoint == ((3, 0), "/path/to/next.fb2")
+    assert not progress.paths
+
+
+def test_walk_matches__files_added_or_removed_before_checkpoint():
+    files = ["/a.fb2", "/b.zip", "/c.fb2"]
+    assert walk_matches(files, (0, 0), None)
+    assert walk_matches(files, (1, 3), "/b.zip")
+    assert walk_matches(files, (2, 0), "/b.zip")
+    assert not walk_matches(["/new.fb2", *files], (2, 0), "/b.zip")
+    assert not walk_matches(files[1:], (2, 0), "/b.zip")
+    assert not walk_matches(files, (2, 0), None)
+
+
+def test_should_parse__first_unfinished_file_of_resumed_run():
+    scan = Mock()
+    progress = IngestProgress((1, 0))
+    assert not should_parse(0, "/done.fb2", progress, scan)
+    assert should_parse(1, "/unfinished.fb2", progress, scan)
+    scan.changed.return_value = False
+    assert not should_parse(2, "/unchanged.fb2", progress, scan)
+    assert scan.forget.call_args_list == [call("/done.fb2"), call("/unfinished.fb2")]
+    scan.changed.assert_called_once_with("/unchanged.fb2")
+
+
+def test_get_books_from_directory__resumed_run_parses_rest_of_files():
+    files = sorted(get_files_from_dir(BOOKS_DIR))
+    books = list(get_books_from_directory(BOOKS_DIR, progress=IngestProgress((3, 0))))
+    expected = chain(*map(get_books_from_file, files[3:]))
+    assert sorted(books, key=str) == sorted(expected, key=str)
+
+
+def test_get_books_from_directory__finishes_tasks_of_handed_over_books():
+    progress = IngestProgress()
+    books = list(get_books_from_directory(BOOKS_DIR, progress=progress))
+    assert books
+    assert progress.watermark == (len(list(get_files_from_dir(BOOKS_DIR))), 0)
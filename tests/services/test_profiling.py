@@ -0,0 +1,65 @@
+import gzip
+import json
+import pstats
+from time import sleep
+
+from services import profiling
+from services.file_extraction import gzip_extraction
+from services.parse_book_from_file import get_books_from_directory
+from services.profiling import StageTimes, stage, timed_iter
+from tests.helpers import BOOKS_DIR, read_books
+
+
+def test_stage_times__nested_stage_counted_once():
+    times = StageTimes()
+    with times.stage("parse"):
+        with times.stage("extract"):
+            sleep(0.05)
+    result = times.as_dict()
+    assert result["extract"]["wall_s"] >= 0.05
+    assert result["parse"]["wall_s"] < 0.05
+    assert result["parse"]["calls"] == 1
+
+
+def test_stage__not_profiled():
+    assert profiling.PROFILER is None
+    with stage("parse"):
+        pass
+    assert list(timed_iter("scan", [1, 2, 3])) == [1, 2, 3]
+
+
+def test_profiling__without_path(tmp_path):
+    with profiling.profiling(None):
+        assert profiling.PROFILER is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_profiling__timed_iter_and_stream(tmp_path):
+    path = tmp_path / "test.prof"
+    gzip_file = tmp_path / "book.fb2.gz"
+    gzip_file.write_bytes(gzip.compress(b"text"))
+    with profiling.profiling(path):
+        assert list(timed_iter("scan", [1, 2, 3])) == [1, 2, 3]
+        with gzip_extraction(gzip_file) as file:
+            assert file.read() == b"text"
+    assert profiling.PROFILER is None
+
+    stages = json.loads((tmp_path / "test.prof.stages.json").read_text())
+    assert stages["processes"] == 1
+    assert stages["stages"]["scan"]["calls"] == 4
+    assert stages["stages"]["extract"]["calls"] == 1
+
+
+def test_profiling__pool_workers(tmp_path):
+    path = tmp_path / "digger.prof"
+    with profiling.profiling(path):
+        books = list(get_books_from_directory(BOOKS_DIR))
+    assert len(books) == len(list(read_books(BOOKS_DIR)))
+
+    stages = json.loads((tmp_path / "digger.prof.stages.json").read_text())
+    assert stages["processes"] > 1
+    assert list(stages["stages"]) == ["scan", "extract", "parse", "transfer", "wait"]
+    functions = {function for _, _, function in pstats.Stats(str(path)).stats}
+    # parse_task runs in pool workers only
+    assert "parse_task" in functions
+    assert "get_books_in_pool" in functions
@@ -0,0 +1,73 @@
+import json
+import logging
+
+from src.services.result_cache import ResultCache, caching, load_cache, save_cache
+
+
+def test_result_cache__drops_least_recently_used():
+    cache = ResultCache(max_size=2)
+    cache.put("a", 1, [1])
+    cache.put("b", 1, [2])
+    assert cache.get("a", 1) == [1]
+    cache.put("c", 1, [3])
+    assert list(cache.results) == ["a", "c"]
+    assert cache.get("b", 1) is None
+
+
+def test_result_cache__new_generation_drops_all_results():
+    cache = ResultCache()
+    cache.put("a", 1, [1])
+    assert cache.get("a", 2) is None
+    assert cache.results == {}
+    assert cache.generation == 2
+
+
+def test_result_cache__result_of_older_generation_is_not_cached():
+    cache = ResultCache()
+    cache.get("a", 2)
+    cache.put("a", 1, [1])
+    assert cache.get("a", 2) is None
+    assert cache.stats()["misses"] == 2
+
+
+def test_save_cache__and_load_cache(tmp_path):
+    path = tmp_path / "cache.json"
+    cache = ResultCache()
+    cache.put("a", 3, [{"name": "Книга"}])
+    cache.put("b", 3, [1])
+    cache.get("a", 3)
+    save_cache(cache, path)
+
+    loaded = load_cache(path, max_size=1)
+    assert loaded.stats() == {
+        "hits": 1,
+        "misses": 0,
+        "hit_ratio": 1.0,
+        "results": 1,
+        "generation": 3,
+    }
+    assert loaded.get("a", 3) == [{"name": "Книга"}]
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_load_cache__without_file_or_broken_file(tmp_path):
+    path = tmp_path / "cache.json"
+    assert load_cache(path).stats()["generation"] is None
+    path.write_text("{")
+    assert load_cache(path).results == {}
+
+
+def test_caching__saves_cache_between_runs(tmp_path, caplog):
+    path = tmp_path / "cache.json"
+    with caching(None) as cache:
+        assert cache is None
+    assert not path.exists()
+
+    with caplog.at_level(logging.INFO):
+        with caching(path) as cache:
+            assert cache.get("a", 1) is None
+            cache.put("a", 1, [1])
+        with caching(path) as cache:
+            assert cache.get("a", 1) == [1]
+    assert json.loads(path.read_text())["hits"] == 1
+    assert "Result cache: 1 hits, 1 misses, hit ratio 0.50, 1 results" in caplog.text
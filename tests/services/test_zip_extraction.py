@@ -33,10 +33,22 @@ def test_zip_extraction__but_file_path_not_exists():
 def test_zip_extraction__zip_object_has_3_files_in_it(create_zip_dir_with_file):
     data = ["file1", "file2", "file3"]
     zip_file = create_zip_dir_with_file(data)
-    assert list(zip_extraction(zip_file)) == ["file1", "file2", "file3"]
+    assert [file.read() for file in zip_extraction(zip_file)] == [
+        b"file1",
+        b"file2",
+        b"file3",
+    ]
 
 
 def test_zip_extraction__zip_object_has_1_files_in_it(create_zip_dir_with_file):
     data = ["file1"]
     zip_file = create_zip_dir_with_file(data)
-    assert list(zip_extraction(zip_file)) == ["file1"]
+    assert [file.read() for file in zip_extraction(zip_file)] == [b"file1"]
+
+
+def test_zip_extraction__reads_only_members(create_zip_dir_with_file):
+    zip_file = create_zip_dir_with_file(["file1", "file2", "file3"])
+    with ZipFile(zip_file) as zip_obj:
+        members = zip_obj.namelist()
+    books = zip_extraction(zip_file, members[:0:-1])
+    assert [file.read() for file in books] == [b"file3", b"file2"]